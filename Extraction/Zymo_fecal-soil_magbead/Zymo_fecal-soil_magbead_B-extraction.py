@@ -1,8 +1,8 @@
 from opentrons import protocol_api
-from opentrons_functions.magbeads import (
-    remove_supernatant, bead_wash)
-from opentrons_functions.transfer import add_buffer
-
+from moeller_functions.magbeads import (ColumnOrder, MagnetState, bead_wash,
+                                        mix_for, remove_supernatant)
+from moeller_functions.timing import Incubation
+from moeller_functions.transfer import add_buffer
 
 metadata = {'apiLevel': '2.5',
             'author': 'Jon Sanders'}
@@ -50,9 +50,29 @@ w2_cols = ['A4', 'A5', 'A6', 'A7', 'A8', 'A9',
 # bead aspiration flow rate
 bead_flow = .25
 
+# supernatant flow rate while the tip is well above the pellet. Only the
+# final chunk of each removal, taken at the bottom offset, runs at
+# bead_flow.
+super_fast_flow = .5
+
 # wash mix mutliplier
 wash_mix = 5
 
+# supernatant removed from each well, µL: the binding mix, the MagBinding
+# buffer wash, the Wash 1 wash, the first Wash 2 wash, and the last Wash 2
+# before drying
+bind_super_vol = 800
+mbw_super_vol = 500
+w1_super_vol = 500
+w2_super_vol = 900
+dry_super_vol = 1000
+
+# order in which the bead helpers visit columns: 'plate' keeps the order of
+# `cols`; 'serpentine' reverses direction on alternate passes, so each pass
+# starts where the last one ended; 'nearest' removes supernatant from the
+# columns closest to the waste first
+col_order = 'plate'
+
 
 def run(protocol: protocol_api.ProtocolContext):
 
@@ -61,7 +81,7 @@ def run(protocol: protocol_api.ProtocolContext):
     # define deck positions and labware
 
     # define hardware modules
-    magblock = protocol.load_module('Magnetic Module', 10)
+    magblock = MagnetState(protocol.load_module('Magnetic Module', 10))
     magblock.disengage()
 
     # tips
@@ -93,6 +113,9 @@ def run(protocol: protocol_api.ProtocolContext):
                                             'left',
                                             tip_racks=[tiprack_buffers])
 
+    # column visit order for the bead helpers
+    order = ColumnOrder(col_order)
+
     # MagBindingBuffer + beads wells
     mbb_wells = [reagents[x] for x in mbb_cols]
 
@@ -121,30 +144,33 @@ def run(protocol: protocol_api.ProtocolContext):
                                           18000/8,
                                           pre_mix=10)
 
-    # mix beads and samples
+    # mix beads and samples; binding starts as each column is mixed
+    bind = Incubation(protocol, pause_bind)
     for col in cols:
         pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
         pipette_left.mix(10, 250, mag_plate[col].bottom(z=1))
+        bind.start()
         pipette_left.blow_out(mag_plate[col].top(z=-2))
         pipette_left.touch_tip()
         pipette_left.return_tip()
 
     # bind to beads
     protocol.comment('Binding DNA to beads.')
-    protocol.delay(seconds=pause_bind)
 
-    # mix again
-    for col in cols:
-        pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
-        pipette_left.mix(10, 250, mag_plate[col].bottom(z=1))
-        pipette_left.blow_out(mag_plate[col].top(z=-2))
-        pipette_left.touch_tip()
-        pipette_left.return_tip()
+    # keep mixing while the DNA binds
+    mix_for(bind,
+            pipette_left,
+            mag_plate,
+            cols,
+            tiprack_wash,
+            n=10,
+            mix_vol=250,
+            blow_out_z=-2,
+            order=order)
 
     # bind to magnet
     protocol.comment('Binding beads to magnet.')
     magblock.engage(height_from_base=mag_engage_height)
-
     protocol.delay(seconds=pause_mag)
 
     # ### Do first wash: Wash 500 µL MagBinding buffer
@@ -166,10 +192,14 @@ def run(protocol: protocol_api.ProtocolContext):
                                          tiprack_wash,
                                          # optional arguments
                                          wash_vol=500,
-                                         super_vol=800,
+                                         super_vol=bind_super_vol,
                                          drop_super_tip=False,
                                          mix_n=wash_mix,
-                                         mag_engage_height=mag_engage_height)
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
     # ### Do second wash: Wash 500 µL MagWash 1
     protocol.comment('Doing wash #2.')
@@ -190,11 +220,15 @@ def run(protocol: protocol_api.ProtocolContext):
                                        tiprack_wash,
                                        # optional arguments,
                                        wash_vol=500,
-                                       super_vol=500,
+                                       super_vol=mbw_super_vol,
                                        drop_super_tip=False,
                                        mix_n=wash_mix,
                                        remaining=None,
-                                       mag_engage_height=mag_engage_height)
+                                       rate=bead_flow,
+                                       fast_rate=super_fast_flow,
+                                       mag_engage_height=mag_engage_height,
+                                       pause_s=pause_mag,
+                                       order=order)
 
     # ### Do third wash: Wash 900 µL MagWash 2
     protocol.comment('Doing wash #3.')
@@ -215,11 +249,15 @@ def run(protocol: protocol_api.ProtocolContext):
                                        tiprack_wash,
                                        # optional arguments,
                                        wash_vol=900,
-                                       super_vol=500,
+                                       super_vol=w1_super_vol,
                                        drop_super_tip=False,
                                        mix_n=wash_mix,
                                        remaining=None,
-                                       mag_engage_height=mag_engage_height)
+                                       rate=bead_flow,
+                                       fast_rate=super_fast_flow,
+                                       mag_engage_height=mag_engage_height,
+                                       pause_s=pause_mag,
+                                       order=order)
 
     # ### Do fourth wash: Wash 900 µL MagWash 2
     protocol.comment('Doing wash #4.')
@@ -240,11 +278,15 @@ def run(protocol: protocol_api.ProtocolContext):
                                        tiprack_wash,
                                        # optional arguments,
                                        wash_vol=900,
-                                       super_vol=900,
+                                       super_vol=w2_super_vol,
                                        drop_super_tip=False,
                                        mix_n=wash_mix,
                                        remaining=w2_remaining,
-                                       mag_engage_height=mag_engage_height)
+                                       rate=bead_flow,
+                                       fast_rate=super_fast_flow,
+                                       mag_engage_height=mag_engage_height,
+                                       pause_s=pause_mag,
+                                       order=order)
 
     # ### Dry
     protocol.comment('Removing wash and drying beads.')
@@ -257,14 +299,16 @@ def run(protocol: protocol_api.ProtocolContext):
     # - trash tip
     # - leave magnet engaged
 
-    # remove supernatant
+    # remove supernatant; elution buffer goes in in the same column order
+    dry_order = order(cols, mag_plate, waste['A1'].top())
     remove_supernatant(pipette_left,
                        mag_plate,
-                       cols,
+                       dry_order,
                        tiprack_wash,
                        waste['A1'],
-                       super_vol=1000,
+                       super_vol=dry_super_vol,
                        rate=bead_flow,
+                       fast_rate=super_fast_flow,
                        bottom_offset=.5,
                        drop_tip=True)
 
@@ -294,40 +338,36 @@ def run(protocol: protocol_api.ProtocolContext):
     magblock.disengage()
 
     # add elution buffer and mix
-    for col in cols:
+    elute = Incubation(protocol, pause_elute)
+    for col in dry_order:
         pipette_left.pick_up_tip(tiprack_elution_1.wells_by_name()[col])
         pipette_left.aspirate(50, reagents['A8'], rate=1)
         pipette_left.dispense(50, mag_plate[col].bottom(z=1))
         pipette_left.mix(10, 40, mag_plate[col].bottom(z=1))
+        elute.start()
         pipette_left.blow_out(mag_plate[col].top())
         pipette_left.touch_tip()
         # we'll use these same tips for final transfer
         pipette_left.return_tip()
 
-    protocol.delay(seconds=pause_elute)
-    # # start timer
-    # t0 = clock()
-    # # mix again
-    # t_mix = 0
-    # while t_mix < pause_elute():
-    for col in cols:
-        pipette_left.pick_up_tip(tiprack_elution_1.wells_by_name()[col])
-        pipette_left.mix(10, 40, mag_plate[col].bottom(z=1))
-        pipette_left.blow_out(mag_plate[col].top())
-        pipette_left.touch_tip()
-        # we'll use these same tips for final transfer
-        pipette_left.return_tip()
-        # t_mix = clock() - t0
+    # keep mixing while the elution incubates
+    mix_for(elute,
+            pipette_left,
+            mag_plate,
+            cols,
+            tiprack_elution_1,
+            n=10,
+            mix_vol=40,
+            order=order)
 
     # bind to magnet
     protocol.comment('Binding beads to magnet.')
 
     magblock.engage(height_from_base=mag_engage_height)
-
     protocol.delay(seconds=pause_mag)
 
     protocol.comment('Transferring eluted DNA to final plate.')
-    for col in cols:
+    for col in order(cols, mag_plate):
         pipette_left.pick_up_tip(tiprack_elution_2.wells_by_name()[col])
         pipette_left.aspirate(50,
                               mag_plate[col].bottom(z=2),
@@ -1,7 +1,8 @@
 from opentrons import protocol_api
-from opentrons_functions.magbeads import (
-    remove_supernatant, bead_wash)
-from opentrons_functions.transfer import add_buffer
+from moeller_functions.magbeads import (ColumnOrder, MagnetState, bead_wash,
+                                        mix_for, remove_supernatant)
+from moeller_functions.timing import Incubation
+from moeller_functions.transfer import LiquidLevel, add_buffer
 
 metadata = {'apiLevel': '2.5',
             'author': 'Jon Sanders'}
@@ -29,6 +30,10 @@ else:
 # Define minimum tip height for beadbeating tubes
 min_height = 16
 
+# lysis buffer added to each beadbeating tube, µL. Lysate is taken from
+# below the surface this leaves, never lower than `min_height`
+lysis_vol = 580
+
 # define magnet engagement height for plates
 mag_engage_height = 6
 
@@ -44,9 +49,27 @@ lys_cols = ['A1', 'A2', 'A3', 'A4']
 # bead aspiration flow rate
 bead_flow = .25
 
+# supernatant flow rate while the tip is well above the pellet. Only the
+# final chunk of each removal, taken at the bottom offset, runs at
+# bead_flow.
+super_fast_flow = .5
+
 # wash mix mutliplier
 wash_mix = 10
 
+# supernatant removed from each well, µL: the binding mix, the isopropanol
+# wash, the first ethanol wash, and the last ethanol before drying
+bind_super_vol = 700
+ipa_super_vol = 300
+eth_super_vol = 300
+dry_super_vol = 380
+
+# order in which the bead helpers visit columns: 'plate' keeps the order of
+# `cols`; 'serpentine' reverses direction on alternate passes, so each pass
+# starts where the last one ended; 'nearest' removes supernatant from the
+# columns closest to the waste first
+col_order = 'plate'
+
 
 def run(protocol: protocol_api.ProtocolContext):
 
@@ -85,7 +108,7 @@ def run(protocol: protocol_api.ProtocolContext):
     # define deck positions and labware
 
     # define hardware modules
-    magblock = protocol.load_module('Magnetic Module', 10)
+    magblock = MagnetState(protocol.load_module('Magnetic Module', 10))
     magblock.disengage()
 
     # tips
@@ -118,6 +141,9 @@ def run(protocol: protocol_api.ProtocolContext):
                                             'left',
                                             tip_racks=[tiprack_buffers])
 
+    # column visit order for the bead helpers
+    order = ColumnOrder(col_order)
+
     # Lysis buffer wells
     lys_wells = [wash_buffers[x] for x in lys_cols]
 
@@ -136,7 +162,7 @@ def run(protocol: protocol_api.ProtocolContext):
                lys_wells,
                lysate,
                cols,
-               580,
+               lysis_vol,
                18000/8)
 
     # ### Prompt user to remove plate
@@ -212,11 +238,17 @@ def run(protocol: protocol_api.ProtocolContext):
 
     protocol.comment('Transferring lysate to wash plate.')
 
+    # binding starts as soon as each column's lysate is mixed in
+    bind = Incubation(protocol, pause_bind)
     for col in cols:
+        # the beads sit below `min_height`, so the surface we follow is
+        # lower than the real one and the tip stays under it
+        level = LiquidLevel(lysate[col], lysis_vol)
+
         # do first transfer.
         pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
         pipette_left.aspirate(180,
-                              lysate[col].bottom(z=min_height+5),
+                              level.aspirate(180, floor=min_height),
                               rate=0.25)
         pipette_left.air_gap(10)
         pipette_left.dispense(190, mag_plate[col].top(z=-5))
@@ -225,32 +257,34 @@ def run(protocol: protocol_api.ProtocolContext):
 
         # do second transfer.
         pipette_left.aspirate(180,
-                              lysate[col].bottom(z=min_height),
+                              level.aspirate(180, floor=min_height),
                               rate=0.25)
         pipette_left.air_gap(10)
         pipette_left.dispense(190, mag_plate[col].top(z=-5))
         pipette_left.blow_out()
         pipette_left.touch_tip(v_offset=-1)
         pipette_left.mix(5, 250, mag_plate[col].bottom(z=1))
+        bind.start()
         pipette_left.blow_out(mag_plate[col].top(z=-2))
         pipette_left.return_tip()
 
     # bind
     protocol.comment('Binding DNA to beads.')
-    protocol.delay(seconds=pause_bind)
 
-    # mix
-    for col in cols:
-        pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
-        pipette_left.mix(5, 250, mag_plate[col].bottom(z=1))
-        pipette_left.blow_out(mag_plate[col].top(z=-2))
-        pipette_left.touch_tip()
-        pipette_left.return_tip()
+    # keep mixing while the DNA binds
+    mix_for(bind,
+            pipette_left,
+            mag_plate,
+            cols,
+            tiprack_wash,
+            n=5,
+            mix_vol=250,
+            blow_out_z=-2,
+            order=order)
 
     # bind for specified length of time
     protocol.comment('Binding beads to magnet.')
     magblock.engage(height_from_base=mag_engage_height)
-
     protocol.delay(seconds=pause_mag)
 
     # ### Do first wash
@@ -271,12 +305,16 @@ def run(protocol: protocol_api.ProtocolContext):
                                          # mix arguments
                                          tiprack_wash,
                                          # optional arguments
-                                         super_vol=700,
+                                         super_vol=bind_super_vol,
                                          drop_super_tip=False,
                                          mix_n=wash_mix,
                                          mix_vol=250,
                                          remaining=ipa_remaining,
-                                         mag_engage_height=mag_engage_height)
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
     # ### Do second wash
     protocol.comment('Doing wash #2.')
@@ -296,12 +334,16 @@ def run(protocol: protocol_api.ProtocolContext):
                                          # mix arguments
                                          tiprack_wash,
                                          # optional arguments,
-                                         super_vol=300,
+                                         super_vol=ipa_super_vol,
                                          drop_super_tip=False,
                                          mix_n=wash_mix,
                                          mix_vol=250,
                                          remaining=None,
-                                         mag_engage_height=mag_engage_height)
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
     # ### Do third wash
     protocol.comment('Doing wash #3.')
@@ -321,12 +363,16 @@ def run(protocol: protocol_api.ProtocolContext):
                                          # mix arguments
                                          tiprack_wash,
                                          # optional arguments,
-                                         super_vol=300,
+                                         super_vol=eth_super_vol,
                                          drop_super_tip=False,
                                          mix_n=wash_mix,
                                          mix_vol=250,
                                          remaining=eth_remaining,
-                                         mag_engage_height=mag_engage_height)
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
     # ### Dry
     protocol.comment('Removing wash and drying beads.')
@@ -339,14 +385,16 @@ def run(protocol: protocol_api.ProtocolContext):
     # - trash tip
     # - leave magnet engaged
 
-    # remove supernatant
+    # remove supernatant; elution buffer goes in in the same column order
+    dry_order = order(cols, mag_plate, waste['A1'].top())
     remove_supernatant(pipette_left,
                        mag_plate,
-                       cols,
+                       dry_order,
                        tiprack_wash,
                        waste['A1'],
-                       super_vol=380,
+                       super_vol=dry_super_vol,
                        rate=bead_flow,
+                       fast_rate=super_fast_flow,
                        bottom_offset=.5,
                        drop_tip=True)
 
@@ -376,40 +424,36 @@ def run(protocol: protocol_api.ProtocolContext):
     magblock.disengage()
 
     # add elution buffer and mix
-    for col in cols:
+    elute = Incubation(protocol, pause_elute)
+    for col in dry_order:
         pipette_left.pick_up_tip(tiprack_elution_1.wells_by_name()[col])
         pipette_left.aspirate(50, reagents['A2'], rate=1)
         pipette_left.dispense(50, mag_plate[col].bottom(z=1))
         pipette_left.mix(10, 40, mag_plate[col].bottom(z=1))
+        elute.start()
         pipette_left.blow_out(mag_plate[col].top())
         pipette_left.touch_tip()
         # we'll use these same tips for final transfer
         pipette_left.return_tip()
 
-    protocol.delay(seconds=pause_elute)
-    # # start timer
-    # t0 = clock()
-    # # mix again
-    # t_mix = 0
-    # while t_mix < pause_elute():
-    for col in cols:
-        pipette_left.pick_up_tip(tiprack_elution_1.wells_by_name()[col])
-        pipette_left.mix(10, 40, mag_plate[col].bottom(z=1))
-        pipette_left.blow_out(mag_plate[col].top())
-        pipette_left.touch_tip()
-        # we'll use these same tips for final transfer
-        pipette_left.drop_tip()
-        # t_mix = clock() - t0
+    # keep mixing while the elution incubates
+    mix_for(elute,
+            pipette_left,
+            mag_plate,
+            cols,
+            tiprack_elution_1,
+            n=10,
+            mix_vol=40,
+            order=order)
 
     # bind to magnet
     protocol.comment('Binding beads to magnet.')
 
     magblock.engage(height_from_base=mag_engage_height)
-
     protocol.delay(seconds=pause_mag)
 
     protocol.comment('Transferring eluted DNA to final plate.')
-    for col in cols:
+    for col in order(cols, mag_plate):
         pipette_left.pick_up_tip(tiprack_elution_2.wells_by_name()[col])
         pipette_left.aspirate(50,
                               mag_plate[col].bottom(z=2),
@@ -1,5 +1,8 @@
 from opentrons import protocol_api
-from numpy import ceil
+from moeller_functions.magbeads import (ColumnOrder, MagnetState, bead_wash,
+                                        mix_for, remove_supernatant)
+from moeller_functions.timing import Incubation, Scheduler
+from moeller_functions.transfer import add_buffer
 
 metadata = {'apiLevel': '2.5',
             'author': 'Jon Sanders'}
@@ -30,9 +33,23 @@ else:
 # bead aspiration flow rate
 bead_flow = .25
 
+# supernatant flow rate while the tip is well above the pellet. Only the
+# final chunk of each removal, taken at the bottom offset, runs at
+# bead_flow.
+super_fast_flow = .5
+
 # wash mix mutliplier
 wash_mix = 5
 
+# supernatant removed from each well, µL: the tagmentation reaction, the
+# first TWB wash, the second TWB wash before adding PCR MM, the liquid
+# over the beads before each EtOH wash, and the last EtOH before drying
+tag_super_vol = 60
+twb_super_vol = 100
+pcr_super_vol = 120
+eth_super_vol = 125
+dry_super_vol = 170
+
 # Wash 1 (TWB) columns
 twb_cols = ['A3', 'A4']
 
@@ -45,222 +62,16 @@ eth_cols = ['A6', 'A7', 'A8']
 # define magnet engagement height for plates
 mag_engage_height = 6
 
+# order in which the bead helpers visit columns: 'plate' keeps the order of
+# `cols`; 'serpentine' reverses direction on alternate passes, so each pass
+# starts where the last one ended; 'nearest' removes supernatant from the
+# columns closest to the waste first
+col_order = 'plate'
 
-
-def bead_mix(pipette,
-             plate,
-             cols,
-             tiprack,
-             n=5,
-             mix_vol=200,
-             drop_tip=False):
-    for col in cols:
-        pipette.pick_up_tip(tiprack.wells_by_name()[col])
-        pipette.mix(n, 
-                    mix_vol,
-                    plate[col].bottom(z=2))
-        pipette.blow_out(plate[col].top())
-
-        if drop_tip:
-            pipette.drop_tip()
-        else:
-            pipette.return_tip()
-    return()
-
-
-def remove_supernatant(pipette,
-                       plate,
-                       cols,
-                       tiprack,
-                       waste,
-                       super_vol=600,
-                       rate=0.25,
-                       bottom_offset=2,
-                       drop_tip=False):
-
-    # remove supernatant
-    
-    for col in cols:
-        vol_remaining = super_vol
-        # transfers to remove supernatant:
-        pipette.pick_up_tip(tiprack.wells_by_name()[col])
-        transfers = int(ceil(super_vol/190))
-        while vol_remaining > 0:
-            transfer_vol = min(vol_remaining, 190)
-            if vol_remaining <= 190:
-                z_height = bottom_offset
-            else:
-                z_height = 4
-            pipette.aspirate(transfer_vol,
-                             plate[col].bottom(z=z_height),
-                             rate=rate)
-            pipette.air_gap(10)
-            pipette.dispense(transfer_vol + 10, waste.top())
-            vol_remaining -= transfer_vol
-            pipette.blow_out()
-        # we're done with these tips at this point
-        if drop_tip:
-            pipette.drop_tip()
-        else:
-            pipette.return_tip() 
-    return()
-
-
-def add_buffer(pipette,
-               plate,
-               cols,
-               wash_vol,
-               source_wells,
-               source_vol,
-               tip=None,
-               tip_vol=300,
-               remaining=None,
-               drop_tip=True):
-
-    
-    if tip is not None:
-        pipette.pick_up_tip(tip)
-    else:
-        pipette.pick_up_tip()
-
-
-    source_well = source_wells[0]
-    if remaining is None:
-        remaining = source_vol
-
-    transfers = int(ceil(wash_vol/(tip_vol-10)))
-    transfer_vol = wash_vol/transfers
-
-    for col in cols:
-        for i in range(0,transfers):
-#             print("%s µL remaining in %s" % (remaining, source_well))
-#             print("Transferring %s to %s" % (transfer_vol, col))
-            pipette.aspirate(transfer_vol, 
-                             source_well)
-            pipette.air_gap(10)
-            pipette.dispense(transfer_vol + 10, 
-                             plate[col].top())
-
-            remaining -= transfer_vol
-
-            if remaining < transfer_vol + source_vol*0.1:
-#                 print("Only %s remaining in %s\n" % (remaining, source_well))
-                source_wells.pop(0)
-                source_well = source_wells[0]
-                
-#                 print("Moving on to %s\n" % source_well)
-                remaining = source_vol
-
-        pipette.blow_out()
-
-    if drop_tip:
-        pipette.drop_tip()
-    else:
-        pipette.return_tip() 
-
-    return(remaining, source_wells)
-
-
-def bead_wash(# global arguments
-              protocol,
-              magblock,
-              pipette,
-              plate,
-              cols,
-              # super arguments
-              super_waste,
-              super_tiprack,
-              # wash buffer arguments
-              source_wells,
-              source_vol,
-              # mix arguments
-              mix_tiprack,
-              # optional arguments
-              super_vol=600,
-              rate=bead_flow,
-              super_bottom_offset=2,
-              drop_super_tip=True,
-              wash_vol=300,
-              remaining=None,
-              wash_tip=None,
-              drop_wash_tip=True,
-              mix_vol=200,
-              mix_n=wash_mix,
-              drop_mix_tip=False,
-              mag_engage_height=mag_engage_height,
-              pause_s=pause_mag
-              ):
-    # Wash
-
-    # This should:
-    # - pick up tip from position 7
-    # - pick up 190 µL from the mag plate
-    # - air gap
-    # - dispense into position 11
-    # - repeat x 
-    # - trash tip
-    # - move to next column
-    # - disengage magnet
-
-    # remove supernatant
-    remove_supernatant(pipette,
-                       plate,
-                       cols,
-                       super_tiprack,
-                       super_waste,
-                       super_vol=super_vol,
-                       rate=bead_flow,
-                       bottom_offset=super_bottom_offset,
-                       drop_tip=drop_super_tip)
-        
-    # disengage magnet
-    magblock.disengage()
-
-
-    # This should:
-    # - Pick up tips from column 3 of location 2
-    # - pick up isopropanol from position 5 column 3
-    # - dispense to `cols` in mag plate
-    # - pick up isopropanol from position 5 column 4
-    # - dispense to `cols` in mag plate
-    # - drop tips at end
-
-    # add isopropanol
-
-    wash_wells, wash_remaining = add_buffer(pipette,
-                                            plate,
-                                            cols,
-                                            wash_vol=wash_vol,
-                                            source_wells=source_wells,
-                                            source_vol=source_vol,
-                                            tip=wash_tip,
-                                            remaining=remaining,
-                                            drop_tip=drop_wash_tip)
-
-
-    # This should:
-    # - grab a tip from position 8
-    # - mix 5 times the corresponding well on mag plate
-    # - blow out
-    # - return tip
-    # - do next col
-    # - engage magnet
-
-    # mix
-    bead_mix(pipette,
-             plate,
-             cols,
-             mix_tiprack,
-             n=mix_n,
-             mix_vol=mix_vol,
-             drop_tip=drop_mix_tip)
-
-    # engage magnet
-    magblock.engage(height_from_base=mag_engage_height)
-
-    protocol.delay(seconds=pause_s)
-
-    return(wash_wells, wash_remaining)
+# time to add the small-cut beads, which runs while the large-cut beads
+# pellet: seconds fixed and per column, as `python -m Tools.estimate` puts
+# that step at 1 and 12 columns
+small_cut_bead_s = (28.5, 2.8)
 
 
 def run(protocol: protocol_api.ProtocolContext):
@@ -302,13 +113,10 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # ### Setup
 
-    protocol.home()
-
-
     # define deck positions and labware
 
     # define hardware modules
-    magblock = protocol.load_module('Magnetic Module', 10)
+    magblock = MagnetState(protocol.load_module('Magnetic Module', 10))
     magblock.disengage()
 
     # tips
@@ -359,6 +167,12 @@ def run(protocol: protocol_api.ProtocolContext):
     # EtOH wells
     eth_wells = [buffers[x] for x in eth_cols]
 
+    # fills magnet waits with work that doesn't need the mag plate
+    scheduler = Scheduler(protocol)
+
+    # column visit order for the bead helpers
+    order = ColumnOrder(col_order)
+
 
     # DNA plate
 
@@ -461,11 +275,17 @@ def run(protocol: protocol_api.ProtocolContext):
                                          tiprack_wash,
                                          # optional arguments
                                          wash_vol=100,
-                                         super_vol=60,
+                                         super_vol=tag_super_vol,
                                          drop_super_tip=False,
+                                         multi_dispense=True,
                                          mix_n=wash_mix,
                                          mix_vol=90,
-                                         remaining=None)
+                                         remaining=None,
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
 
 
@@ -488,20 +308,28 @@ def run(protocol: protocol_api.ProtocolContext):
                                          tiprack_wash,
                                          # optional arguments
                                          wash_vol=100,
-                                         super_vol=100,
+                                         super_vol=twb_super_vol,
                                          drop_super_tip=False,
+                                         multi_dispense=True,
                                          mix_n=wash_mix,
                                          mix_vol=90,
-                                         remaining=twb_remaining)
-
-    # remove supernatant
+                                         remaining=twb_remaining,
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
+
+    # remove supernatant; PCR MM goes in in the same column order
+    pcr_order = order(cols, mag_plate, waste['A1'].top())
     remove_supernatant(pipette_left,
                        mag_plate,
-                       cols,
+                       pcr_order,
                        tiprack_wash,
                        waste['A1'],
-                       super_vol=120,
+                       super_vol=pcr_super_vol,
                        rate=bead_flow,
+                       fast_rate=super_fast_flow,
                        bottom_offset=.5,
                        drop_tip=False)
 
@@ -511,16 +339,17 @@ def run(protocol: protocol_api.ProtocolContext):
     # MM: 3 mL; 350 (400 µL) per tip
     # buffer tips 4
 
-    pcr_wells, pcr_remaining = add_buffer(pipette_left,
+    pcr_remaining, pcr_wells = add_buffer(pipette_left,
+                                          pcr_wells,
                                           mag_plate,
-                                          cols,
+                                          pcr_order,
                                           30,
-                                          pcr_wells,
                                           200,
                                           tip=None,
                                           tip_vol=300,
                                           remaining=None,
-                                          drop_tip=True)
+                                          drop_tip=True,
+                                          multi_dispense=True)
 
 
     # plate: primers i5
@@ -598,8 +427,8 @@ def run(protocol: protocol_api.ProtocolContext):
     for col in cols:
         pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
         pipette_left.transfer(45,
-                             [mag_plate[x] for x in cols],
-                             [samples[x] for x in cols],
+                             mag_plate[col],
+                             samples[col],
                              mix_after=(10, 100),
                              touch_tip=True,
                              new_tip='never',
@@ -613,29 +442,40 @@ def run(protocol: protocol_api.ProtocolContext):
 
     protocol.comment('Binding beads to magnet.')
     magblock.engage(height_from_base=mag_engage_height)
-    protocol.delay(seconds=pause_mag)
+    mag = Incubation(protocol, pause_mag)
+    mag.start()
 
 
-    # Add buffers for small-cut size selection to new plate
+    # Add buffers for small-cut size selection to new plate, while the
+    # beads pellet
     # Add 15 µL SPRI beads
     # buffer tips 7
-    pipette_left.pick_up_tip()
-    pipette_left.mix(10, 100, buffers['A5'])
-    pipette_left.distribute(15,
-                            buffers['A5'],
-                            [samples[x] for x in cols],
-                            mix_before=(2,15),
-                            touch_tip=True,
-                            new_tip='never') 
-    pipette_left.drop_tip()
+    def add_small_cut_beads():
+        protocol.comment('Preparing small-cut bead conditions.')
+        pipette_left.pick_up_tip()
+        pipette_left.mix(10, 100, buffers['A5'])
+        pipette_left.distribute(15,
+                                buffers['A5'],
+                                [samples[x] for x in cols],
+                                mix_before=(2,15),
+                                touch_tip=True,
+                                new_tip='never') 
+        pipette_left.drop_tip()
+
+    scheduler.add('small-cut beads', add_small_cut_beads,
+                  small_cut_bead_s[0] + small_cut_bead_s[1]*len(cols),
+                  uses=[samples])
+    scheduler.wait(mag, busy=[mag_plate], fit=False)
+    scheduler.flush()
 
 
     # Transfer 125 µL large-cut supernatant to new plate
+    protocol.comment('Transferring large-cut supernatant to new plate.')
     for col in cols:
         pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
         pipette_left.transfer(125,
-                             [mag_plate[x] for x in cols],
-                             [samples[x] for x in cols],
+                             mag_plate[col],
+                             samples[col],
                              mix_after=(10, 100),
                              touch_tip=True,
                              new_tip='never',
@@ -670,11 +510,16 @@ def run(protocol: protocol_api.ProtocolContext):
                                          tiprack_wash,
                                          # optional arguments
                                          wash_vol=150,
-                                         super_vol=125,
+                                         super_vol=eth_super_vol,
                                          drop_super_tip=False,
                                          mix_n=wash_mix,
                                          mix_vol=140,
-                                         remaining=None)
+                                         remaining=None,
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
 
     # ### Do first wash: 150 µL EtOH
@@ -696,11 +541,16 @@ def run(protocol: protocol_api.ProtocolContext):
                                          tiprack_wash,
                                          # optional arguments
                                          wash_vol=150,
-                                         super_vol=125,
+                                         super_vol=eth_super_vol,
                                          drop_super_tip=False,
                                          mix_n=wash_mix,
                                          mix_vol=140,
-                                         remaining=eth_remaining)
+                                         remaining=eth_remaining,
+                                         rate=bead_flow,
+                                         fast_rate=super_fast_flow,
+                                         mag_engage_height=mag_engage_height,
+                                         pause_s=pause_mag,
+                                         order=order)
 
 
 
@@ -715,15 +565,17 @@ def run(protocol: protocol_api.ProtocolContext):
     # - trash tip
     # - leave magnet engaged
 
-    # remove supernatant
+    # remove supernatant; elution buffer goes in in the same column order
 
+    dry_order = order(cols, mag_plate, waste['A1'].top())
     remove_supernatant(pipette_left,
                        mag_plate,
-                       cols,
+                       dry_order,
                        tiprack_wash,
                        waste['A1'],
-                       super_vol=170,
+                       super_vol=dry_super_vol,
                        rate=bead_flow,
+                       fast_rate=super_fast_flow,
                        bottom_offset=.5,
                        drop_tip=True)
 
@@ -761,24 +613,27 @@ def run(protocol: protocol_api.ProtocolContext):
     magblock.disengage()
 
     # add elution buffer and mix
-    for col in cols:
+    elute = Incubation(protocol, pause_elute)
+    for col in dry_order:
         pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
         pipette_left.aspirate(32, buffers['A4'], rate=1)
         pipette_left.dispense(32, mag_plate[col].bottom(z=1))
         pipette_left.mix(10, 25, mag_plate[col].bottom(z=1))
+        elute.start()
         pipette_left.blow_out(mag_plate[col].top())
         pipette_left.touch_tip()
         # we'll use these same tips for final transfer
         pipette_left.return_tip()
     
-    protocol.delay(seconds=pause_elute)
-    for col in cols:
-        pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
-        pipette_left.mix(10, 25, mag_plate[col].bottom(z=1))
-        pipette_left.blow_out(mag_plate[col].top())
-        pipette_left.touch_tip()
-        # we'll use these same tips for final transfer
-        pipette_left.return_tip()
+    # keep mixing while the elution incubates
+    mix_for(elute,
+            pipette_left,
+            mag_plate,
+            cols,
+            tiprack_wash,
+            n=10,
+            mix_vol=25,
+            order=order)
 
     # bind to magnet
     protocol.comment('Binding beads to magnet.')
@@ -788,7 +643,7 @@ def run(protocol: protocol_api.ProtocolContext):
     protocol.delay(seconds=pause_mag)
 
     protocol.comment('Transferring eluted DNA to final plate.')
-    for col in cols:
+    for col in order(cols, mag_plate):
         pipette_left.pick_up_tip(tiprack_wash.wells_by_name()[col])
         pipette_left.aspirate(32, 
                               mag_plate[col].bottom(z=2),
@@ -1,7 +1,12 @@
 #!./libs/bats/bin/bats
 
+setup() {
+  # the protocols import moeller_functions from the repository root
+  export PYTHONPATH=..${PYTHONPATH:+:$PYTHONPATH}
+}
+
 @test "Testing isolate DNA extraction" {
-  run opentrons_simulate \
+  run ${OT_SIMULATE:-opentrons_simulate} \
        -L ../Labware/custom_labware \
        ../Extraction/isolate_DNA_extraction/isolate_DNA_extraction.py \
        > test_isolate_DNA_extraction.out
@@ -11,7 +16,7 @@
 }
 
 @test "Testing Zymo fecal/soil magbead extraction, Part A" {
-  run opentrons_simulate \
+  run ${OT_SIMULATE:-opentrons_simulate} \
        -L ../Labware/custom_labware \
        ../Extraction/Zymo_fecal-soil_magbead/Zymo_fecal-soil_magbead_A-tube-to-plate.py \
        > Zymo_fecal-soil_magbead_A-tube-to-plate.out
@@ -21,7 +26,7 @@
 }
 
 @test "Testing Zymo fecal/soil magbead extraction, Part B" {
-  run opentrons_simulate \
+  run ${OT_SIMULATE:-opentrons_simulate} \
        -L ../Labware/custom_labware \
        ../Extraction/Zymo_fecal-soil_magbead/Zymo_fecal-soil_magbead_B-extraction.py \
        > Zymo_fecal-soil_magbead_B-extraction.out
@@ -1,7 +1,12 @@
 #!./libs/bats/bin/bats
 
+setup() {
+  # the protocols import moeller_functions from the repository root
+  export PYTHONPATH=..${PYTHONPATH:+:$PYTHONPATH}
+}
+
 @test "Testing Hackflex library prep" {
-  run opentrons_simulate \
+  run ${OT_SIMULATE:-opentrons_simulate} \
        -L ../Labware/custom_labware \
        ../Library_Prep/Hackflex/hackflex.py \
        > test_hackflex.out
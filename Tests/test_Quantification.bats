@@ -1,7 +1,7 @@
 #!./libs/bats/bin/bats
 
 @test "Testing single plate Quantifluor protocol" {
-  run opentrons_simulate \
+  run ${OT_SIMULATE:-opentrons_simulate} \
        -L ../Labware/custom_labware \
        ../Quantification/Quantifluor_DNA_quant/Quantifluor_DNA_one-plate.py \
        > test_Quantifluor_DNA_one-plate.out
@@ -11,7 +11,7 @@
 }
 
 @test "Testing four plate Quantifluor protocol" {
-  run opentrons_simulate \
+  run ${OT_SIMULATE:-opentrons_simulate} \
        -L ../Labware/custom_labware \
        ../Quantification/Quantifluor_DNA_quant/Quantifluor_DNA_four-plates.py \
        > test_Quantifluor_DNA_four-plates.out
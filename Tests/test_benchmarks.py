@@ -0,0 +1,38 @@
+import pytest
+
+from Tools import PROTOCOLS
+from Tools.benchmark import baseline, compare, load_history
+from Tools.runner import make_jobs, run_jobs
+
+
+@pytest.fixture(scope='module')
+def results():
+    pytest.importorskip('opentrons')
+    # simulated over the runner's pool, and answered from its cache for
+    # protocols that haven't changed since the last run
+    return({r['protocol']: r for r in run_jobs(make_jobs(PROTOCOLS))})
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_protocol_benchmark(results, protocol):
+    previous = baseline(load_history(), protocol)
+    if previous is None:
+        pytest.skip('no recorded baseline; run python -m Tools.benchmark '
+                    '--record')
+    result = results[protocol]
+    assert result['ok'], result['error']
+    regressions = compare(result['metrics'], previous)
+    assert not regressions, '\n'.join(regressions)
+
+
+def test_compare_flags_doubled_aspirates():
+    previous = {'aspirates': 240, 'wall_time': 2.0}
+    # wall time is informational, however much it grows
+    assert compare({'aspirates': 240, 'wall_time': 10.0}, previous) == []
+    regressions = compare({'aspirates': 480, 'wall_time': 2.0}, previous)
+    assert len(regressions) == 1
+    assert regressions[0].startswith('aspirates')
+
+
+def test_compare_without_history():
+    assert compare({'aspirates': 480}, None) == []
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from Tools.config import (
+    configure, load_configured, load_overrides, parameters, validate)
+
+SOURCE = '''\
+metadata = {'apiLevel': '2.5'}
+
+test_run = False
+
+if test_run:
+    pause_mag = 3
+    cols = ['A1']
+else:
+    pause_mag = 3*60
+    cols = ['A1', 'A2', 'A3', 'A4', 'A5', 'A6',
+            'A7', 'A8', 'A9', 'A10', 'A11', 'A12']
+
+# bead aspiration flow rate
+bead_flow = .25  # of the default
+
+
+def bead_wash(pause_s=pause_mag, rate=bead_flow):
+    return(pause_s, rate)
+
+
+def run(protocol):
+    pass
+'''
+
+
+def test_parameters_follow_the_branch_taken():
+    found = parameters(SOURCE)
+    assert found['pause_mag'] == 180
+    assert len(found['cols']) == 12
+    assert found['bead_flow'] == .25
+    assert 'metadata' not in found and 'run' not in found
+
+
+def test_validate():
+    defaults = parameters(SOURCE)
+    assert validate(defaults, {'cols': 3}) == {'cols': ['A1', 'A2', 'A3']}
+    assert validate(defaults, {'bead_flow': 1}) == {'bead_flow': 1.0}
+    with pytest.raises(ValueError) as error:
+        validate(defaults, {'cols': 13, 'pause_mag': 1.5,
+                            'test_run': 'yes', 'tips': 2})
+    for name in ('cols', 'pause_mag', 'test_run', 'tips'):
+        assert name + ':' in str(error.value)
+
+
+def test_configure_rewrites_assignments():
+    source = configure(SOURCE, {'test_run': True, 'pause_mag': 60,
+                                'bead_flow': .5})
+    found = parameters(source)
+    assert found['test_run'] is True
+    assert found['pause_mag'] == 60
+    assert found['cols'] == ['A1']
+    assert 'bead_flow = 0.5  # of the default' in source
+    assert configure(SOURCE, {}) == SOURCE
+
+
+def test_overrides_in_priority_order(tmpdir):
+    protocol = tmpdir.join('protocol.py')
+    protocol.write(SOURCE)
+    tmpdir.join('protocol.config.json').write(json.dumps(
+        {'cols': 2, 'pause_mag': 10, 'bead_flow': .3}))
+    config = tmpdir.join('run.json')
+    config.write(json.dumps({'pause_mag': 20}))
+    environ = {'OTCONFIG_BEAD_FLOW': '0.4', 'OTCONFIG_COLS': '4'}
+
+    overrides = load_overrides(str(protocol), str(config), ['cols=6'],
+                               environ)
+    assert overrides == {'cols': 6, 'pause_mag': 20, 'bead_flow': .4}
+
+    module = load_configured(str(protocol), overrides)
+    assert module.cols == ['A1', 'A2', 'A3', 'A4', 'A5', 'A6']
+    # defaults bound when the protocol is imported follow the overrides
+    assert module.bead_wash() == (20, .4)
@@ -0,0 +1,65 @@
+import pytest
+
+from Tools.estimate import (
+    FIXED_COSTS, MOVE_OVERHEAD, WELL_CLEARANCE, estimate, format_duration,
+    moves, travel_time)
+from Tools.mock import MockProtocolContext
+from Tools.simulate import finish_events
+
+
+def _run():
+    ctx = MockProtocolContext()
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 2)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    ctx.comment('Moving liquid.')
+    pipette.pick_up_tip()
+    pipette.aspirate(100, plate['A1'], rate=0.5)
+    pipette.dispense(100, plate['A2'])
+    pipette.mix(2, 50, plate['A2'])
+    pipette.drop_tip()
+    ctx.comment('Waiting.')
+    ctx.delay(seconds=30)
+    ctx.pause('Spin down the plate.')
+    return(pipette, finish_events(ctx.events))
+
+
+def test_liquid_and_mix_at_flow_rate():
+    pipette, events = _run()
+    step = estimate(events)['steps']['Moving liquid.']
+    aspirate, dispense = pipette.flow_rate.aspirate, pipette.flow_rate.dispense
+    # `rate=` scales the flow rate of that command only
+    assert step['liquid'] == pytest.approx(100/(aspirate*0.5) +
+                                           100/dispense)
+    assert step['mix'] == pytest.approx(2*(50/aspirate + 50/dispense))
+    assert step['tips'] == FIXED_COSTS['pick_up_tip'] + \
+        FIXED_COSTS['drop_tip']
+
+
+def test_travel_arcs_between_labware():
+    _, events = _run()
+    result = estimate(events)
+    safe = {i: (start, end, safe_z) for i, start, end, safe_z in
+            moves(events)}
+    assert result['categories']['travel'] == pytest.approx(
+        sum(travel_time(*move) for move in safe.values()))
+
+    aspirate = next(i for i, e in enumerate(events)
+                    if e['name'] == 'aspirate')
+    dispense = next(i for i, e in enumerate(events)
+                    if e['name'] == 'dispense')
+    # tip rack to plate arcs over the deck; A1 to A2 just clears the wells
+    start, end, safe_z = safe[dispense]
+    assert safe_z == max(start[2], end[2]) + WELL_CLEARANCE
+    assert safe[aspirate][2] > safe_z
+    assert travel_time(start, end, safe_z) > MOVE_OVERHEAD
+
+
+def test_delays_timed_and_pauses_counted():
+    _, events = _run()
+    result = estimate(events)
+    assert result['steps']['Waiting.']['delay'] == 30
+    assert result['pauses'] == ['Spin down the plate.']
+    assert result['total'] == pytest.approx(
+        sum(result['categories'].values()))
+    assert format_duration(3725) == '1:02:05'
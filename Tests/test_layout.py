@@ -0,0 +1,18 @@
+from Tools.layout import (
+    MODULE_SLOTS, access_pattern, capture, optimize, travel_seconds)
+
+
+def test_optimized_layout_respects_constraints():
+    events, deck = capture('Library_Prep/Hackflex/hackflex.py', mock=True)
+    pattern = access_pattern(events)
+    before = travel_seconds(pattern)
+    layout, after = optimize(pattern, deck, fixed=['7'], restarts=1)
+
+    assert after <= before
+    assert after == travel_seconds(pattern, layout)
+    assert layout['7'] == '7'
+    assert len(set(layout.values())) == len(layout)
+    assert '12' not in layout.values()
+    for item, slot in layout.items():
+        if deck[item]['module']:
+            assert slot in MODULE_SLOTS
@@ -0,0 +1,178 @@
+from math import pi
+
+import pytest
+
+from Tools import PROTOCOLS
+from Tools.config import load_configured
+from Tools.estimate import estimate
+from Tools.mock import MockProtocolContext, dry_run
+from Tools.simulate import finish_events
+from moeller_functions.magbeads import MagnetState
+from moeller_functions.transfer import LiquidLevel, add_buffer
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_protocol_dry_run(protocol):
+    events = dry_run(protocol)
+    assert any(e['name'] == 'aspirate' for e in events)
+
+
+def test_transfer_nests_commands():
+    ctx = MockProtocolContext()
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 2)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    pipette.transfer(50, plate['A1'], [plate['A2'], plate['A3']])
+    events = finish_events(ctx.events)
+
+    assert [e['name'] for e in events] == [
+        'transfer', 'pick_up_tip', 'aspirate', 'dispense',
+        'aspirate', 'dispense', 'drop_tip']
+    assert [e['depth'] for e in events] == [0, 1, 1, 1, 1, 1, 1]
+    assert not events[0]['leaf']
+    assert events[3]['well'] == 'A2' and events[3]['slot'] == '1'
+    assert events[2]['flow_rate'] == pipette.flow_rate.aspirate
+
+
+def test_multichannel_uses_whole_tip_columns():
+    ctx = MockProtocolContext()
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 2)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    pipette.pick_up_tip()
+    pipette.drop_tip()
+    pipette.pick_up_tip()
+    assert ctx.events[-1]['well'] == 'A2'
+
+
+def test_aspirate_past_capacity_raises():
+    ctx = MockProtocolContext()
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    tips = ctx.load_labware('opentrons_96_tiprack_20ul', 2)
+    pipette = ctx.load_instrument('p20_single_gen2', 'right',
+                                  tip_racks=[tips])
+    pipette.pick_up_tip()
+    with pytest.raises(RuntimeError):
+        pipette.aspirate(25, plate['A1'])
+
+
+def test_liquid_level_follows_conical_wells():
+    ctx = MockProtocolContext()
+    plate = ctx.load_labware('vwr_96_wellplate_1000ul', 1)
+    well = plate['A1']
+    level = LiquidLevel(well, well.max_volume)
+
+    assert level.height() == pytest.approx(well.depth)
+    assert level.height(0) == 0
+    heights = [level.height(v) for v in range(0, 1001, 50)]
+    assert heights == sorted(heights)
+
+    location = level.aspirate(200, floor=4)
+    assert level.volume == well.max_volume - 200
+    assert location.point.z == pytest.approx(
+        well.bottom().point.z + level.height() - level.clearance)
+    assert not level.reachable(level.volume)
+
+
+def test_liquid_level_reads_simulator_wells():
+    simulate = pytest.importorskip('opentrons.simulate')
+    ctx = simulate.get_protocol_api('2.5')
+    mock = MockProtocolContext()
+    for name, slot in (('biorad_96_wellplate_200ul_pcr', 1),
+                       ('nest_12_reservoir_15ml', 2)):
+        well = ctx.load_labware(name, slot)['A1']
+        level = LiquidLevel(well, well.max_volume)
+        mock_well = mock.load_labware(name, slot)['A1']
+        assert level.area == pytest.approx(
+            LiquidLevel(mock_well, mock_well.max_volume).area)
+        if name.startswith('biorad'):
+            assert level.area == pytest.approx(pi*5.46**2/4)
+        else:
+            assert level.area == pytest.approx(8.2*71.2)
+
+
+def test_multi_dispense_keeps_dead_volume():
+    ctx = MockProtocolContext()
+    strips = ctx.load_labware(
+        'opentrons_96_aluminumblock_generic_pcr_strip_200ul', 3)
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 2)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    cols = ['A{0}'.format(c) for c in range(1, 13)]
+    add_buffer(pipette, [strips[x] for x in ('A4', 'A5', 'A6')], plate,
+               cols, 30, 200, multi_dispense=True)
+    events = finish_events(ctx.events)
+
+    given = {}
+    left = {'A4': 200, 'A5': 200, 'A6': 200}
+    for e in events:
+        if e['name'] == 'dispense' and e['slot'] == '1':
+            given[e['well']] = given.get(e['well'], 0) + e['volume']
+        elif e['name'] == 'aspirate':
+            left[e['well']] -= e['volume']
+            # 10% of the strip tube stays behind
+            assert left[e['well']] >= 20
+        elif e['name'] == 'blow_out' and e['slot'] == '3':
+            left[e['well']] += 10
+    assert given == {col: 30 for col in cols}
+
+
+def test_magnet_state_skips_redundant_moves():
+    ctx = MockProtocolContext()
+    magblock = MagnetState(ctx.load_module('magdeck', 10))
+    plate = magblock.load_labware('biorad_96_wellplate_200ul_pcr')
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 3)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+
+    magblock.disengage()
+    magblock.disengage()
+    magblock.engage(height_from_base=6)
+    magblock.engage(height_from_base=6)
+    magblock.engage(height_from_base=4)
+    pipette.pick_up_tip()
+    pipette.aspirate(50, plate['A1'])
+
+    names = [e['name'] for e in finish_events(ctx.events)]
+    assert [n for n in names if n in ('engage', 'disengage')] == \
+        ['disengage', 'engage', 'engage']
+    assert magblock.status == 'engaged'
+
+
+def test_multichannel_transfer_visits_first_row_only():
+    ctx = MockProtocolContext()
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    other = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 2)
+    assay = ctx.load_labware('corning_384_wellplate_112ul_flat', 3)
+    tips = [ctx.load_labware('opentrons_96_filtertiprack_10ul', slot)
+            for slot in (4, 5)]
+    pipette = ctx.load_instrument('p10_multi', 'right', tip_racks=tips)
+    pipette.transfer(2, plate.wells(), other.wells(), new_tip='always')
+    pipette.distribute(2, plate['A1'], assay.columns()[0])
+    events = finish_events(ctx.events)
+
+    assert sum(e['name'] == 'pick_up_tip' for e in events) == 13
+    assert [e['well'] for e in events if e['name'] == 'dispense'] == \
+        ['A{0}'.format(i) for i in range(1, 13)] + ['A1', 'B1']
+    with pytest.raises(RuntimeError):
+        pipette.transfer(2, plate['B1'], other['A1'])
+
+
+def test_four_plates_uses_a_tip_column_per_sample_column():
+    events = dry_run('Quantification/Quantifluor_DNA_quant/'
+                     'Quantifluor_DNA_four-plates.py')
+    picks = [e for e in events if e['name'] == 'pick_up_tip' and
+             e['mount'] == 'right']
+    # 4 plates of 12 columns, one rack of 10 uL filter tips each
+    assert len(picks) == 48
+    assert len({(e['slot'], e['well']) for e in picks}) == 48
+
+
+@pytest.mark.parametrize('cols', [1, 12])
+def test_hackflex_small_cut_time_matches_estimate(cols):
+    hackflex = 'Library_Prep/Hackflex/hackflex.py'
+    module = load_configured(hackflex, {'cols': cols}, mock=True)
+    steps = estimate(dry_run(hackflex, module=module))['steps']
+    step = steps['Preparing small-cut bead conditions.']
+    # the step's own work, without the rest of the magnet wait after it
+    seconds = sum(t for category, t in step.items() if category != 'delay')
+    fixed, per_column = module.small_cut_bead_s
+    assert fixed + per_column*cols == pytest.approx(seconds, rel=0.1)
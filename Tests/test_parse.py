@@ -0,0 +1,59 @@
+import pytest
+
+from Tools.estimate import estimate
+from Tools.mock import dry_run, format_events
+from Tools.parse import parse_line, parse_lines
+
+
+def test_parse_aspirate_on_module():
+    event = parse_line('\t\tAspirating 190.0 uL from A1 of VWR 96 Well Plate '
+                       'on Magnetic Module GEN1 on 10 at 37.5 uL/sec\n')
+    assert event['name'] == 'aspirate'
+    assert event['depth'] == 2
+    assert event['volume'] == 190.0
+    assert event['flow_rate'] == 37.5
+    assert (event['well'], event['slot']) == ('A1', '10')
+    assert event['labware'] == 'VWR 96 Well Plate'
+
+
+def test_comments_label_steps():
+    lines = ['Doing wash #1.',
+             'Mixing 5 times with a volume of 150.0 ul',
+             '\tAspirating 150.0 uL from A1 of plate on 1 at 150.0 uL/sec',
+             '\tDispensing 150.0 uL into A1 of plate on 1 at 300.0 uL/sec',
+             'Delaying for 1 minutes and 30.0 seconds']
+    events = list(parse_lines(lines))
+    assert [e['name'] for e in events] == [
+        'comment', 'mix', 'aspirate', 'dispense', 'delay']
+    assert {e['step'] for e in events} == {'Doing wash #1.'}
+    assert [e['leaf'] for e in events] == [True, False, True, True, True]
+    assert events[-1]['seconds'] == 90
+
+
+def test_parsed_text_matches_mock_events():
+    events = dry_run('Library_Prep/Hackflex/hackflex.py')
+    parsed = list(parse_lines(format_events(events).split('\n')))
+    assert len(parsed) == len(events)
+    for event, from_text in zip(events, parsed):
+        for key in ('name', 'depth', 'leaf', 'step', 'volume', 'slot'):
+            # mix, touch tip and air gap text do not name a location
+            if key == 'slot' and event['name'] in ('mix', 'touch_tip',
+                                                   'air_gap'):
+                continue
+            assert event.get(key) == from_text.get(key), event['text']
+
+
+def test_speed_lines_get_pipette_flow_rate():
+    lines = ['Picking up tip from A1 of Opentrons 96 Tip Rack 300 µL on 8',
+             'Aspirating 60.0 uL from A1 of wash buffers on 2 at 0.5 speed',
+             'Dispensing 60.0 uL into A1 of plate on 1 at 1.0 speed',
+             'Picking up tip from A1 of Opentrons 96 Tip Rack 20 µL on 11',
+             'Aspirating 5.0 uL from A1 of plate on 1 at 1.0 speed']
+    events = list(parse_lines(lines))
+    assert [e.get('flow_rate') for e in events] == [None, 75, 300, None, 5]
+    assert events[1]['rate'] == 0.5
+    step = estimate(events)['steps'][None]
+    assert step['liquid'] == pytest.approx(60/75 + 60/300 + 5/5)
+
+    single = list(parse_lines(lines[:2], {300: 'p300_single_gen2'}))
+    assert single[1]['flow_rate'] == pytest.approx(92.86*0.5)
@@ -0,0 +1,74 @@
+import pytest
+
+from Tools.config import load_configured
+from Tools.estimate import estimate
+from Tools.layout import capture
+from Tools.mock import MockProtocolContext, dry_run
+from Tools.plan import (compile_plan, diff_plans, load_plan, plan_events,
+                        replay, save_plan, validate_plan)
+from Tools.simulate import finish_events
+
+HACKFLEX = 'Library_Prep/Hackflex/hackflex.py'
+TUBES = 'Transfers/tubes_to_96well.py'
+
+
+def _leaves(events):
+    return([(e['name'], e.get('volume'), e.get('slot'), e.get('well'),
+             e.get('point')) for e in events if e['leaf']])
+
+
+def test_plan_round_trip(tmpdir):
+    plan = compile_plan(HACKFLEX, {'cols': 2}, mock=True)
+    path = str(tmpdir.join('hackflex.plan.json.gz'))
+    save_plan(plan, path)
+
+    events = dry_run(HACKFLEX, module=load_configured(
+        HACKFLEX, {'cols': 2}, mock=True))
+    assert plan_events(load_plan(path)) == events
+    # tools given a plan read its commands rather than running it
+    assert dry_run(path) == events
+    assert estimate(dry_run(path)) == estimate(events)
+
+
+def test_replay():
+    plan = compile_plan(HACKFLEX, {'cols': 2}, mock=True)
+    context = MockProtocolContext()
+    replay(plan, context)
+    assert _leaves(finish_events(context.events)) == \
+        _leaves(plan_events(plan))
+
+
+def test_diff():
+    one = compile_plan(HACKFLEX, {'cols': 1}, mock=True)
+    two = compile_plan(HACKFLEX, {'cols': 2}, mock=True)
+    assert diff_plans(one, one) == ''
+    diff = diff_plans(one, two).splitlines()
+    assert diff[0] == '--- a'
+    assert any(line.startswith('+') and 'A2 of' in line for line in diff)
+
+
+def test_validate():
+    plan = compile_plan(TUBES, mock=True)
+    assert validate_plan(plan) == []
+    plan['source'] = 'stale'
+    mount = sorted(plan['pipettes'])[0]
+    del plan['pipettes'][mount]
+    problems = validate_plan(plan)
+    assert any('has changed' in p for p in problems)
+    assert any('{0} mount'.format(mount) in p for p in problems)
+
+
+def test_tools_read_the_deck_from_plans(tmpdir):
+    path = str(tmpdir.join('hackflex.plan.json'))
+    save_plan(compile_plan(HACKFLEX, mock=True), path)
+    assert capture(path) == capture(HACKFLEX, mock=True)
+
+
+def test_plan_records_engage_heights():
+    pytest.importorskip('opentrons.simulate')
+    plan = compile_plan(HACKFLEX, {'cols': 1})
+    engages = [e for e in plan_events(plan) if e['name'] == 'engage']
+    assert engages and all(e['height_from_base'] == 6 for e in engages)
+    assert [e for e in plan_events(compile_plan(HACKFLEX, {'cols': 1},
+                                                mock=True))
+            if e['name'] == 'engage'] == engages
@@ -0,0 +1,22 @@
+import pytest
+
+from Tools.estimate import estimate
+from Tools.mock import dry_run
+from Tools.profiler import profile_protocol
+
+HACKFLEX = 'Library_Prep/Hackflex/hackflex.py'
+
+
+def test_profile_accounts_for_estimated_time():
+    profile = profile_protocol(HACKFLEX, mock=True)
+    robot = sum(r['robot'] for r in profile.records.values())
+    assert robot == pytest.approx(estimate(dry_run(HACKFLEX))['total'])
+
+
+def test_calls_attributed_to_helpers_and_steps():
+    totals = profile_protocol(HACKFLEX, mock=True).totals(('helper', 'call'))
+    assert totals[('bead_wash > remove_supernatant', 'aspirate')]['calls'] > 0
+    assert totals[('bead_wash > bead_mix', 'mix')]['robot'] > 0
+
+    steps = profile_protocol(HACKFLEX, mock=True).totals(('step',))
+    assert ('Doing wash #1.',) in steps
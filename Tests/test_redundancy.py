@@ -0,0 +1,66 @@
+import pytest
+
+from Tools import PROTOCOLS
+from Tools.mock import MockProtocolContext, dry_run
+from Tools.redundancy import ERRORS, redundancies
+from Tools.simulate import finish_events
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_protocol_has_no_repeated_transfers(protocol):
+    findings = [f for f in redundancies(dry_run(protocol))
+                if f['kind'] in ERRORS]
+    assert not findings, '\n'.join(f['text'] for f in findings)
+
+
+def _context():
+    ctx = MockProtocolContext()
+    mag = ctx.load_module('magdeck', 10)
+    plate = mag.load_labware('biorad_96_wellplate_200ul_pcr')
+    samples = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 3)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    return(ctx, mag, plate, samples, pipette)
+
+
+def test_transfer_inside_column_loop():
+    ctx, mag, plate, samples, pipette = _context()
+    cols = ['A1', 'A2', 'A3']
+    for col in cols:
+        pipette.pick_up_tip()
+        pipette.transfer(45, [plate[x] for x in cols],
+                         [samples[x] for x in cols], mix_after=(2, 50),
+                         new_tip='never')
+        pipette.drop_tip()
+    findings = redundancies(finish_events(ctx.events))
+    assert [f['kind'] for f in findings] == ['repeated transfer']*2
+    assert all(f['seconds'] > 0 for f in findings)
+
+
+def test_refilled_source_and_pause_are_not_repeats():
+    ctx, mag, plate, samples, pipette = _context()
+    pipette.transfer(45, plate['A1'], samples['A1'])
+    pipette.transfer(45, samples['A2'], plate['A1'])
+    pipette.transfer(45, plate['A1'], samples['A1'])
+    ctx.pause('Replace the plate in position 1.')
+    pipette.transfer(45, plate['A1'], samples['A1'])
+    pipette.transfer(45, [plate['A1'], plate['A2']],
+                     [samples['A1'], samples['A2']])
+    findings = redundancies(finish_events(ctx.events))
+    assert [f['kind'] for f in findings] == ['repeated destination']
+
+
+def test_idle_magnet_and_pauses():
+    ctx, mag, plate, samples, pipette = _context()
+    mag.engage()
+    ctx.delay(seconds=60)
+    mag.disengage()
+    mag.engage()
+    mag.engage()
+    ctx.pause('Spin down the plate.')
+    ctx.comment('Then:')
+    ctx.pause('Return it to the magnet.')
+    findings = redundancies(finish_events(ctx.events))
+    assert [f['kind'] for f in findings] == \
+        ['idle magnet', 'idle magnet', 'back-to-back pause']
+    assert findings[0]['seconds'] == 70
@@ -0,0 +1,41 @@
+import sys
+
+from Tools.runner import environment_hash, make_jobs, run_jobs
+
+HACKFLEX = 'Library_Prep/Hackflex/hackflex.py'
+
+
+def test_unchanged_jobs_come_from_cache(tmp_path):
+    jobs = make_jobs([HACKFLEX], [{'cols': ['A1']}, {'cols': ['A1', 'A2']}],
+                     mock=True)
+    first = run_jobs(jobs, workers=2, cache_dir=str(tmp_path))
+    assert [r['ok'] for r in first] == [True, True]
+    assert not any(r['cached'] for r in first)
+    assert first[0]['metrics']['tips'] < first[1]['metrics']['tips']
+
+    second = run_jobs(jobs, workers=2, cache_dir=str(tmp_path))
+    assert all(r['cached'] for r in second)
+    assert [r['metrics'] for r in second] == [r['metrics'] for r in first]
+
+
+def test_failures_are_not_cached(tmp_path):
+    jobs = make_jobs([HACKFLEX], [{'cols': ['Z99']}], mock=True)
+    assert not run_jobs(jobs, workers=1, cache_dir=str(tmp_path))[0]['ok']
+    assert not list(tmp_path.iterdir())
+
+
+def test_environment_follows_opentrons_functions_source(tmp_path,
+                                                        monkeypatch):
+    package = tmp_path / 'opentrons_functions'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'transfer.py').write_text('VOLUME = 10\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in list(sys.modules):
+        if name.split('.')[0] == 'opentrons_functions':
+            monkeypatch.delitem(sys.modules, name)
+    before = environment_hash()
+    assert environment_hash() == before
+
+    (package / 'transfer.py').write_text('VOLUME = 20\n')
+    assert environment_hash() != before
@@ -0,0 +1,26 @@
+import threading
+
+from Tools.server import (
+    SimulationServer, request_simulation, running, send)
+
+
+def test_server_round_trip(tmp_path):
+    path = str(tmp_path / 'sim.sock')
+    server = SimulationServer(path)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    try:
+        assert running(path)
+        response = request_simulation('Library_Prep/Hackflex/hackflex.py',
+                                      mock=True, path=path)
+        assert response['ok']
+        assert response['metrics']['aspirates'] > 0
+        assert response['text'].startswith(response['events'][0]['text'])
+
+        missing = request_simulation('no_such_protocol.py', mock=True,
+                                     path=path)
+        assert not missing['ok']
+    finally:
+        send({'command': 'shutdown'}, path)
+        thread.join()
+    assert not running(path)
@@ -0,0 +1,59 @@
+from Tools.mock import MockProtocolContext
+from Tools.simulate import finish_events
+from Tools.sweep import measure, parse_vary, pareto, run_variant, variants
+
+
+def test_grid():
+    grid = parse_vary(['cols=[2, 4]', 'bead_flow=0.25,0.5', 'col_order=plate'])
+    assert grid == {'cols': [2, 4], 'bead_flow': [0.25, 0.5],
+                    'col_order': ['plate']}
+    found = variants(grid, {'test_run': False})
+    assert len(found) == 4
+    assert found[0] == {'test_run': False, 'cols': 2, 'bead_flow': 0.25,
+                        'col_order': 'plate'}
+
+
+def _result(cols, time, tips, reagent):
+    return({'ok': True, 'params': {'cols': cols},
+            'metrics': {'robot_time': time, 'tips': tips,
+                        'reagent': reagent}})
+
+
+def test_pareto():
+    results = [_result(2, 100, 10, 500),
+               _result(2, 90, 12, 500),
+               _result(2, 110, 12, 500),
+               _result(4, 200, 20, 1000),
+               {'ok': False, 'params': {'cols': 4}, 'error': ''}]
+    assert pareto(results) == [0, 1]
+    assert pareto(results, 'cols') == [0, 1, 3]
+
+
+def test_run_variant_measures_hackflex():
+    job = {'protocol': 'Library_Prep/Hackflex/hackflex.py', 'mock': True}
+    one = run_variant(dict(job, params={'cols': 1}))
+    two = run_variant(dict(job, params={'cols': 2}))
+    assert one['ok'] and two['ok']
+    for metric in ('robot_time', 'tips', 'reagent'):
+        assert one['metrics'][metric] < two['metrics'][metric]
+
+    failed = run_variant(dict(job, params={'cols': 13}))
+    assert not failed['ok'] and 'cols' in failed['error']
+
+
+def test_reagent_counts_every_source_but_samples():
+    ctx = MockProtocolContext()
+    samples = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    reservoir = ctx.load_labware('nest_12_reservoir_15ml', 2)
+    strips = ctx.load_labware(
+        'opentrons_96_aluminumblock_generic_pcr_strip_200ul', 3)
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 4)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 5)
+    pipette = ctx.load_instrument('p300_single', 'right', tip_racks=[tips])
+    pipette.transfer(50, reservoir['A1'], [plate['A1'], plate['A2']])
+    pipette.transfer(20, strips['A1'], [plate['A1'], plate['A2']])
+    pipette.transfer(10, [samples['A1'], samples['A2']],
+                     [plate['A1'], plate['A2']], new_tip='always')
+    pipette.transfer(30, plate['A1'], plate['A3'])
+
+    assert measure(finish_events(ctx.events))['reagent'] == 140
@@ -0,0 +1,69 @@
+from Tools.layout import capture
+from Tools.tips import consolidations, plan_tips, swapped_tips, tip_usage
+
+
+def _pick(slot, well, labware='opentrons_96_tiprack_300ul'):
+    return({'name': 'pick_up_tip', 'slot': slot, 'well': well,
+            'labware': labware})
+
+
+def test_hackflex_keeps_the_swap_to_filter_tips():
+    events, deck = capture('Library_Prep/Hackflex/hackflex.py', mock=True)
+    auto = [slot for slot, entry in deck.items() if entry.get('auto_tips')]
+    loads, pauses = tip_usage(events, auto)
+
+    assert loads[('8', 0)]['auto']
+    assert loads[('4', 0)]['load_name'] == 'opentrons_96_tiprack_300ul'
+    # elution takes the 200 uL filter tips the pause asks for
+    assert loads[('4', 1)]['load_name'] == 'opentrons_96_filtertiprack_200ul'
+    plan, avoided = plan_tips(loads, pauses, free_slots=['9'])
+    assert plan == {'wells': {}, 'racks': {}}
+    assert avoided == []
+    assert len(pauses) == 1 and 'position 4' in pauses[0][0]
+
+
+def test_swap_to_same_tips_fits_spare_columns():
+    events = [_pick('4', 'A{0}'.format(c)) for c in range(1, 7)]
+    events.append({'name': 'pause', 'message': 'Replace empty tiprack in '
+                   'position 4 with new rack of 300 µL tips.'})
+    events += [_pick('4', 'A1'), _pick('4', 'A2')]
+    loads, pauses = tip_usage(events)
+
+    plan, avoided = plan_tips(loads, pauses)
+    assert plan['wells'] == {'4/1/1': '4/7', '4/1/2': '4/8'}
+    assert len(avoided) == 1
+
+
+def test_swapped_tips():
+    assert swapped_tips('new rack of 200 µL filter tips',
+                        'opentrons_96_tiprack_300ul') == \
+        'opentrons_96_filtertiprack_200ul'
+    assert swapped_tips('fresh filter tips in slot 5',
+                        'opentrons_96_tiprack_20ul') == \
+        'opentrons_96_filtertiprack_20ul'
+    assert swapped_tips('Replace tips in slot 4',
+                        'opentrons_96_tiprack_300ul') == \
+        'opentrons_96_tiprack_300ul'
+
+
+def test_full_rack_swap_uses_an_empty_slot():
+    events = [_pick('4', 'A{0}'.format(c)) for c in range(1, 13)]
+    events.append({'name': 'pause', 'message': 'Replace tips in slot 4'})
+    events += [_pick('4', 'A1'), _pick('4', 'A1'), _pick('4', 'A2')]
+    loads, pauses = tip_usage(events)
+
+    assert loads[('4', 1)]['reuses'] == 1
+    plan, avoided = plan_tips(loads, pauses, free_slots=['9'])
+    assert plan['racks'] == {'9': 'opentrons_96_tiprack_300ul'}
+    assert plan['wells'] == {'4/1/1': '9/1', '4/1/2': '9/2'}
+    assert avoided == ['Replace tips in slot 4']
+
+    plan, avoided = plan_tips(loads, pauses)
+    assert plan['wells'] == {} and avoided == []
+
+
+def test_consolidations():
+    events = [_pick('5', 'A1', 'tips10'), _pick('9', 'A1', 'tips10'),
+              _pick('4', 'A1')]
+    loads, _ = tip_usage(events, auto_slots=['4'])
+    assert consolidations(loads) == [('5', '9')]
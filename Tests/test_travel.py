@@ -0,0 +1,19 @@
+import pytest
+
+from Tools.mock import dry_run
+from Tools.travel import move_distance, travel
+
+
+def test_move_distance_arcs_over_safe_height():
+    assert move_distance([0, 0, 10], [30, 40, 20], safe_z=50) == 50 + 40 + 30
+    assert move_distance([0, 0, 10], [0, 0, 10]) == 0
+
+
+def test_travel_sums_steps_and_pairs():
+    result = travel(dry_run('Library_Prep/Hackflex/hackflex.py'))
+    assert result['total'] > 0
+    assert sum(result['steps'].values()) == pytest.approx(result['total'])
+    assert sum(p['distance'] for p in result['pairs'].values()) == \
+        pytest.approx(result['total'])
+    # supernatant goes from the mag plate on 10 to waste on 7
+    assert result['pairs'][('10', '7')]['moves'] > 0
@@ -0,0 +1,101 @@
+from Tools.mock import MockProtocolContext
+from Tools.simulate import finish_events
+from Tools.vector import (
+    Deck, channel_table, compile_events, components, volumes)
+
+
+def test_channel_table():
+    names, table = channel_table([['A1', 'B1', 'C1', 'D1', 'E1', 'F1', 'G1',
+                                   'H1']])
+    assert list(table[0]) == list(range(8))
+    assert list(table[1][:7]) == list(range(1, 8)) and table[1][7] == -1
+
+    rows = [chr(ord('A') + r) + '1' for r in range(16)]
+    names, table = channel_table([rows])
+    assert [names[w] for w in table[names.index('B1')]] == \
+        ['B1', 'D1', 'F1', 'H1', 'J1', 'L1', 'N1', 'P1']
+
+    names, table = channel_table([['A1'], ['A2']])
+    assert list(table[1]) == [1]*8
+
+
+def _run():
+    ctx = MockProtocolContext()
+    reservoir = ctx.load_labware('nest_12_reservoir_15ml', 2)
+    plate = ctx.load_labware('vwr_96_wellplate_1000ul', 1)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 3)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    pipette.pick_up_tip()
+    for _ in range(4):
+        pipette.aspirate(300, reservoir['A1'])
+        pipette.dispense(300, plate['A1'])
+    pipette.aspirate(100, reservoir['A2'])
+    pipette.dispense(50, plate['A2'])
+    pipette.air_gap(20)
+    pipette.blow_out(plate['A3'])
+    pipette.aspirate(100, plate['A2'])
+    pipette.drop_tip()
+    return(finish_events(ctx.events))
+
+
+def test_volumes_flag_overflow_underflow_and_exhaustion():
+    events = _run()
+    deck = Deck()
+    rows = compile_events(events, deck)
+    result = volumes(rows, deck, {('2', 'A1'): 5000, ('1', None): 0})
+
+    flags = {(f['kind'], f['slot'], f['well']) for f in result['flags']}
+    assert {('overflow', '1', r + '1') for r in 'ABCDEFGH'} <= flags
+    assert ('exhausted', '2', 'A1') in flags
+    assert {('underflow', '1', r + '2') for r in 'ABCDEFGH'} <= flags
+    assert not any(f['well'].endswith('3') for f in result['flags'])
+
+    sources = {s['well']: s for s in result['sources']}
+    assert sources['A1']['needed'] == 8*4*300
+    assert sources['A2']['start'] == 15000
+
+    plate = deck.plates.index(('1', 'vwr_96_wellplate_1000ul'))
+    # the air gap isn't liquid; the blow out empties the rest of the tip
+    assert result['final'][plate, deck.well(plate, 'A3')] == 50
+
+
+def test_volumes_of_unknown_and_swapped_plates():
+    ctx = MockProtocolContext()
+    samples = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 1)
+    plate = ctx.load_labware('biorad_96_wellplate_200ul_pcr', 2)
+    tips = ctx.load_labware('opentrons_96_tiprack_300ul', 3)
+    pipette = ctx.load_instrument('p300_multi', 'left', tip_racks=[tips])
+    pipette.pick_up_tip()
+    # more comes out of the plate than went in: it held samples already
+    pipette.aspirate(50, samples['A1'])
+    pipette.dispense(50, plate['A1'])
+    pipette.aspirate(120, plate['A1'])
+    pipette.dispense(120, samples['A1'])
+    ctx.pause('Replace the plate in position 1 with a clean one.')
+    pipette.aspirate(150, plate['A2'])
+    pipette.dispense(150, samples['A1'])
+    pipette.drop_tip()
+    deck = Deck()
+    rows = compile_events(finish_events(ctx.events), deck)
+
+    # without a swap, 120 + 150 uL would overflow the 200 uL well
+    assert volumes(rows, deck)['flags'] == []
+    flags = volumes(rows, deck, {('2', None): 0})['flags']
+    assert {(f['kind'], f['well']) for f in flags} == \
+        {('underflow', r + '1') for r in 'ABCDEFGH'}
+
+
+def test_components_follow_sources():
+    events = _run()
+    deck = Deck()
+    rows = compile_events(events, deck)
+    result = volumes(rows, deck)
+    sources, amounts = components(rows, deck, result['start'])
+
+    plate = deck.plates.index(('1', 'vwr_96_wellplate_1000ul'))
+    reservoir = deck.plates.index(('2', 'nest_12_reservoir_15ml'))
+    a1 = sources.index((reservoir, deck.well(reservoir, 'A1')))
+    a2 = sources.index((reservoir, deck.well(reservoir, 'A2')))
+    well = deck.well(plate, 'A1')
+    assert amounts[plate, well, a1] == 1200
+    assert amounts[plate, deck.well(plate, 'A3'), a2] == 50
@@ -0,0 +1,32 @@
+"""Off-robot analysis tools for the protocols in this library.
+
+Everything here drives the same ``run(protocol)`` entry points that
+``opentrons_simulate`` exercises, so a protocol that passes the simulation
+tests can be analysed without modification.
+"""
+import os
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Custom labware definitions, as passed to `opentrons_simulate -L`
+LABWARE_DIR = os.path.join(REPO_ROOT, 'Labware', 'custom_labware')
+
+# Protocols in the library, relative to the repository root
+PROTOCOLS = [
+    'Extraction/isolate_DNA_extraction/isolate_DNA_extraction.py',
+    'Extraction/Zymo_fecal-soil_magbead/'
+    'Zymo_fecal-soil_magbead_A-tube-to-plate.py',
+    'Extraction/Zymo_fecal-soil_magbead/'
+    'Zymo_fecal-soil_magbead_B-extraction.py',
+    'Library_Prep/Hackflex/hackflex.py',
+    'Quantification/Quantifluor_DNA_quant/Quantifluor_DNA_one-plate.py',
+    'Quantification/Quantifluor_DNA_quant/Quantifluor_DNA_four-plates.py',
+    'Transfers/tubes_to_96well.py',
+]
+
+
+def protocol_path(protocol):
+    """Resolve a protocol given relative to the repository root."""
+    if os.path.exists(protocol):
+        return os.path.abspath(protocol)
+    return os.path.join(REPO_ROOT, protocol)
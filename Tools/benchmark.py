@@ -0,0 +1,194 @@
+"""Simulation benchmarks with a recorded history and regression thresholds.
+
+Each protocol is simulated in a fresh interpreter so that wall time and
+peak memory belong to that protocol alone. Alongside those we record counts
+taken from the captured commands and the estimated robot time, which are
+deterministic: a refactor that doubles the aspirates in `remove_supernatant`
+shows up as a doubled `aspirates` count, not as noise.
+
+Results are appended as JSON lines to `Tests/benchmark_history.jsonl`.
+A run regresses when any deterministic metric exceeds the most recent
+recorded value for that protocol by more than its threshold in
+`THRESHOLDS`. Wall time and memory vary from machine to machine, so they
+are reported alongside for information but never fail a run. The tests in
+`Tests/test_benchmarks.py` take their metrics from `Tools.runner`, so they
+share its cache.
+
+Usage:
+
+    python -m Tools.benchmark            # compare against history
+    python -m Tools.benchmark --record   # ...and append the results
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from . import LABWARE_DIR, PROTOCOLS, REPO_ROOT
+
+HISTORY = os.path.join(REPO_ROOT, 'Tests', 'benchmark_history.jsonl')
+
+# Allowed fractional increase over the last recorded value, for the
+# deterministic metrics only
+THRESHOLDS = {'commands': 0.05,
+              'aspirates': 0.05,
+              'dispenses': 0.05,
+              'tips': 0.05,
+              'robot_time': 0.05}
+
+# Measured and recorded, but dependent on the machine
+INFORMATIONAL = ('wall_time', 'peak_rss_mb')
+
+
+def _peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return(rss/1024)
+
+
+def summarise(events):
+    """Deterministic metrics from a captured command stream."""
+    from .estimate import estimate
+
+    leaves = [e for e in events if e.get('leaf', True)]
+
+    def count(name):
+        return(sum(1 for e in leaves if e['name'] == name))
+
+    return({'commands': len(leaves),
+            'aspirates': count('aspirate'),
+            'dispenses': count('dispense'),
+            'tips': count('pick_up_tip'),
+            'robot_time': round(estimate(events)['total'], 1)})
+
+
+def measure(protocol, labware_dir=LABWARE_DIR):
+    """Benchmark one protocol in this process."""
+    from .simulate import simulate
+
+    start = time.perf_counter()
+    events = simulate(protocol, labware_dir=labware_dir)
+    wall_time = time.perf_counter() - start
+
+    metrics = summarise(events)
+    metrics['wall_time'] = round(wall_time, 3)
+    metrics['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+    return(metrics)
+
+
+def measure_isolated(protocol, labware_dir=LABWARE_DIR):
+    """Benchmark one protocol in a fresh interpreter."""
+    command = [sys.executable, '-m', 'Tools.benchmark', '--measure',
+               '-L', labware_dir, protocol]
+    result = subprocess.run(command, cwd=REPO_ROOT, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+    return(json.loads(result.stdout))
+
+
+def load_history(path=HISTORY):
+    if not os.path.exists(path):
+        return([])
+    with open(path) as f:
+        return([json.loads(line) for line in f if line.strip()])
+
+
+def baseline(history, protocol):
+    """The most recently recorded metrics for `protocol`, if any."""
+    for entry in reversed(history):
+        if entry['protocol'] == protocol:
+            return(entry['metrics'])
+    return(None)
+
+
+def compare(metrics, previous, thresholds=THRESHOLDS):
+    """Describe every metric that regressed past its threshold."""
+    regressions = []
+    if previous is None:
+        return(regressions)
+    for metric, threshold in thresholds.items():
+        if metric not in metrics or not previous.get(metric):
+            continue
+        limit = previous[metric] * (1 + threshold)
+        if metrics[metric] > limit:
+            regressions.append(
+                '{0}: {1} > {2} (+{3:.0%} allowed over {4})'.format(
+                    metric, metrics[metric], round(limit, 3), threshold,
+                    previous[metric]))
+    return(regressions)
+
+
+def _commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=REPO_ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                universal_newlines=True)
+    except OSError:
+        return(None)
+    return(result.stdout.strip() or None)
+
+
+def record(results, path=HISTORY):
+    """Append a set of {protocol: metrics} results to the history."""
+    stamp = datetime.datetime.utcnow().isoformat(timespec='seconds')
+    commit = _commit()
+    with open(path, 'a') as f:
+        for protocol, metrics in results.items():
+            f.write(json.dumps({'timestamp': stamp,
+                                'commit': commit,
+                                'protocol': protocol,
+                                'metrics': metrics},
+                               sort_keys=True) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark protocol simulations against history.')
+    parser.add_argument('protocols', nargs='*', default=PROTOCOLS)
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--record', action='store_true',
+                        help='append results to the history file')
+    parser.add_argument('--measure', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        # child process of measure_isolated()
+        json.dump(measure(args.protocols[0], args.custom_labware),
+                  sys.stdout)
+        return(0)
+
+    history = load_history(args.history)
+    results = {}
+    failed = False
+    for protocol in args.protocols:
+        metrics = measure_isolated(protocol, args.custom_labware)
+        results[protocol] = metrics
+        previous = baseline(history, protocol)
+        regressions = compare(metrics, previous)
+        gated = {k: v for k, v in metrics.items() if k not in INFORMATIONAL}
+        info = {k: metrics[k] for k in INFORMATIONAL if k in metrics}
+        print('{0}\n  {1}\n  info {2}'.format(
+            protocol, json.dumps(gated, sort_keys=True),
+            json.dumps(info, sort_keys=True)))
+        if previous is None:
+            print('  no recorded baseline')
+        for regression in regressions:
+            print('  REGRESSION ' + regression)
+        failed = failed or bool(regressions)
+
+    if args.record:
+        record(results, args.history)
+    return(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""Configure a protocol's run without editing its source.
+
+A protocol's parameters are its top-level assignments of plain values,
+such as `cols`, the `pause_*` times, `bead_flow` or `twb_cols`, including
+those made under `if test_run:`. Overrides are read from, each source
+taking priority over the one before:
+
+1. a sidecar file next to the protocol, `<protocol>.config.json` (or
+   `.config.yaml`)
+2. the JSON or YAML file named by the `OT_RUN_CONFIG` environment variable
+3. `OTCONFIG_<NAME>` environment variables, e.g. `OTCONFIG_COLS=4`
+4. `--config FILE` and `--set NAME=VALUE` on the command line
+
+Each override must have the type of the default it replaces (a whole
+number will do for a float). A number of columns for `cols` is expanded to
+that many columns from A1. The assignments are rewritten in the protocol
+source before it runs, so values computed from them when the protocol is
+imported, like the default `pause_s` of a helper defined in the protocol,
+follow as well.
+`--write` saves the configured protocol to upload to the robot.
+
+Usage:
+
+    python -m Tools.config Library_Prep/Hackflex/hackflex.py \\
+        --set test_run=false cols=4 --write hackflex_4.py
+"""
+import argparse
+import ast
+import io
+import json
+import linecache
+import os
+import pprint
+import re
+import sys
+import tokenize
+import types
+
+from . import protocol_path
+
+ENVIRONMENT_FILE = 'OT_RUN_CONFIG'
+ENVIRONMENT_PREFIX = 'OTCONFIG_'
+
+# names that are set at the top of a protocol but aren't run parameters
+RESERVED = {'metadata'}
+
+COLUMNS = 12
+
+
+def _assignments(body):
+    # top-level assignments to a single name, including those in if/else
+    for node in body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+                isinstance(node.targets[0], ast.Name):
+            yield node
+        elif isinstance(node, ast.If):
+            for assignment in _assignments(node.body + node.orelse):
+                yield assignment
+
+
+def parameters(source):
+    """The parameters a protocol's source defines, with their values.
+
+    Only values that can be worked out without running the protocol
+    (literals, arithmetic and earlier parameters) count. An `if` whose
+    test can be worked out, like `if test_run:`, gives the values of the
+    branch it takes.
+    """
+    found = {}
+
+    def evaluate(node):
+        return(eval(compile(ast.Expression(node), '<config>', 'eval'),
+                    {'__builtins__': {}}, dict(found)))
+
+    def walk(body):
+        for node in body:
+            if isinstance(node, ast.If):
+                try:
+                    taken = node.body if evaluate(node.test) else \
+                        node.orelse
+                except Exception:
+                    taken = node.body + node.orelse
+                walk(taken)
+                continue
+            if node not in assignments:
+                continue
+            name = node.targets[0].id
+            if name in RESERVED or name.startswith('_'):
+                continue
+            try:
+                value = evaluate(node.value)
+            except Exception:
+                continue
+            if isinstance(value, (bool, int, float, str, list, tuple,
+                                  dict)):
+                found[name] = value
+
+    tree = ast.parse(source)
+    assignments = set(_assignments(tree.body))
+    walk(tree.body)
+    return(found)
+
+
+def column_names(n):
+    return(['A{0}'.format(i + 1) for i in range(n)])
+
+
+def _check(name, value, default):
+    # the override, converted to the default's type, or a reason it can't be
+    if name == 'cols' and isinstance(value, int) and \
+            not isinstance(value, bool):
+        if not 1 <= value <= COLUMNS:
+            return(None, 'between 1 and {0} columns'.format(COLUMNS))
+        return(column_names(value), None)
+    if isinstance(default, bool):
+        return((value, None) if isinstance(value, bool) else
+               (None, 'true or false'))
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return(None, 'a number')
+        if isinstance(default, int) and not isinstance(value, int):
+            return(None, 'a whole number')
+        return(type(default)(value), None)
+    if isinstance(default, (list, tuple)):
+        if not isinstance(value, (list, tuple)):
+            return(None, 'a list')
+        kinds = {type(v) for v in default}
+        if len(kinds) == 1 and not all(isinstance(v, tuple(kinds))
+                                       for v in value):
+            return(None, 'a list of {0}'.format(kinds.pop().__name__))
+        return(type(default)(value), None)
+    if not isinstance(value, type(default)):
+        return(None, 'a {0}'.format(type(default).__name__))
+    return(value, None)
+
+
+def validate(defaults, overrides):
+    """Check `overrides` against the protocol's `defaults`.
+
+    Returns the overrides converted to their defaults' types; raises
+    ValueError naming every override that doesn't fit.
+    """
+    checked = {}
+    errors = []
+    for name, value in overrides.items():
+        if name not in defaults:
+            errors.append('{0}: not a parameter of this protocol'.format(
+                name))
+            continue
+        checked[name], expected = _check(name, value, defaults[name])
+        if expected is not None:
+            errors.append('{0}: expected {1}, got {2!r}'.format(
+                name, expected, value))
+    if errors:
+        raise ValueError('invalid run configuration:\n  ' +
+                         '\n  '.join(errors))
+    return(checked)
+
+
+def parse_value(text):
+    """A value given as text, as JSON or a Python literal if it is one."""
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            return(parse(text))
+        except (ValueError, SyntaxError):
+            pass
+    return(text)
+
+
+def read_config(path):
+    """Overrides from a JSON or YAML file."""
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError('reading {0} needs PyYAML'.format(path))
+            overrides = yaml.safe_load(f) or {}
+        else:
+            overrides = json.load(f)
+    if not isinstance(overrides, dict):
+        raise ValueError('{0} should hold a mapping of parameter names to '
+                         'values'.format(path))
+    return(overrides)
+
+
+def sidecar(path):
+    """The protocol's own config file, if it has one."""
+    stem = os.path.splitext(protocol_path(path))[0]
+    for extension in ('.config.json', '.config.yaml', '.config.yml'):
+        if os.path.exists(stem + extension):
+            return(stem + extension)
+    return(None)
+
+
+def load_overrides(path, config=None, settings=(), environ=None):
+    """Collect the overrides for the protocol at `path`.
+
+    `config` is a file given on the command line and `settings` a list of
+    'NAME=VALUE' strings.
+    """
+    environ = os.environ if environ is None else environ
+    overrides = {}
+    for source in (sidecar(path), environ.get(ENVIRONMENT_FILE)):
+        if source:
+            overrides.update(read_config(source))
+    for key, text in sorted(environ.items()):
+        if key.startswith(ENVIRONMENT_PREFIX):
+            overrides[key[len(ENVIRONMENT_PREFIX):].lower()] = \
+                parse_value(text)
+    if config:
+        overrides.update(read_config(config))
+    for setting in settings:
+        name, sep, text = setting.partition('=')
+        if not sep:
+            raise ValueError('expected NAME=VALUE, got {0!r}'.format(
+                setting))
+        overrides[name.strip()] = parse_value(text.strip())
+    return(overrides)
+
+
+def _format_value(value, indent):
+    return(pprint.pformat(value, width=79 - indent, compact=True).replace(
+        '\n', '\n' + ' '*indent))
+
+
+def configure(source, overrides):
+    """Rewrite the protocol source with the (validated) overrides."""
+    overrides = validate(parameters(source), overrides)
+    lines = source.splitlines(True)
+    tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    edits = []
+    for node in _assignments(ast.parse(source).body):
+        name = node.targets[0].id
+        if name not in overrides:
+            continue
+        # the statement runs up to the end of its logical line, leaving
+        # any comment at the end of it in place
+        k = next(k for k, token in enumerate(tokens)
+                 if token.type == tokenize.NEWLINE and
+                 token.start >= (node.lineno, node.col_offset))
+        end = tokens[k].start
+        comment = tokens[k - 1].type == tokenize.COMMENT
+        if comment:
+            end = tokens[k - 1].start
+        prefix = '{0} = '.format(name)
+        text = prefix + _format_value(overrides[name],
+                                      node.col_offset + len(prefix))
+        if comment:
+            text += '  '
+        edits.append(((node.lineno, node.col_offset), end, text))
+
+    for start, end, text in reversed(edits):
+        head = ''.join(lines[:start[0] - 1]) + lines[start[0] - 1][:start[1]]
+        tail = lines[end[0] - 1][end[1]:] + ''.join(lines[end[0]:])
+        lines = (head + text + tail).splitlines(True)
+    return(''.join(lines))
+
+
+def load_configured(path, overrides=None, mock=False):
+    """Import the protocol at `path` with `overrides` applied.
+
+    With `mock` the protocol imports the stand-in opentrons from
+    `Tools.mock`.
+    """
+    path = protocol_path(path)
+    with open(path) as f:
+        source = configure(f.read(), overrides or {})
+    name = 'protocol_' + re.sub(r'\W', '_',
+                                os.path.splitext(os.path.basename(path))[0])
+    module = types.ModuleType(name)
+    module.__file__ = path
+    # tracebacks should show the configured lines, not the file's
+    filename = '{0} (configured)'.format(path)
+    linecache.cache[filename] = (len(source), None,
+                                 source.splitlines(True), filename)
+    code = compile(source, filename, 'exec')
+    if mock:
+        from .mock import stand_in_opentrons
+        with stand_in_opentrons():
+            exec(code, module.__dict__)
+    else:
+        exec(code, module.__dict__)
+    return(module)
+
+
+def add_arguments(parser):
+    """Add `--config` and `--set` to a tool's command line."""
+    parser.add_argument('--config', metavar='FILE',
+                        help='JSON or YAML file of parameter overrides')
+    parser.add_argument('--set', nargs='*', default=[], dest='settings',
+                        metavar='NAME=VALUE', help='override a parameter')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Show or write a protocol with its run configuration.')
+    parser.add_argument('protocol')
+    add_arguments(parser)
+    parser.add_argument('--write', metavar='PATH',
+                        help='write the configured protocol')
+    args = parser.parse_args(argv)
+
+    path = protocol_path(args.protocol)
+    with open(path) as f:
+        source = f.read()
+    try:
+        overrides = load_overrides(path, args.config, args.settings)
+        configured = configure(source, overrides)
+    except ValueError as e:
+        sys.exit(str(e))
+    if args.write:
+        with open(args.write, 'w') as f:
+            f.write(configured)
+        return
+    defaults = parameters(source)
+    values = parameters(configured)
+    for name, value in values.items():
+        print('{0:<20} {1!r}{2}'.format(
+            name, value, '' if value == defaults[name] else '  (default '
+            '{0!r})'.format(defaults[name])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Static wall-clock run-time estimates for protocols.
+
+The estimate walks the events captured by `Tools.simulate` and charges each
+leaf command against a simple model of the OT-2:
+
+- gantry travel between successive locations, arcing over the deck when
+  moving between labware and just clearing the well tops within a labware
+- aspirate and dispense time from volume and the configured flow rate,
+  including `rate=` multipliers such as `bead_flow`
+- fixed costs for tip handling, blow outs, touch tips, homing and
+  magnet moves
+- `protocol.delay()` for its full duration
+
+Liquid handling done inside a `mix()` is reported as mixing. Pauses need an
+operator, so they are counted but not timed.
+
+The protocol's run configuration is read as by `Tools.config`, so
+`--set cols=4` estimates a four-column run.
+
+Usage:
+
+    python -m Tools.estimate Library_Prep/Hackflex/hackflex.py
+"""
+import argparse
+import json
+import math
+import sys
+
+from . import LABWARE_DIR
+
+# default gantry speed of an InstrumentContext, and the Z axis limit, mm/s
+XY_SPEED = 400
+Z_SPEED = 125
+
+# acceleration and settling overhead per move, s
+MOVE_OVERHEAD = 0.2
+
+# clearance above the tallest labware when arcing between labware, and
+# above the well top when moving within a labware, mm
+ARC_CLEARANCE = 10
+WELL_CLEARANCE = 1
+
+# time for commands whose cost does not scale with volume, s
+FIXED_COSTS = {'pick_up_tip': 4.0,
+               'drop_tip': 3.0,
+               'blow_out': 1.0,
+               'touch_tip': 2.0,
+               'home': 10.0,
+               'engage': 5.0,
+               'disengage': 5.0}
+
+CATEGORIES = ['travel', 'liquid', 'mix', 'tips', 'delay', 'module', 'other']
+
+_CATEGORY = {'aspirate': 'liquid',
+             'dispense': 'liquid',
+             'blow_out': 'liquid',
+             'touch_tip': 'liquid',
+             'pick_up_tip': 'tips',
+             'drop_tip': 'tips',
+             'delay': 'delay',
+             'engage': 'module',
+             'disengage': 'module',
+             'home': 'other'}
+
+
+def travel_time(start, end, safe_z=None):
+    """Time to move the gantry from `start` to `end`.
+
+    With `safe_z` the pipette rises to that height before moving in XY,
+    otherwise it just clears the higher of the two points.
+    """
+    if start is None or end is None or start == end:
+        return(0.0)
+    top = safe_z if safe_z is not None else max(start[2], end[2])
+    rise = max(top - start[2], 0)
+    fall = max(top - end[2], 0)
+    xy = math.hypot(end[0] - start[0], end[1] - start[1])
+    return(MOVE_OVERHEAD + (rise + fall)/Z_SPEED + xy/XY_SPEED)
+
+
+def command_time(event):
+    """Time spent executing a leaf command once the pipette is in place."""
+    name = event['name']
+    if name in ('aspirate', 'dispense'):
+        flow = event.get('flow_rate')
+        if not flow:
+            return(0.0)
+        return(event.get('volume', 0)/flow)
+    if name == 'delay':
+        return(float(event.get('seconds', 0)))
+    return(FIXED_COSTS.get(name, 0.0))
+
+
+def _category(event, parents):
+    name = event['name']
+    if name in ('aspirate', 'dispense') and 'mix' in parents:
+        return('mix')
+    return(_CATEGORY.get(name, 'other'))
+
+
+def moves(events):
+    """Yield `(index, start, end, safe_z)` for each leaf command that moves.
+
+    Moves between labware arc over the tallest point seen in the run;
+    moves within a labware just clear the higher of the two well tops.
+    """
+    points = [e['point'] for e in events if e.get('point')]
+    arc = (max(p[2] for p in points) + ARC_CLEARANCE) if points else None
+
+    position = None
+    labware = None
+    for i, event in enumerate(events):
+        point = event.get('point')
+        if point is None or not event.get('leaf', True):
+            continue
+        here = (event.get('slot'), event.get('labware'))
+        if here == labware and position is not None:
+            safe_z = max(position[2], point[2]) + WELL_CLEARANCE
+        else:
+            safe_z = arc
+        yield i, position, point, safe_z
+        position = point
+        labware = here
+
+
+def costs(events):
+    """Yield `(index, {category: seconds})` for each leaf command.
+
+    Travel is charged to the command at the end of the move.
+    """
+    travel = {i: travel_time(start, end, safe_z=safe_z)
+              for i, start, end, safe_z in moves(events)}
+    stack = []
+
+    for i, event in enumerate(events):
+        del stack[event['depth']:]
+        stack.append(event['name'])
+        if not event.get('leaf', True):
+            continue
+
+        cost = {}
+        if i in travel:
+            cost['travel'] = travel[i]
+        category = _category(event, stack[:-1])
+        cost[category] = cost.get(category, 0.0) + command_time(event)
+        yield i, cost
+
+
+def estimate(events):
+    """Estimate the run time of a captured protocol, in seconds.
+
+    Returns a dict with the total, a breakdown by category, a breakdown
+    by step (the most recent `protocol.comment()`) and the pauses that
+    will wait for an operator.
+    """
+    totals = dict.fromkeys(CATEGORIES, 0.0)
+    steps = {}
+    pauses = [e.get('message') or e['text'] for e in events
+              if e['name'] == 'pause']
+
+    for i, cost in costs(events):
+        step = steps.setdefault(events[i].get('step'),
+                                dict.fromkeys(CATEGORIES, 0.0))
+        for category, seconds in cost.items():
+            totals[category] += seconds
+            step[category] += seconds
+
+    return({'total': sum(totals.values()),
+            'categories': totals,
+            'steps': steps,
+            'pauses': pauses})
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return('{0:d}:{1:02d}:{2:02d}'.format(hours, minutes, seconds))
+
+
+def format_estimate(name, result):
+    """Render an estimate as a plain-text table."""
+    header = '{0:<40}'.format('step') + ''.join(
+        '{0:>9}'.format(c) for c in CATEGORIES + ['total'])
+    lines = [name, '=' * len(name), header]
+    rows = list(result['steps'].items()) + [('TOTAL',
+                                             result['categories'])]
+    for step, times in rows:
+        label = (step or '(setup)')[:39]
+        cells = [times[c] for c in CATEGORIES] + [sum(times.values())]
+        lines.append('{0:<40}'.format(label) + ''.join(
+            '{0:>9}'.format(format_duration(c)) for c in cells))
+    lines.append('Estimated robot time: {0}'.format(
+        format_duration(result['total'])))
+    if result['pauses']:
+        lines.append('Plus {0} operator pause(s).'.format(
+            len(result['pauses'])))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    from .config import add_arguments, load_configured, load_overrides
+    from .mock import dry_run
+    from .plan import is_plan
+    from .simulate import simulate
+
+    parser = argparse.ArgumentParser(
+        description='Estimate the OT-2 run time of protocols.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--json', action='store_true',
+                        help='print estimates as JSON')
+    parser.add_argument('--mock', action='store_true',
+                        help='dry-run against the mock ProtocolContext '
+                             'instead of the opentrons simulator')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    run = dry_run if args.mock else simulate
+
+    results = {}
+    for protocol in args.protocols:
+        module = None
+        try:
+            if not is_plan(protocol):
+                module = load_configured(protocol, load_overrides(
+                    protocol, args.config, args.settings), mock=args.mock)
+        except ValueError as e:
+            sys.exit('{0}: {1}'.format(protocol, e))
+        events = run(protocol, labware_dir=args.custom_labware,
+                     module=module)
+        results[protocol] = estimate(events)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print('\n\n'.join(format_estimate(p, r) for p, r in results.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""Propose deck layouts that cut gantry travel.
+
+A protocol is run once (in the simulator or on the mock context) to record
+where every command goes. Moving a labware to another slot shifts all of
+its points by the distance between the two slots, so any other layout can
+be scored against the same access pattern without running the protocol
+again. A local search over slot swaps then looks for the layout with the
+least travel time, subject to
+
+- the fixed trash staying in slot 12
+- modules staying in slots that take modules (`MODULE_SLOTS`)
+- any slots pinned with `--fixed`
+
+Labware on a module moves with its module.
+
+Usage:
+
+    python -m Tools.layout Library_Prep/Hackflex/hackflex.py
+"""
+import argparse
+import json
+import random
+import sys
+
+from . import LABWARE_DIR
+from .estimate import format_duration, moves, travel_time
+
+# OT-2 slot origins, mm; every slot sits at deck height
+SLOT_ORIGINS = {str(i + 1): (132.5*(i % 3), 90.5*(i // 3))
+                for i in range(12)}
+
+# slots that can hold a magnetic or temperature module
+MODULE_SLOTS = {'1', '3', '4', '6', '7', '9', '10'}
+
+USABLE_SLOTS = [str(s) for s in range(1, 12)]
+
+
+def plan_deck(plan):
+    """The events and deck map of a compiled plan, as `capture()`."""
+    from .mock import MODULES, TRASH
+    from .plan import plan_events
+
+    auto = {slot for pipette in plan['pipettes'].values()
+            for slot in pipette['tip_racks']}
+    deck = {'12': {'name': TRASH, 'module': False, 'auto_tips': False}}
+    for slot, entry in plan['deck'].items():
+        name = entry.get('label', entry.get('labware', ''))
+        if entry.get('module'):
+            name = '{0} ({1})'.format(MODULES[entry['module']][0],
+                                      name or 'empty')
+        deck[slot] = {'name': name,
+                      'module': bool(entry.get('module')),
+                      'auto_tips': slot in auto}
+    return(plan_events(plan), deck)
+
+
+def capture(path, labware_dir=LABWARE_DIR, mock=False):
+    """Run a protocol; returns its events and what sits in each slot.
+
+    The deck map is {slot: {'name': ..., 'module': bool, 'auto_tips':
+    bool}}; `auto_tips` marks racks in a pipette's `tip_racks`. A compiled
+    plan (see `Tools.plan`) gives its commands and deck without being run.
+    """
+    from .plan import is_plan, load_plan
+    from .simulate import finish_events
+
+    if is_plan(path):
+        return(plan_deck(load_plan(path)))
+    if mock:
+        from .mock import MockProtocolContext, load_mock_protocol
+        module = load_mock_protocol(path)
+        context = MockProtocolContext(
+            module.metadata.get('apiLevel', '2.5'), labware_dir=labware_dir)
+        module.run(context)
+        events = finish_events(context.events)
+    else:
+        from opentrons.simulate import get_protocol_api
+        from .simulate import capture as capture_events
+        from .simulate import custom_labware, load_protocol
+        module = load_protocol(path)
+        context = get_protocol_api(module.metadata['apiLevel'],
+                                   extra_labware=custom_labware(labware_dir))
+        with capture_events(context) as events:
+            module.run(context)
+
+    # racks the pipettes pick from on their own, with pick_up_tip()
+    auto = [rack for pipette in context.loaded_instruments.values()
+            if pipette is not None for rack in pipette.tip_racks]
+
+    deck = {}
+    for slot, labware in context.loaded_labwares.items():
+        deck[str(slot)] = {'name': str(getattr(labware, 'name', labware)),
+                           'module': False,
+                           'auto_tips': any(labware is r for r in auto)}
+    for slot, loaded in context.loaded_modules.items():
+        entry = deck.setdefault(str(slot), {'name': ''})
+        entry['module'] = True
+        entry['name'] = '{0} ({1})'.format(
+            getattr(loaded.geometry, 'display_name', 'module'),
+            entry['name'] or 'empty')
+    return(events, deck)
+
+
+def access_pattern(events):
+    """The moves between slots, as (from slot, from xyz, to slot, to xyz,
+    safe z) with points relative to their slot origin.
+
+    Moves within a slot cost the same wherever the slot is, so they are
+    left out.
+    """
+    pattern = []
+    previous = None
+    for i, start, end, safe_z in moves(events):
+        slot = events[i].get('slot')
+        if start is not None and previous != slot and \
+                previous in SLOT_ORIGINS and slot in SLOT_ORIGINS:
+            pattern.append((previous, _relative(start, previous),
+                            slot, _relative(end, slot), safe_z))
+        previous = slot
+    return(pattern)
+
+
+def _relative(point, slot):
+    x, y = SLOT_ORIGINS[slot]
+    return((point[0] - x, point[1] - y, point[2]))
+
+
+def _absolute(point, slot):
+    x, y = SLOT_ORIGINS[slot]
+    return((point[0] + x, point[1] + y, point[2]))
+
+
+def travel_seconds(pattern, layout=None):
+    """Travel time of the access pattern with slots moved per `layout`."""
+    layout = layout or {}
+    total = 0.0
+    for a, start, b, end, safe_z in pattern:
+        total += travel_time(_absolute(start, layout.get(a, a)),
+                             _absolute(end, layout.get(b, b)), safe_z)
+    return(total)
+
+
+def _allowed(item, slot, deck, fixed):
+    if item in fixed:
+        return(slot == item)
+    if deck.get(item, {}).get('module'):
+        return(slot in MODULE_SLOTS)
+    return(True)
+
+
+def optimize(pattern, deck, fixed=(), restarts=5, seed=0):
+    """Search for the layout with the least travel.
+
+    Returns ({original slot: new slot}, travel seconds); the trash is left
+    out.
+    """
+    fixed = set(fixed) | {'12'}
+    items = [s for s in USABLE_SLOTS if s in deck and s not in fixed]
+    rng = random.Random(seed)
+
+    def search(layout):
+        cost = travel_seconds(pattern, layout)
+        improved = True
+        while improved:
+            improved = False
+            for item in items:
+                for slot in USABLE_SLOTS:
+                    if slot == layout[item] or \
+                            not _allowed(item, slot, deck, fixed):
+                        continue
+                    # swap with whatever is in `slot`, if anything
+                    other = next((i for i in items if layout[i] == slot),
+                                 None)
+                    if other is None and slot in fixed:
+                        continue
+                    if other is not None and \
+                            not _allowed(other, layout[item], deck, fixed):
+                        continue
+                    candidate = dict(layout)
+                    candidate[item] = slot
+                    if other is not None:
+                        candidate[other] = layout[item]
+                    candidate_cost = travel_seconds(pattern, candidate)
+                    if candidate_cost < cost - 1e-9:
+                        layout, cost = candidate, candidate_cost
+                        improved = True
+        return(layout, cost)
+
+    best = search({item: item for item in items})
+    for _ in range(restarts):
+        start = _shuffled(items, deck, fixed, rng)
+        if start is None:
+            continue
+        found = search(start)
+        if found[1] < best[1]:
+            best = found
+    layout, cost = best
+    layout.update({s: s for s in deck if s in fixed and s != '12'})
+    return(layout, cost)
+
+
+def _shuffled(items, deck, fixed, rng):
+    # a random layout that respects the constraints, if one turns up
+    free = [s for s in USABLE_SLOTS if s not in fixed]
+    for _ in range(100):
+        slots = rng.sample(free, len(items))
+        layout = dict(zip(items, slots))
+        if all(_allowed(i, s, deck, fixed) for i, s in layout.items()):
+            return(layout)
+    return(None)
+
+
+def format_layout(name, deck, layout, before, after):
+    lines = [name, '=' * len(name)]
+    for item in sorted(layout, key=int):
+        if layout[item] != item:
+            lines.append('  slot {0:>2} -> {1:>2}  {2}'.format(
+                item, layout[item], deck[item]['name']))
+    if len(lines) == 2:
+        lines.append('  the current layout is already the best found')
+    lines.append('Travel time: {0} -> {1} (saves {2})'.format(
+        format_duration(before), format_duration(after),
+        format_duration(before - after)))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Propose deck layouts that minimise gantry travel.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--fixed', nargs='*', default=[],
+                        help='slots whose contents must not move')
+    parser.add_argument('--restarts', type=int, default=5,
+                        help='random restarts of the local search')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for protocol in args.protocols:
+        events, deck = capture(protocol, args.custom_labware, args.mock)
+        pattern = access_pattern(events)
+        before = travel_seconds(pattern)
+        layout, after = optimize(pattern, deck, args.fixed, args.restarts)
+        if args.json:
+            results[protocol] = {'layout': layout, 'deck': deck,
+                                 'travel_before': before,
+                                 'travel_after': after}
+        else:
+            print(format_layout(protocol, deck, layout, before, after))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,929 @@
+"""A lightweight stand-in for the Opentrons ProtocolContext.
+
+`opentrons_simulate` imports the whole opentrons stack and spins up a
+simulated hardware controller before a protocol does anything useful. For
+quick dry runs that is overkill: the protocols here only touch a small part
+of the API. `MockProtocolContext` implements that part in plain Python and
+records every command as the same event dicts that `Tools.simulate`
+captures, so the estimator and the other tools work on either.
+
+Labware geometry comes from the JSON definitions: the custom definitions in
+`Labware/custom_labware`, and the standard ones shipped with opentrons when
+it is installed (they are read as files; opentrons itself is not imported).
+Without them, geometry is approximated from the load name.
+
+While a protocol module is imported, a small stand-in `opentrons` package
+serves its `from opentrons import protocol_api` style imports.
+
+Usage:
+
+    python -m Tools.mock Library_Prep/Hackflex/hackflex.py
+"""
+import argparse
+import contextlib
+import glob
+import importlib.util
+import json
+import math
+import os
+import re
+import sys
+import types
+from collections import namedtuple
+
+from . import LABWARE_DIR
+from .simulate import (engage_heights, finish_events, load_protocol,
+                       make_event)
+
+Point = namedtuple('Point', ['x', 'y', 'z'])
+
+
+class Location(namedtuple('Location', ['point', 'labware'])):
+    def move(self, point):
+        return(Location(Point(self.point.x + point.x,
+                              self.point.y + point.y,
+                              self.point.z + point.z),
+                        self.labware))
+
+
+# front-left corner of each OT-2 deck slot, mm
+SLOTS = {str(i + 1): Point(132.5*(i % 3), 90.5*(i // 3), 0)
+         for i in range(12)}
+
+TRASH = 'opentrons_1_trash_1100ml_fixed'
+
+# name: (max volume, channels, aspirate, dispense, blow out flow rates)
+PIPETTES = {'p10_single': (10, 1, 5, 10, 1000),
+            'p10_multi': (10, 8, 5, 10, 1000),
+            'p50_single': (50, 1, 25, 50, 1000),
+            'p50_multi': (50, 8, 25, 50, 1000),
+            'p300_single': (300, 1, 150, 300, 1000),
+            'p300_multi': (300, 8, 150, 300, 1000),
+            'p1000_single': (1000, 1, 500, 1000, 1000),
+            'p20_single_gen2': (20, 1, 7.56, 7.56, 7.56),
+            'p20_multi_gen2': (20, 8, 7.6, 7.6, 7.6),
+            'p300_single_gen2': (300, 1, 92.86, 92.86, 92.86),
+            'p300_multi_gen2': (300, 8, 94, 94, 94),
+            'p1000_single_gen2': (1000, 1, 274.7, 274.7, 274.7)}
+
+# labware offset on each module, mm
+MODULES = {'magdeck': ('Magnetic Module GEN1', Point(0.125, -0.125, 82.25)),
+           'tempdeck': ('Temperature Module GEN1', Point(-0.15, -0.15, 80.09))}
+
+_MODULE_NAMES = {'magnetic module': 'magdeck',
+                 'magnetic module gen1': 'magdeck',
+                 'magnetic module gen2': 'magdeck',
+                 'magdeck': 'magdeck',
+                 'temperature module': 'tempdeck',
+                 'temperature module gen1': 'tempdeck',
+                 'temperature module gen2': 'tempdeck',
+                 'tempdeck': 'tempdeck'}
+
+
+def _standard_labware_dirs():
+    dirs = []
+    for package, sub in (('opentrons_shared_data',
+                          ('data', 'labware', 'definitions', '2')),
+                         ('opentrons',
+                          ('shared_data', 'labware', 'definitions', '2'))):
+        try:
+            spec = importlib.util.find_spec(package)
+        except (ImportError, ValueError):
+            spec = None
+        for location in getattr(spec, 'submodule_search_locations',
+                                None) or []:
+            path = os.path.join(location, *sub)
+            if os.path.isdir(path):
+                dirs.append(path)
+    return(dirs)
+
+
+_definitions = {}
+
+
+def _custom_definitions(labware_dir):
+    if labware_dir not in _definitions:
+        found = {}
+        for fp in glob.glob(os.path.join(labware_dir or '', '*.json')):
+            with open(fp) as f:
+                definition = json.load(f)
+            found[definition['parameters']['loadName']] = definition
+        _definitions[labware_dir] = found
+    return(_definitions[labware_dir])
+
+
+def _standard_definition(load_name):
+    key = ('standard', load_name)
+    if key not in _definitions:
+        _definitions[key] = None
+        for path in _standard_labware_dirs():
+            versions = glob.glob(os.path.join(path, load_name, '*.json'))
+            if versions:
+                latest = max(versions, key=lambda v: int(
+                    os.path.splitext(os.path.basename(v))[0]))
+                with open(latest) as f:
+                    _definitions[key] = json.load(f)
+                break
+    return(_definitions[key])
+
+
+# (rows, columns, x pitch, y pitch) by well count
+_LAYOUTS = {1: (1, 1, 0, 0),
+            6: (2, 3, 39, 39),
+            12: (1, 12, 9, 0),
+            24: (4, 6, 19.3, 19.3),
+            48: (6, 8, 13, 13),
+            96: (8, 12, 9, 9),
+            384: (16, 24, 4.5, 4.5)}
+
+
+def approximate_definition(load_name):
+    """A rough labware definition guessed from its load name."""
+    counts = [int(n) for n in re.findall(r'_(\d+)_', '_' + load_name + '_')
+              if int(n) in _LAYOUTS]
+    rows, columns, x_pitch, y_pitch = _LAYOUTS[counts[0] if counts else 96]
+
+    volume = re.search(r'(\d+(?:\.\d+)?)(ul|ml)', load_name)
+    volume = (float(volume.group(1)) * (1000 if volume.group(2) == 'ml'
+                                        else 1)) if volume else 200
+    tiprack = 'tiprack' in load_name
+    if 'trash' in load_name:
+        height = 82
+    elif tiprack:
+        height = 64.5 if volume <= 300 else 97.5
+    elif 'tuberack' in load_name:
+        height = 79
+    elif 'reservoir' in load_name:
+        height = 31.4 if volume <= 22000 else 44.4
+    elif volume >= 500:
+        height = 41.8
+    else:
+        height = 16
+    depth = height - 2
+    diameter = min(x_pitch or 8, y_pitch or 8) * 0.75 or 8
+
+    ordering = []
+    wells = {}
+    for c in range(columns):
+        column = []
+        for r in range(rows):
+            name = '{0}{1}'.format(chr(ord('A') + r), c + 1)
+            column.append(name)
+            wells[name] = {'depth': depth,
+                           'totalLiquidVolume': volume,
+                           'shape': 'circular',
+                           'diameter': diameter,
+                           'x': 14.4 + c*x_pitch if columns > 1 else 63.9,
+                           'y': 74.2 - r*y_pitch if rows > 1 else 42.9,
+                           'z': height - depth}
+        ordering.append(column)
+
+    parameters = {'loadName': load_name, 'isTiprack': tiprack,
+                  'format': {96: '96Standard', 384: '384Standard'}.get(
+                      rows*columns, 'irregular')}
+    if tiprack:
+        parameters['tipLength'] = height - 5
+    return({'ordering': ordering,
+            'wells': wells,
+            'parameters': parameters,
+            'metadata': {'displayName': load_name},
+            'dimensions': {'xDimension': 127.76,
+                           'yDimension': 85.48,
+                           'zDimension': height},
+            'cornerOffsetFromSlot': {'x': 0, 'y': 0, 'z': 0},
+            'namespace': 'approximate',
+            'version': 1})
+
+
+def labware_definition(load_name, labware_dir=LABWARE_DIR):
+    custom = _custom_definitions(labware_dir)
+    if load_name in custom:
+        return(custom[load_name])
+    return(_standard_definition(load_name) or
+           approximate_definition(load_name))
+
+
+class MockWell():
+    def __init__(self, labware, name, geometry):
+        self.parent = labware
+        self.well_name = name
+        self._geometry = geometry
+        self._bottom = labware._origin.move(Point(geometry['x'],
+                                                  geometry['y'],
+                                                  geometry['z'])).point
+
+    @property
+    def max_volume(self):
+        return(self._geometry['totalLiquidVolume'])
+
+    @property
+    def depth(self):
+        return(self._geometry['depth'])
+
+    @property
+    def diameter(self):
+        return(self._geometry.get('diameter'))
+
+    @property
+    def display_name(self):
+        return('{0} of {1}'.format(self.well_name, self.parent))
+
+    def bottom(self, z=0.0):
+        return(Location(Point(self._bottom.x, self._bottom.y,
+                              self._bottom.z + z), self))
+
+    def top(self, z=0.0):
+        return(self.bottom(self.depth + z))
+
+    def center(self):
+        return(self.bottom(self.depth/2))
+
+    def __str__(self):
+        return(self.display_name)
+
+    __repr__ = __str__
+
+
+class MockLabware():
+    def __init__(self, definition, parent, label=None, origin=None):
+        self._definition = definition
+        self.parent = parent
+        self.name = label or definition['parameters']['loadName']
+        self.load_name = definition['parameters']['loadName']
+        self._display = label or definition['metadata']['displayName']
+        corner = definition.get('cornerOffsetFromSlot',
+                                {'x': 0, 'y': 0, 'z': 0})
+        self._origin = Location(origin, self).move(Point(corner['x'],
+                                                         corner['y'],
+                                                         corner['z']))
+        self._wells = [MockWell(self, name, definition['wells'][name])
+                       for column in definition['ordering']
+                       for name in column]
+        self._by_name = {w.well_name: w for w in self._wells}
+
+    @property
+    def parameters(self):
+        return(self._definition['parameters'])
+
+    @property
+    def is_tiprack(self):
+        return(self.parameters.get('isTiprack', False))
+
+    @property
+    def tip_length(self):
+        return(self.parameters.get('tipLength'))
+
+    @property
+    def highest_z(self):
+        return(self._origin.point.z +
+               self._definition['dimensions']['zDimension'])
+
+    def wells(self, *args):
+        if args:
+            return([self._by_name[a] for a in args])
+        return(list(self._wells))
+
+    def wells_by_name(self):
+        return(dict(self._by_name))
+
+    wells_by_index = wells_by_name
+
+    def well(self, idx):
+        if isinstance(idx, int):
+            return(self._wells[idx])
+        return(self._by_name[idx])
+
+    def columns(self, *args):
+        columns = [[self._by_name[n] for n in column]
+                   for column in self._definition['ordering']]
+        if args:
+            return([columns[int(a) - 1] if isinstance(a, str) else
+                    columns[a] for a in args])
+        return(columns)
+
+    def rows(self, *args):
+        rows = [list(r) for r in zip(*self.columns())]
+        if args:
+            return([rows[ord(a) - ord('A')] if isinstance(a, str) else
+                    rows[a] for a in args])
+        return(rows)
+
+    def columns_by_name(self):
+        return({str(i + 1): c for i, c in enumerate(self.columns())})
+
+    def rows_by_name(self):
+        return({chr(ord('A') + i): r for i, r in enumerate(self.rows())})
+
+    def __getitem__(self, name):
+        return(self._by_name[name])
+
+    def __str__(self):
+        return('{0} on {1}'.format(self._display, self.parent))
+
+    __repr__ = __str__
+
+
+class MockModuleGeometry():
+    def __init__(self, display_name, slot):
+        self.parent = slot
+        self.display_name = display_name
+
+    def __str__(self):
+        return('{0} on {1}'.format(self.display_name, self.parent))
+
+
+class MockModule():
+    def __init__(self, ctx, model, slot):
+        self._ctx = ctx
+        display_name, self._offset = MODULES[model]
+        self.geometry = MockModuleGeometry(display_name, slot)
+        self.labware = None
+        self.status = 'disengaged' if model == 'magdeck' else 'idle'
+
+    @property
+    def parent(self):
+        return(self.geometry.parent)
+
+    def load_labware(self, name, label=None, namespace=None, version=None):
+        origin = Point(*(a + b for a, b in zip(SLOTS[self.parent],
+                                               self._offset)))
+        self.labware = MockLabware(
+            labware_definition(name, self._ctx._labware_dir),
+            self.geometry, label, origin)
+        self._ctx._labware.append(self.labware)
+        return(self.labware)
+
+    load_labware_by_name = load_labware
+
+
+class MockMagneticModule(MockModule):
+    def engage(self, height=None, offset=None, height_from_base=None):
+        with self._ctx._command('magdeck_engage',
+                                {'text': 'Engaging Magnetic Module'},
+                                engage_heights(height, offset,
+                                               height_from_base)):
+            self.status = 'engaged'
+
+    def disengage(self):
+        with self._ctx._command('magdeck_disengage',
+                                {'text': 'Disengaging Magnetic Module'}):
+            self.status = 'disengaged'
+
+    def calibrate(self):
+        pass
+
+
+class MockTemperatureModule(MockModule):
+    def set_temperature(self, celsius):
+        with self._ctx._command('tempdeck_set_temp', {
+                'text': 'Setting Temperature Module temperature '
+                        'to {0} °C'.format(celsius)}):
+            self.target = celsius
+
+    def deactivate(self):
+        with self._ctx._command('tempdeck_deactivate', {
+                'text': 'Deactivating Temperature Module'}):
+            self.target = None
+
+
+class FlowRates():
+    def __init__(self, aspirate, dispense, blow_out):
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+
+
+def _flatten(locations):
+    if isinstance(locations, Location) or \
+            not isinstance(locations, (list, tuple)):
+        return([locations])
+    flat = []
+    for item in locations:
+        flat.extend(_flatten(item))
+    return(flat)
+
+
+def _describe(locations):
+    names = [str(getattr(loc, 'labware', loc)) for loc in _flatten(locations)]
+    return(names[0] if len(names) == 1 else '[{0}]'.format(', '.join(names)))
+
+
+def _well(location):
+    # the well a Location or Well refers to, if any
+    if isinstance(location, MockWell):
+        return(location)
+    labware = getattr(location, 'labware', None)
+    return(labware if isinstance(labware, MockWell) else None)
+
+
+class MockInstrumentContext():
+    def __init__(self, ctx, name, mount, tip_racks):
+        self._ctx = ctx
+        self.name = name
+        self.mount = mount
+        (self.max_volume, self.channels,
+         aspirate, dispense, blow_out) = PIPETTES[name]
+        self.min_volume = self.max_volume/10 if self.max_volume < 1000 \
+            else 100
+        self.flow_rate = FlowRates(aspirate, dispense, blow_out)
+        self.tip_racks = list(tip_racks or [])
+        self.trash_container = ctx.fixed_trash
+        self.current_volume = 0
+        self.has_tip = False
+        self.default_speed = 400
+        self.starting_tip = None
+        self._tip = None
+
+    def __str__(self):
+        return('{0} on {1} mount'.format(self.name, self.mount))
+
+    def _payload(self, text, **kwargs):
+        kwargs['text'] = text
+        kwargs['instrument'] = self
+        return(kwargs)
+
+    def _resolve(self, location, top=False):
+        if location is None:
+            return(self._ctx.location_cache)
+        if isinstance(location, MockWell):
+            return(location.top() if top else location.bottom(1))
+        return(location)
+
+    def _next_tip(self):
+        for rack in self.tip_racks:
+            for column in rack.columns():
+                if self.channels > 1:
+                    if not any(w in self._ctx._used_tips for w in column):
+                        return(column[0])
+                else:
+                    for well in column:
+                        if well not in self._ctx._used_tips:
+                            return(well)
+        raise RuntimeError('{0} has run out of tips'.format(self))
+
+    def _tip_wells(self, well):
+        if self.channels == 1:
+            return([well])
+        column = [c for c in well.parent.columns() if well in c][0]
+        return(column[column.index(well):][:self.channels])
+
+    def _move(self, location):
+        self._ctx.location_cache = location
+
+    def pick_up_tip(self, location=None, presses=None, increment=None):
+        if location is None:
+            well = self._next_tip()
+        else:
+            well = _well(location)
+        location = well.top()
+        with self._ctx._command('pick_up_tip', self._payload(
+                'Picking up tip from {0}'.format(well), location=location)):
+            self._move(location)
+            self._ctx._used_tips.update(self._tip_wells(well))
+            self.has_tip = True
+            self._tip = well
+        return(self)
+
+    def drop_tip(self, location=None, home_after=True):
+        if location is None:
+            location = self.trash_container.wells()[0].top()
+        elif isinstance(location, MockWell):
+            location = location.top()
+        with self._ctx._command('drop_tip', self._payload(
+                'Dropping tip into {0}'.format(location.labware),
+                location=location)):
+            self._move(location)
+            self.has_tip = False
+            self.current_volume = 0
+            self._tip = None
+        return(self)
+
+    def return_tip(self, home_after=True):
+        if self._tip is None:
+            raise RuntimeError('{0} has no tip to return'.format(self))
+        with self._ctx._command('return_tip',
+                                self._payload('Returning tip')):
+            self.drop_tip(self._tip)
+        return(self)
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        if not self.has_tip:
+            raise RuntimeError('Cannot aspirate without a tip attached')
+        location = self._resolve(location)
+        if volume is None or volume == 0:
+            volume = self.max_volume - self.current_volume
+        if self.current_volume + volume > self.max_volume + 1e-6:
+            raise RuntimeError(
+                'Cannot aspirate {0} uL with {1} uL already in a {2}'.format(
+                    volume, self.current_volume, self.name))
+        flow = self.flow_rate.aspirate * rate
+        with self._ctx._command('aspirate', self._payload(
+                'Aspirating {0} uL from {1} at {2} uL/sec'.format(
+                    float(volume), location.labware, flow),
+                volume=volume, location=location, rate=rate)):
+            self._move(location)
+            self.current_volume += volume
+        return(self)
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        location = self._resolve(location)
+        if volume is None or volume == 0:
+            volume = self.current_volume
+        flow = self.flow_rate.dispense * rate
+        with self._ctx._command('dispense', self._payload(
+                'Dispensing {0} uL into {1} at {2} uL/sec'.format(
+                    float(volume), location.labware, flow),
+                volume=volume, location=location, rate=rate)):
+            self._move(location)
+            self.current_volume = max(self.current_volume - volume, 0)
+        return(self)
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        if volume is None or volume == 0:
+            volume = self.max_volume
+        with self._ctx._command('mix', self._payload(
+                'Mixing {0} times with a volume of {1} ul'.format(
+                    repetitions, float(volume)),
+                volume=volume, location=self._resolve(location),
+                repetitions=repetitions)):
+            self.aspirate(volume, location, rate=rate)
+            for _ in range(repetitions - 1):
+                self.dispense(volume, rate=rate)
+                self.aspirate(volume, rate=rate)
+            self.dispense(volume, rate=rate)
+        return(self)
+
+    def blow_out(self, location=None):
+        location = self._resolve(location, top=True)
+        with self._ctx._command('blow_out', self._payload(
+                'Blowing out at {0}'.format(location.labware),
+                location=location)):
+            self._move(location)
+            self.current_volume = 0
+        return(self)
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0,
+                  speed=60.0):
+        well = _well(self._resolve(location))
+        location = well.top(v_offset) if well else self._resolve(location)
+        with self._ctx._command('touch_tip', self._payload(
+                'Touching tip', location=location)):
+            self._move(location)
+        return(self)
+
+    def air_gap(self, volume=None, height=None):
+        well = _well(self._ctx.location_cache)
+        with self._ctx._command('air_gap', self._payload('Air gap')):
+            if well is not None:
+                self.move_to(well.top(height or 5))
+            self.aspirate(volume)
+        return(self)
+
+    def move_to(self, location, force_direct=False, minimum_z_height=None,
+                speed=None):
+        with self._ctx._command('move_to', self._payload(
+                'Moving to {0}'.format(location.labware),
+                location=location)):
+            self._move(location)
+        return(self)
+
+    def home(self):
+        with self._ctx._command('home', {
+                'text': 'Homing pipette plunger on mount {0}'.format(
+                    self.mount)}):
+            pass
+        return(self)
+
+    def reset_tipracks(self):
+        for rack in self.tip_racks:
+            self._ctx._used_tips.difference_update(rack.wells())
+
+    def _capacity(self):
+        tip = self.tip_racks[0].wells()[0].max_volume if self.tip_racks \
+            else self.max_volume
+        return(min(self.max_volume, tip))
+
+    def _first_row(self, locations, what):
+        # like opentrons' TransferPlan, a multichannel only visits the
+        # wells its first tip reaches (rows A and B of a 384-well plate)
+        locations = _flatten(locations)
+        if self.channels == 1:
+            return(locations)
+        kept = []
+        for location in locations:
+            well = _well(location)
+            if well is None:
+                kept.append(location)
+                continue
+            rows = 2 if well.parent.parameters.get('format') == \
+                '384Standard' else 1
+            if any(well in row for row in well.parent.rows()[:rows]):
+                kept.append(location)
+        if not kept:
+            raise RuntimeError('Invalid {0} for multichannel transfer: '
+                               '{1}'.format(what, _describe(locations)))
+        return(kept)
+
+    def _pairs(self, volume, source, dest):
+        sources = self._first_row(source, 'source')
+        dests = self._first_row(dest, 'target')
+        if len(sources) == 1:
+            sources = sources*len(dests)
+        if len(dests) == 1:
+            dests = dests*len(sources)
+        if len(sources) != len(dests):
+            raise ValueError('Source and destination lists must be the '
+                             'same length, or one of them a single well')
+        volumes = volume if isinstance(volume, (list, tuple)) \
+            else [volume]*len(sources)
+        return(list(zip(volumes, sources, dests)))
+
+    def _tip_step(self, new_tip, trash, first):
+        # tip handling before each transfer step
+        if new_tip == 'always' or (new_tip == 'once' and first):
+            if self.has_tip and new_tip == 'always':
+                self._finish_tip(trash)
+            self.pick_up_tip()
+
+    def _finish_tip(self, trash):
+        if trash:
+            self.drop_tip()
+        else:
+            self.return_tip()
+
+    def transfer(self, volume, source, dest, **kwargs):
+        new_tip = kwargs.get('new_tip', 'once')
+        trash = kwargs.get('trash', True)
+        air_gap = kwargs.get('air_gap', 0)
+        mix_before = kwargs.get('mix_before')
+        mix_after = kwargs.get('mix_after')
+        rate = kwargs.get('rate', 1.0)
+        capacity = self._capacity() - air_gap
+        pairs = self._pairs(volume, source, dest)
+
+        with self._ctx._command('transfer', self._payload(
+                'Transferring {0} from {1} to {2}'.format(
+                    volume, _describe(source), _describe(dest)),
+                volume=volume)):
+            first = True
+            for vol, src, dst in pairs:
+                chunks = max(int(math.ceil(vol/capacity)), 1)
+                for _ in range(chunks):
+                    self._tip_step(new_tip, trash, first)
+                    first = False
+                    if mix_before:
+                        self.mix(mix_before[0], mix_before[1], src)
+                    self.aspirate(vol/chunks, src, rate=rate)
+                    if air_gap:
+                        self.air_gap(air_gap)
+                    self.dispense(vol/chunks + air_gap, dst, rate=rate)
+                    if mix_after:
+                        self.mix(mix_after[0], mix_after[1], dst)
+                    if kwargs.get('blow_out'):
+                        self.blow_out()
+                    if kwargs.get('touch_tip'):
+                        self.touch_tip()
+            if new_tip != 'never' and self.has_tip:
+                self._finish_tip(trash)
+        return(self)
+
+    def distribute(self, volume, source, dest, **kwargs):
+        new_tip = kwargs.get('new_tip', 'once')
+        trash = kwargs.get('trash', True)
+        disposal = kwargs.get('disposal_volume', self.min_volume)
+        mix_before = kwargs.get('mix_before')
+        rate = kwargs.get('rate', 1.0)
+        source = self._first_row(source, 'source')[0]
+        dests = self._first_row(dest, 'target')
+        per_aspirate = max(int((self._capacity() - disposal)//volume), 1)
+
+        with self._ctx._command('distribute', self._payload(
+                'Distributing {0} from {1} to {2}'.format(
+                    volume, _describe(source), _describe(dest)),
+                volume=volume)):
+            first = True
+            for i in range(0, len(dests), per_aspirate):
+                batch = dests[i:i + per_aspirate]
+                self._tip_step(new_tip, trash, first)
+                first = False
+                if mix_before:
+                    self.mix(mix_before[0], mix_before[1], source)
+                self.aspirate(volume*len(batch) + disposal, source,
+                              rate=rate)
+                if kwargs.get('touch_tip'):
+                    self.touch_tip()
+                for dst in batch:
+                    self.dispense(volume, dst, rate=rate)
+                    if kwargs.get('touch_tip'):
+                        self.touch_tip()
+                if disposal:
+                    self.blow_out(self.trash_container.wells()[0])
+            if new_tip != 'never' and self.has_tip:
+                self._finish_tip(trash)
+        return(self)
+
+    def consolidate(self, volume, source, dest, **kwargs):
+        kwargs.setdefault('new_tip', 'once')
+        return(self.transfer(volume, source, dest, **kwargs))
+
+
+class MockProtocolContext():
+    """Records the commands a protocol issues, without opentrons.
+
+    Events are collected in `events`, or passed one at a time to
+    `listener` when one is given.
+    """
+
+    def __init__(self, api_version='2.5', labware_dir=LABWARE_DIR,
+                 listener=None):
+        self.api_version = api_version
+        self._labware_dir = labware_dir
+        self.events = []
+        self._listener = listener or self.events.append
+        self._depth = 0
+        self._labware = []
+        self._used_tips = set()
+        self.loaded_instruments = {}
+        self.loaded_modules = {}
+        self.max_speeds = {}
+        self.location_cache = None
+        self.fixed_trash = MockLabware(labware_definition(TRASH, None),
+                                       '12', origin=SLOTS['12'])
+
+    @contextlib.contextmanager
+    def _command(self, name, payload, fields=None):
+        event = make_event(name, payload)
+        event.update(fields or {})
+        event['depth'] = self._depth
+        self._listener(event)
+        self._depth += 1
+        try:
+            yield event
+        finally:
+            self._depth -= 1
+
+    @property
+    def loaded_labwares(self):
+        # keyed by deck slot; labware on a module by the module's slot
+        loaded = {12: self.fixed_trash}
+        for labware in self._labware:
+            parent = getattr(labware.parent, 'parent', labware.parent)
+            loaded[int(parent)] = labware
+        return(loaded)
+
+    def is_simulating(self):
+        return(True)
+
+    def load_labware(self, load_name, location, label=None, namespace=None,
+                     version=None):
+        slot = str(location)
+        labware = MockLabware(labware_definition(load_name,
+                                                 self._labware_dir),
+                              slot, label, SLOTS[slot])
+        self._labware.append(labware)
+        return(labware)
+
+    load_labware_by_name = load_labware
+
+    def load_labware_from_definition(self, definition, location,
+                                     label=None):
+        slot = str(location)
+        labware = MockLabware(definition, slot, label, SLOTS[slot])
+        self._labware.append(labware)
+        return(labware)
+
+    def load_module(self, module_name, location=None, configuration=None):
+        model = _MODULE_NAMES[module_name.lower()]
+        cls = (MockMagneticModule if model == 'magdeck'
+               else MockTemperatureModule)
+        module = cls(self, model, str(location))
+        self.loaded_modules[int(location)] = module
+        return(module)
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None,
+                        replace=False):
+        instrument = MockInstrumentContext(self, instrument_name, mount,
+                                           tip_racks)
+        self.loaded_instruments[mount] = instrument
+        return(instrument)
+
+    def home(self):
+        with self._command('home', {'text': 'Homing'}):
+            self.location_cache = None
+
+    def comment(self, msg):
+        with self._command('comment', {'text': msg}):
+            pass
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        total = minutes*60 + seconds
+        minutes, seconds = divmod(total, 60)
+        text = 'Delaying for {0} minutes and {1} seconds'.format(
+            minutes, round(seconds, 3))
+        if msg:
+            text += '. ' + msg
+        with self._command('delay', {'text': text, 'minutes': minutes,
+                                     'seconds': seconds}):
+            pass
+
+    def pause(self, msg=None):
+        text = 'Pausing robot operation'
+        if msg:
+            text += ': ' + msg
+        with self._command('pause', {'text': text, 'userMessage': msg}):
+            pass
+
+    def resume(self):
+        with self._command('resume', {'text': 'Resuming robot operation'}):
+            pass
+
+
+class APIVersion(namedtuple('APIVersion', ['major', 'minor'])):
+    @classmethod
+    def from_string(cls, value):
+        return(cls(*(int(v) for v in value.split('.'))))
+
+    def __str__(self):
+        return('{0}.{1}'.format(*self))
+
+
+def _stand_in_modules():
+    # just enough of the opentrons package for the protocols' imports
+    opentrons = types.ModuleType('opentrons')
+    protocol_api = types.ModuleType('opentrons.protocol_api')
+    protocol_api.ProtocolContext = MockProtocolContext
+    protocol_api.InstrumentContext = MockInstrumentContext
+    protocol_api.Labware = MockLabware
+    protocol_api.Well = MockWell
+    protocol_api.MagneticModuleContext = MockMagneticModule
+    protocol_api.TemperatureModuleContext = MockTemperatureModule
+    ot_types = types.ModuleType('opentrons.types')
+    ot_types.Point = Point
+    ot_types.Location = Location
+    protocols = types.ModuleType('opentrons.protocols')
+    protocols_types = types.ModuleType('opentrons.protocols.types')
+    protocols_types.APIVersion = APIVersion
+    opentrons.protocol_api = protocol_api
+    opentrons.types = ot_types
+    opentrons.protocols = protocols
+    protocols.types = protocols_types
+    return({'opentrons': opentrons,
+            'opentrons.protocol_api': protocol_api,
+            'opentrons.types': ot_types,
+            'opentrons.protocols': protocols,
+            'opentrons.protocols.types': protocols_types})
+
+
+@contextlib.contextmanager
+def stand_in_opentrons():
+    """Serve `import opentrons...` from the stand-in modules."""
+    stand_ins = _stand_in_modules()
+    saved = {name: sys.modules.get(name) for name in stand_ins}
+    sys.modules.update(stand_ins)
+    try:
+        yield
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+def load_mock_protocol(path):
+    with stand_in_opentrons():
+        return(load_protocol(path))
+
+
+def dry_run(path, labware_dir=LABWARE_DIR, module=None):
+    """Run a protocol against the mock context and return its events."""
+    from .plan import is_plan, load_plan, plan_events
+
+    if module is None and is_plan(path):
+        return(plan_events(load_plan(path)))
+    if module is None:
+        module = load_mock_protocol(path)
+    ctx = MockProtocolContext(module.metadata.get('apiLevel', '2.5'),
+                              labware_dir=labware_dir)
+    module.run(ctx)
+    return(finish_events(ctx.events))
+
+
+def format_events(events):
+    """Render events as indented text, like opentrons_simulate output."""
+    return('\n'.join('\t'*e['depth'] + e['text'] for e in events))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Dry-run protocols against a mock ProtocolContext.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    args = parser.parse_args(argv)
+    for protocol in args.protocols:
+        print(format_events(dry_run(protocol, args.custom_labware)))
+
+
+if __name__ == '__main__':
+    main()
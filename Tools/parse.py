@@ -0,0 +1,252 @@
+"""Stream a protocol's command log as JSON-lines events.
+
+`opentrons_simulate` prints one line per command, indented with a tab per
+nesting level, and the bats tests keep that output in `.out` files. This
+module turns such a log, or the command stream of a mock dry run, into
+the event dicts used throughout `Tools`, one JSON object per line.
+
+Events parsed from text carry what the text holds: `volume`, `flow_rate`
+(or `rate` on older opentrons), `well`, `labware` (its display name or label
+rather than load name), `slot`, `repetitions`, `seconds` and `message`.
+Lines that match no command are `protocol.comment()` output and set the
+`step` of the events that follow.
+
+Opentrons 3.19, which the OT-2 runs, gives only a speed multiplier ("at 1.0
+speed"), so the `flow_rate` is worked out from it and the default flow rate
+of the pipette that picked up the last tip. The log doesn't name pipettes,
+so the pipette is taken from the size of that tip, as in `PIPETTES`;
+`--pipette 300=p300_single_gen2` sets it for the protocols that use others.
+
+Everything is processed one line at a time, so memory use does not grow
+with the length of the run.
+
+Usage:
+
+    python -m Tools.parse Tests/test_hackflex.out > hackflex.jsonl
+    opentrons_simulate -L Labware/custom_labware hackflex.py | \\
+        python -m Tools.parse
+    python -m Tools.parse --mock Library_Prep/Hackflex/hackflex.py
+    python -m Tools.parse --pipette 300=p300_single_gen2 zymo_a.out
+"""
+import argparse
+import json
+import re
+import sys
+
+from . import LABWARE_DIR
+
+_NUMBER = r'-?\d+(?:\.\d+)?'
+
+# (event name, pattern); the first match wins
+PATTERNS = [(name, re.compile(pattern)) for name, pattern in [
+    ('pick_up_tip', r'^Picking up tip from (?P<location>.+)$'),
+    ('aspirate', r'^Aspirating (?P<volume>{0}) uL from (?P<location>.+?)'
+                 r'(?: at (?P<flow_rate>{0}) uL/sec| at (?P<rate>{0}) speed)?$'
+                 .format(_NUMBER)),
+    ('dispense', r'^Dispensing (?P<volume>{0}) uL into (?P<location>.+?)'
+                 r'(?: at (?P<flow_rate>{0}) uL/sec| at (?P<rate>{0}) speed)?$'
+                 .format(_NUMBER)),
+    ('mix', r'^Mixing (?P<repetitions>\d+) times with a volume of '
+            r'(?P<volume>{0}) ul$'.format(_NUMBER)),
+    ('blow_out', r'^Blowing out(?: at (?P<location>.+))?$'),
+    ('touch_tip', r'^Touching tip'),
+    ('air_gap', r'^Air gap'),
+    ('drop_tip', r'^Dropping tip(?: into (?P<location>.+))?$'),
+    ('return_tip', r'^Returning tip'),
+    ('engage', r'^Engaging Magnetic Module'),
+    ('disengage', r'^Disengaging Magnetic Module'),
+    ('delay', r'^Delaying for (?P<minutes>{0}) minutes and '
+              r'(?P<seconds>{0}) seconds'.format(_NUMBER)),
+    ('pause', r'^Pausing robot operation(?:: (?P<message>.*))?$'),
+    ('transfer', r'^Transferring (?P<volume>\S+) from'),
+    ('distribute', r'^Distributing (?P<volume>\S+) from'),
+    ('consolidate', r'^Consolidating (?P<volume>\S+) from'),
+    ('home', r'^Homing'),
+    ('move_to', r'^Moving to (?P<location>.+)$'),
+]]
+
+_WELL = re.compile(r'^(?P<well>[A-P]\d{1,2}) of (?P<rest>.+)$')
+
+# the pipette taking each size of tip, for logs that give only a speed:
+# the GEN1 pipettes most of the library uses
+PIPETTES = {10: 'p10_multi',
+            20: 'p10_multi',
+            200: 'p300_multi',
+            300: 'p300_multi',
+            1000: 'p1000_single'}
+
+_TIP_VOLUME = re.compile(r'(\d+) ?[µu]L')
+
+
+def parse_location(text):
+    """Split 'A1 of <labware> on [<module> on ]<slot>' into its parts."""
+    info = {}
+    match = _WELL.match(text)
+    if match:
+        info['well'] = match.group('well')
+        text = match.group('rest')
+    parts = text.split(' on ')
+    info['labware'] = parts[0]
+    if len(parts) > 1:
+        info['slot'] = parts[-1]
+    return(info)
+
+
+def _number(value):
+    try:
+        return(float(value))
+    except (TypeError, ValueError):
+        return(None)
+
+
+def parse_line(line):
+    """Parse one line of simulator output into an event dict."""
+    text = line.rstrip('\r\n')
+    depth = len(text) - len(text.lstrip('\t'))
+    text = text.strip()
+    for name, pattern in PATTERNS:
+        match = pattern.match(text)
+        if match:
+            break
+    else:
+        return({'name': 'comment', 'depth': depth, 'text': text})
+
+    event = {'name': name, 'depth': depth, 'text': text}
+    fields = match.groupdict()
+    if fields.get('location'):
+        event.update(parse_location(fields['location']))
+    for key in ('volume', 'flow_rate', 'rate'):
+        if fields.get(key) is not None and _number(fields[key]) is not None:
+            event[key] = _number(fields[key])
+    if fields.get('repetitions'):
+        event['repetitions'] = int(fields['repetitions'])
+    if name == 'delay':
+        event['seconds'] = (60*float(fields['minutes']) +
+                            float(fields['seconds']))
+    if name == 'pause':
+        event['message'] = fields.get('message')
+    return(event)
+
+
+class EventStream():
+    """Fill in `step` and `leaf` as events arrive, one event behind.
+
+    `feed()` returns the previous event once the next one shows whether it
+    had children; `close()` returns the last. Aspirates and dispenses that
+    only give a speed get a `flow_rate` from `pipettes`, {tip volume:
+    pipette name} on top of `PIPETTES`.
+    """
+
+    def __init__(self, pipettes=None):
+        self.step = None
+        self.pipettes = dict(PIPETTES)
+        self.pipettes.update(pipettes or {})
+        self.tips = None
+        self._pending = None
+
+    def flow_rate(self, event):
+        from .mock import PIPETTES as FLOW_RATES
+
+        pipette = self.pipettes.get(self.tips)
+        if pipette is None:
+            return(None)
+        _, _, aspirate, dispense, _ = FLOW_RATES[pipette]
+        flow = aspirate if event['name'] == 'aspirate' else dispense
+        return(flow*event['rate'])
+
+    def feed(self, event):
+        if event['name'] == 'comment':
+            self.step = event['text']
+        elif event['name'] == 'pick_up_tip':
+            match = _TIP_VOLUME.search(event.get('labware', ''))
+            self.tips = int(match.group(1)) if match else None
+        elif 'rate' in event and 'flow_rate' not in event:
+            flow_rate = self.flow_rate(event)
+            if flow_rate is not None:
+                event['flow_rate'] = flow_rate
+        event['step'] = self.step
+        finished = self._pending
+        if finished is not None:
+            finished['leaf'] = event['depth'] <= finished['depth']
+        self._pending = event
+        return(finished)
+
+    def close(self):
+        finished, self._pending = self._pending, None
+        if finished is not None:
+            finished['leaf'] = True
+        return(finished)
+
+
+def parse_lines(lines, pipettes=None):
+    """Yield events from an iterable of simulator output lines."""
+    stream = EventStream(pipettes)
+    for line in lines:
+        if not line.strip():
+            continue
+        finished = stream.feed(parse_line(line))
+        if finished is not None:
+            yield finished
+    finished = stream.close()
+    if finished is not None:
+        yield finished
+
+
+def stream_mock(path, write, labware_dir=LABWARE_DIR):
+    """Dry-run a protocol on the mock context, passing each event to
+    `write` as soon as it is complete."""
+    from .mock import MockProtocolContext, load_mock_protocol
+
+    stream = EventStream()
+
+    def listener(event):
+        finished = stream.feed(event)
+        if finished is not None:
+            write(finished)
+
+    module = load_mock_protocol(path)
+    ctx = MockProtocolContext(module.metadata.get('apiLevel', '2.5'),
+                              labware_dir=labware_dir, listener=listener)
+    module.run(ctx)
+    finished = stream.close()
+    if finished is not None:
+        write(finished)
+
+
+def _parse_pipette(text):
+    tips, _, pipette = text.partition('=')
+    return(int(tips), pipette)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert a protocol command log to JSON-lines events.')
+    parser.add_argument('source', nargs='?', default='-',
+                        help='simulator output file, or - for stdin')
+    parser.add_argument('--mock', metavar='PROTOCOL',
+                        help='dry-run PROTOCOL on the mock context instead')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--pipette', nargs='*', default=[],
+                        type=_parse_pipette, metavar='TIP_UL=PIPETTE',
+                        help='pipette taking each size of tip, for logs '
+                             'that give only a speed')
+    args = parser.parse_args(argv)
+    pipettes = dict(args.pipette)
+
+    def write(event):
+        sys.stdout.write(json.dumps(event) + '\n')
+
+    if args.mock:
+        stream_mock(args.mock, write, args.custom_labware)
+    elif args.source == '-':
+        for event in parse_lines(sys.stdin, pipettes):
+            write(event)
+    else:
+        with open(args.source) as f:
+            for event in parse_lines(f, pipettes):
+                write(event)
+
+
+if __name__ == '__main__':
+    main()
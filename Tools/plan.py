@@ -0,0 +1,360 @@
+"""Compile a protocol into a flat command plan, and work from the plan.
+
+A plan is one run of a protocol, for one run configuration, written out as
+data: the labware, modules and pipettes on the deck, and every command the
+run issues, each with its pipette, volume and absolute location. It is
+what the Protocol Designer saves (see `Quantification/Full plate DNA
+quant.json`), for our Python protocols.
+
+Compiling runs the protocol once, in the simulator or on the mock context
+with `--mock`, with its configuration read as by `Tools.config`. After
+that, anything named `*.plan.json` (or `*.plan.json.gz`) can be given to
+`Tools.estimate`, `Tools.preflight`, `Tools.vector`, `Tools.travel`,
+`Tools.layout`, `Tools.tips` and `Tools.redundancy` in place of the
+protocol, and they read its commands instead of running it again.
+
+The commands are stored as a table, one row per command under a shared
+list of `fields`, in the event format of `Tools.simulate`. A plan can also
+be
+
+- validated: its deck and pipettes account for every command, it was
+  compiled from the protocol as it is now, and it passes `Tools.preflight`
+- diffed against another plan, command by command
+- replayed onto a ProtocolContext, issuing the same aspirates, dispenses,
+  moves and module commands without the protocol's own code
+
+Usage:
+
+    python -m Tools.plan compile Library_Prep/Hackflex/hackflex.py --mock \\
+        --set test_run=false cols=4 -o hackflex_4.plan.json
+    python -m Tools.estimate hackflex_4.plan.json
+    python -m Tools.plan diff hackflex_4.plan.json hackflex_6.plan.json
+"""
+import argparse
+import difflib
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+from . import LABWARE_DIR, protocol_path
+from .config import add_arguments, configure, load_configured, load_overrides
+
+FORMAT = 2
+
+EXTENSIONS = ('.plan.json', '.plan.json.gz')
+
+# every event has these, even when they are None
+_REQUIRED = ('name', 'depth', 'leaf', 'step', 'text')
+
+
+def is_plan(path):
+    return(str(path).endswith(EXTENSIONS))
+
+
+def source_hash(path, params=None):
+    """Hash of the protocol's source as configured with `params`."""
+    with open(protocol_path(path)) as f:
+        source = configure(f.read(), params or {})
+    return(hashlib.sha256(source.encode('utf-8')).hexdigest())
+
+
+def _deck(context):
+    slots = {}
+    for slot, labware in context.loaded_labwares.items():
+        if str(slot) == '12':
+            # the fixed trash is always there
+            continue
+        load_name = getattr(labware, 'load_name', None) or labware.name
+        entry = slots.setdefault(str(slot), {})
+        entry['labware'] = load_name
+        if labware.name != load_name:
+            entry['label'] = labware.name
+    for slot, module in context.loaded_modules.items():
+        slots.setdefault(str(slot), {})['module'] = (
+            'magdeck' if hasattr(module, 'engage') else 'tempdeck')
+
+    pipettes = {}
+    for mount, instrument in context.loaded_instruments.items():
+        if instrument is None:
+            continue
+        racks = [str(slot) for rack in instrument.tip_racks
+                 for slot, labware in context.loaded_labwares.items()
+                 if labware is rack]
+        pipettes[mount] = {'name': instrument.name, 'tip_racks': racks}
+    return(slots, pipettes)
+
+
+def compile_plan(path, params=None, labware_dir=LABWARE_DIR, mock=False):
+    """Run the protocol at `path` once and return its plan."""
+    from .simulate import capture, custom_labware, finish_events
+
+    params = dict(params or {})
+    module = load_configured(path, params, mock=mock)
+    if mock:
+        from .mock import MockProtocolContext
+
+        context = MockProtocolContext(module.metadata.get('apiLevel', '2.5'),
+                                      labware_dir=labware_dir)
+        module.run(context)
+        events = finish_events(context.events)
+    else:
+        from opentrons.simulate import get_protocol_api
+
+        context = get_protocol_api(module.metadata['apiLevel'],
+                                   extra_labware=custom_labware(labware_dir))
+        with capture(context) as events:
+            module.run(context)
+
+    fields = list(_REQUIRED) + sorted({key for event in events
+                                       for key in event} - set(_REQUIRED))
+    deck, pipettes = _deck(context)
+    return({'format': FORMAT,
+            'protocol': path,
+            'params': params,
+            'source': source_hash(path, params),
+            'api_level': module.metadata.get('apiLevel'),
+            'deck': deck,
+            'pipettes': pipettes,
+            'fields': fields,
+            'commands': [[event.get(f) for f in fields] for event in events]})
+
+
+def save_plan(plan, path):
+    """Write a plan as JSON, gzipped if `path` ends in .gz."""
+    text = json.dumps(plan, separators=(',', ':'))
+    if path.endswith('.gz'):
+        with gzip.open(path, 'wt') as f:
+            f.write(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def load_plan(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        plan = json.load(f)
+    if plan.get('format') != FORMAT:
+        raise ValueError('{0} is not a plan this version can read'.format(
+            path))
+    return(plan)
+
+
+def plan_events(plan):
+    """The plan's commands as event dicts."""
+    events = []
+    for row in plan['commands']:
+        events.append({field: value
+                       for field, value in zip(plan['fields'], row)
+                       if value is not None or field in _REQUIRED})
+    return(events)
+
+
+def replay(plan, context):
+    """Issue the plan's commands on `context`, a fresh ProtocolContext.
+
+    Only leaf commands are replayed: a transfer or mix is replayed as the
+    aspirates, dispenses and tip handling it was made of.
+    """
+    from .mock import MockProtocolContext
+
+    if isinstance(context, MockProtocolContext):
+        from .mock import Location, Point
+    else:
+        from opentrons.types import Location, Point
+
+    labware = {'12': context.fixed_trash}
+    magnets = []
+    for slot, entry in sorted(plan['deck'].items(),
+                              key=lambda item: int(item[0])):
+        parent = None
+        if entry.get('module'):
+            parent = context.load_module(entry['module'], int(slot))
+            if entry['module'] == 'magdeck':
+                magnets.append(parent)
+        if 'labware' not in entry:
+            continue
+        if parent is None:
+            labware[slot] = context.load_labware(
+                entry['labware'], int(slot), label=entry.get('label'))
+        else:
+            labware[slot] = parent.load_labware(entry['labware'],
+                                                label=entry.get('label'))
+    pipettes = {}
+    for mount, entry in plan['pipettes'].items():
+        pipettes[mount] = context.load_instrument(
+            entry['name'], mount,
+            tip_racks=[labware[slot] for slot in entry['tip_racks']])
+
+    def well(command):
+        return(labware[command['slot']].wells_by_name()[command['well']])
+
+    def where(command):
+        target = labware.get(command.get('slot'))
+        if target is not None and command.get('well'):
+            target = well(command)
+        return(Location(Point(*command['point']), target))
+
+    for command in plan_events(plan):
+        if not command['leaf']:
+            continue
+        name = command['name']
+        pipette = pipettes.get(command.get('mount'))
+        if name in ('aspirate', 'dispense'):
+            getattr(pipette, name)(command['volume'], where(command),
+                                   rate=command.get('rate', 1.0))
+        elif name == 'pick_up_tip':
+            pipette.pick_up_tip(well(command))
+        elif name == 'drop_tip':
+            pipette.drop_tip(where(command))
+        elif name == 'blow_out':
+            pipette.blow_out(where(command))
+        elif name == 'touch_tip':
+            target = well(command)
+            pipette.touch_tip(target, v_offset=command['point'][2] -
+                              target.top().point.z)
+        elif name == 'move_to':
+            pipette.move_to(where(command))
+        elif name == 'home':
+            (pipette or context).home()
+        elif name == 'delay':
+            context.delay(seconds=command.get('seconds', 0))
+        elif name == 'pause':
+            context.pause(command.get('message'))
+        elif name == 'comment':
+            context.comment(command['text'])
+        elif name == 'engage':
+            magnets[0].engage(**{key: command[key] for key in (
+                'height', 'offset', 'height_from_base') if key in command})
+        elif name == 'disengage':
+            magnets[0].disengage()
+        else:
+            raise ValueError('cannot replay {0!r} commands'.format(name))
+
+
+def validate_plan(plan, labware_dir=LABWARE_DIR):
+    """Problems with a plan; none means it can be used as it is."""
+    from .preflight import preflight
+
+    problems = []
+    events = plan_events(plan)
+    for i, event in enumerate(events):
+        if event.get('slot') not in (None, '12') and \
+                event['slot'] not in plan['deck']:
+            problems.append('command {0} ({1}) uses slot {2}, which has '
+                            'nothing loaded'.format(i, event['name'],
+                                                    event['slot']))
+        if event.get('mount') and event['mount'] not in plan['pipettes']:
+            problems.append('command {0} ({1}) uses the {2} mount, which '
+                            'has no pipette'.format(i, event['name'],
+                                                    event['mount']))
+    path = protocol_path(plan['protocol'])
+    if not os.path.exists(path):
+        problems.append('{0} no longer exists'.format(plan['protocol']))
+    elif source_hash(path, plan['params']) != plan['source']:
+        problems.append('{0} has changed since the plan was compiled'.format(
+            plan['protocol']))
+    problems += preflight(events, labware_dir)['problems']
+    return(problems)
+
+
+def _lines(plan):
+    lines = []
+    for event in plan_events(plan):
+        line = '\t'*event['depth'] + event['text']
+        if event.get('point'):
+            line += ' @ {0:g},{1:g},{2:g}'.format(*event['point'])
+        lines.append(line)
+    return(lines)
+
+
+def diff_plans(a, b, names=('a', 'b')):
+    """Unified diff of two plans' commands."""
+    return('\n'.join(difflib.unified_diff(_lines(a), _lines(b), names[0],
+                                          names[1], lineterm='')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compile protocols into command plans and use them.')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    compiler = commands.add_parser('compile', help='compile a protocol')
+    compiler.add_argument('protocol')
+    compiler.add_argument('-o', '--output', metavar='PATH',
+                          help='plan to write (default: next to the '
+                               'protocol, as <protocol>.plan.json)')
+    compiler.add_argument('--mock', action='store_true',
+                          help='use the mock ProtocolContext')
+    add_arguments(compiler)
+
+    check = commands.add_parser('validate', help='check plans')
+    check.add_argument('plans', nargs='+')
+
+    diff = commands.add_parser('diff', help='compare two plans')
+    diff.add_argument('plans', nargs=2)
+
+    replayer = commands.add_parser('replay', help='replay a plan')
+    replayer.add_argument('plan')
+    replayer.add_argument('--mock', action='store_true',
+                          help='use the mock ProtocolContext')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compile':
+        try:
+            params = load_overrides(args.protocol, args.config, args.settings)
+            plan = compile_plan(args.protocol, params, args.custom_labware,
+                                args.mock)
+        except ValueError as e:
+            sys.exit('{0}: {1}'.format(args.protocol, e))
+        output = args.output or \
+            os.path.splitext(protocol_path(args.protocol))[0] + EXTENSIONS[0]
+        save_plan(plan, output)
+        print('{0}: {1} commands'.format(output, len(plan['commands'])))
+
+    elif args.command == 'validate':
+        failed = False
+        for path in args.plans:
+            problems = validate_plan(load_plan(path), args.custom_labware)
+            failed = failed or bool(problems)
+            print('{0}: {1}'.format(path, 'FAIL' if problems else 'PASS'))
+            for problem in problems:
+                print('  ' + problem)
+        if failed:
+            sys.exit(1)
+
+    elif args.command == 'diff':
+        text = diff_plans(load_plan(args.plans[0]), load_plan(args.plans[1]),
+                          args.plans)
+        if text:
+            print(text)
+            sys.exit(1)
+
+    elif args.command == 'replay':
+        from .mock import MockProtocolContext, format_events
+
+        plan = load_plan(args.plan)
+        if args.mock:
+            context = MockProtocolContext(plan['api_level'] or '2.5',
+                                          labware_dir=args.custom_labware)
+            replay(plan, context)
+            print(format_events(context.events))
+        else:
+            from opentrons.simulate import get_protocol_api
+            from .simulate import capture, custom_labware
+
+            context = get_protocol_api(
+                plan['api_level'],
+                extra_labware=custom_labware(args.custom_labware))
+            with capture(context) as events:
+                replay(plan, context)
+            print(format_events(events))
+
+
+if __name__ == '__main__':
+    main()
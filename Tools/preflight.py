@@ -0,0 +1,260 @@
+"""Check a run's reagents, tips and waste before loading the deck.
+
+The protocol is dry-run on the mock context (or in the simulator, with
+`--simulate`) with the number of columns to be run, and its events are
+replayed by `Tools.vector` to find
+
+- reagents: how much each source well gives out over the run, plus the
+  dead volume the tip can't reach, against what the well holds
+- tips: how many racks of each type the run goes through, counting every
+  rack swapped in at a pause
+- waste: how full every well that only ever receives liquid ends up, such
+  as the 195 mL reservoir taking a Zymo run's supernatants
+
+The run fails if a source can't hold what it needs, anything overflows, or
+the protocol itself stops early (e.g. running out of reservoir columns).
+The protocol's run configuration is read as by `Tools.config`, and `--cols`
+overrides its number of columns. Plates the operator loads with samples
+hold an unknown volume, so taking more out of them than the run put in is
+only reported for wells given a starting volume with `--fill`, as in
+`Tools.vector`.
+
+Usage:
+
+    python -m Tools.preflight Extraction/Zymo_fecal-soil_magbead/\\
+Zymo_fecal-soil_magbead_B-extraction.py --cols 12 --fill 10=200
+"""
+import argparse
+import json
+import sys
+import traceback
+
+from . import LABWARE_DIR
+from .config import add_arguments, load_overrides
+from .plan import is_plan
+from .vector import parse_fill
+
+# liquid left below this height can't be aspirated: the tip stops 1 mm off
+# the bottom and should stay 2 mm under the surface
+DEAD_HEIGHT = 3
+
+
+def run_protocol(path, params=None, labware_dir=LABWARE_DIR,
+                 simulate=False):
+    """Run a protocol with `params` set; returns (events, error).
+
+    The events are those captured up to any error, which is returned as
+    text rather than raised. A compiled plan (see `Tools.plan`) gives its
+    commands as they are, so can't take `params`.
+    """
+    from .config import load_configured
+    from .plan import is_plan, load_plan, plan_events
+    from .simulate import finish_events
+
+    if is_plan(path):
+        if params:
+            raise ValueError('a plan is compiled with its parameters set; '
+                             'compile it again to change them')
+        return(plan_events(load_plan(path)), None)
+
+    error = None
+    if simulate:
+        from opentrons.simulate import get_protocol_api
+        from .simulate import capture, custom_labware
+
+        module = load_configured(path, params)
+        context = get_protocol_api(module.metadata['apiLevel'],
+                                   extra_labware=custom_labware(labware_dir))
+        with capture(context) as events:
+            try:
+                module.run(context)
+            except Exception:
+                error = traceback.format_exc()
+        return(events, error)
+
+    from .mock import MockProtocolContext
+
+    module = load_configured(path, params, mock=True)
+    context = MockProtocolContext(module.metadata.get('apiLevel', '2.5'),
+                                  labware_dir=labware_dir)
+    try:
+        module.run(context)
+    except Exception:
+        error = traceback.format_exc()
+    return(finish_events(context.events), error)
+
+
+def describe_wells(wells):
+    """Well names, with whole columns of a 96-well plate as 'column N'."""
+    columns = {}
+    for well in wells:
+        columns.setdefault(well[1:], []).append(well[0])
+    parts = []
+    for column, rows in columns.items():
+        if sorted(rows) == list('ABCDEFGH'):
+            parts.append('column ' + column)
+        else:
+            parts += [row + column for row in rows]
+    return(', '.join(parts))
+
+
+def dead_volume(definition, well):
+    """Volume below `DEAD_HEIGHT`, from the well's average cross-section."""
+    geometry = definition['wells'][well]
+    return(geometry['totalLiquidVolume']/geometry['depth']*DEAD_HEIGHT)
+
+
+def preflight(events, labware_dir=LABWARE_DIR, error=None, fill=None):
+    """Reagent, tip and waste requirements of a run, with its problems.
+
+    `fill` gives starting volumes as for `Tools.vector.volumes`.
+    """
+    from .mock import labware_definition
+    from .tips import tip_usage
+    from .vector import Deck, compile_events, volumes
+
+    deck = Deck(labware_dir)
+    rows = compile_events(events, deck)
+    result = volumes(rows, deck, fill)
+    problems = []
+    warnings = []
+    if error is not None:
+        problems.append('protocol stopped: ' +
+                        error.strip().splitlines()[-1])
+
+    reagents = []
+    for source in result['sources']:
+        definition = labware_definition(source['labware'], labware_dir)
+        dead = dead_volume(definition, source['well'])
+        needed = source['needed'] + dead
+        reagents.append(dict(source, dead=dead, fill=needed))
+        if needed > source['start']:
+            problems.append('{0} of {1} on {2} needs {3:.0f} uL, more than '
+                            'the {4:.0f} uL it holds'.format(
+                                source['well'], source['labware'],
+                                source['slot'], needed, source['start']))
+
+    # a multichannel command flags each of its wells; report them together
+    flagged = {}
+    for flag in result['flags']:
+        flagged.setdefault((flag['kind'], flag['event'], flag['slot'],
+                            flag['labware']), []).append(flag['well'])
+    for (kind, event, slot, load_name), wells in flagged.items():
+        text = '{0} of {1} on {2} at event {3} ({4})'.format(
+            describe_wells(wells), load_name, slot, event,
+            events[event].get('step'))
+        if kind == 'overflow':
+            problems.append('overflows: ' + text)
+        elif kind == 'underflow':
+            # often on purpose, taking a little extra to leave beads dry
+            warnings.append('aspirates more than it was given: ' + text)
+
+    loads, _ = tip_usage(events)
+    tips = {}
+    for (slot, rack), load in loads.items():
+        racks = tips.setdefault(load['load_name'], {'racks': 0, 'slots': []})
+        racks['racks'] += 1
+        if slot not in racks['slots']:
+            racks['slots'].append(slot)
+
+    waste = []
+    for plate, (slot, load_name) in enumerate(deck.plates):
+        # reservoirs that only ever receive liquid; plates that do are
+        # where the samples end up
+        if len(deck.names[plate]) > 12:
+            continue
+        definition = labware_definition(load_name, labware_dir)
+        for w, well in enumerate(deck.names[plate]):
+            final = result['final'][plate, w]
+            if final <= 0 or result['taken'][plate, w] > 0:
+                continue
+            capacity = definition['wells'][well]['totalLiquidVolume']
+            waste.append({'slot': slot, 'labware': load_name, 'well': well,
+                          'volume': float(final), 'capacity': capacity})
+            if final > capacity:
+                problems.append('{0} of {1} on {2} takes {3:.0f} uL of waste, '
+                                'more than the {4:.0f} uL it holds'.format(
+                                    well, load_name, slot, final, capacity))
+
+    return({'ok': not problems, 'problems': problems, 'warnings': warnings,
+            'reagents': reagents, 'tips': tips, 'waste': waste})
+
+
+def format_preflight(name, report):
+    lines = [name, '=' * len(name),
+             'Reagents (uL per well, with {0} mm dead volume):'.format(
+                 DEAD_HEIGHT)]
+    grouped = {}
+    for reagent in report['reagents']:
+        grouped.setdefault((reagent['slot'], reagent['labware'],
+                            reagent['fill'], reagent['needed'],
+                            reagent['dead'], reagent['start']),
+                           []).append(reagent['well'])
+    for (slot, load_name, fill, needed, dead, start), wells in \
+            grouped.items():
+        lines.append('  {0:>9.0f} = {1:>8.0f} + {2:>5.0f} dead  (holds '
+                     '{3:.0f})  {4} of {5} on {6}'.format(
+                         fill, needed, dead, start, describe_wells(wells),
+                         load_name, slot))
+    lines.append('Tips:')
+    for load_name, racks in sorted(report['tips'].items()):
+        lines.append('  {0:>3} rack(s) of {1} (slot {2})'.format(
+            racks['racks'], load_name, ', '.join(racks['slots'])))
+    lines.append('Waste:')
+    for waste in report['waste']:
+        lines.append('  {0:>9.0f} of {1:.0f} uL ({2:.0%})  {3} of {4} on '
+                     '{5}'.format(waste['volume'], waste['capacity'],
+                                  waste['volume']/waste['capacity'],
+                                  waste['well'], waste['labware'],
+                                  waste['slot']))
+    for warning in report['warnings']:
+        lines.append('Warning: ' + warning)
+    for problem in report['problems']:
+        lines.append('Problem: ' + problem)
+    lines.append('PASS' if report['ok'] else 'FAIL')
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check reagents, tips and waste before a run.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--cols', type=int, default=None,
+                        help='number of sample columns to run')
+    parser.add_argument('--simulate', action='store_true',
+                        help='use the opentrons simulator, not the mock')
+    parser.add_argument('--fill', nargs='*', default=[], type=parse_fill,
+                        metavar='SLOT[/WELL]=UL',
+                        help='starting volumes, e.g. of the sample plate')
+    parser.add_argument('--json', action='store_true')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for protocol in args.protocols:
+        if is_plan(protocol):
+            params = load_overrides(protocol, args.config, args.settings,
+                                    environ={})
+        else:
+            params = load_overrides(protocol, args.config, args.settings)
+        if args.cols is not None:
+            params['cols'] = args.cols
+        try:
+            events, error = run_protocol(protocol, params,
+                                         args.custom_labware, args.simulate)
+        except ValueError as e:
+            sys.exit('{0}: {1}'.format(protocol, e))
+        results[protocol] = preflight(events, args.custom_labware, error,
+                                      dict(args.fill))
+        if not args.json:
+            print(format_preflight(protocol, results[protocol]))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if not all(report['ok'] for report in results.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""Profile where a protocol's run time goes, by step, helper and call.
+
+`ProfilingContext` wraps the ProtocolContext handed to `run()`. The pipettes
+and modules it loads are wrapped in turn, and every liquid handling, tip,
+movement and magnet call made through them is counted and timed. Each call
+is attributed to
+
+- the step: the most recent `protocol.comment()`
+- the helper: the chain of functions between `run()` and the call, such as
+  `bead_wash > remove_supernatant`
+- the call itself: `aspirate`, `mix`, `engage`, ...
+
+Calls are timed on the wall clock, which is the real cost on the robot. In
+simulation the commands each call issued are also charged with the model in
+`Tools.estimate`, giving the expected robot time.
+
+Usage:
+
+    python -m Tools.profiler Library_Prep/Hackflex/hackflex.py
+    python -m Tools.profiler --mock hackflex.py --by helper
+
+On the robot, from a Jupyter notebook with `Tools` on the path:
+
+    from opentrons import execute
+    from Tools.profiler import profile_module
+    profile = profile_module(module, execute.get_protocol_api('2.5'))
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from . import LABWARE_DIR, protocol_path
+
+PIPETTE_CALLS = {'aspirate', 'dispense', 'mix', 'blow_out', 'touch_tip',
+                 'air_gap', 'move_to', 'pick_up_tip', 'drop_tip',
+                 'return_tip', 'transfer', 'distribute', 'consolidate',
+                 'home'}
+MODULE_CALLS = {'engage', 'disengage', 'set_temperature', 'deactivate'}
+CONTEXT_CALLS = {'delay', 'home'}
+
+_TOOLS = os.path.dirname(os.path.abspath(__file__))
+
+
+class Profile():
+    """Call counts and times keyed by (step, helper, call)."""
+
+    def __init__(self, protocol_file=None, clock=time.perf_counter):
+        self.protocol_file = protocol_file and os.path.abspath(protocol_file)
+        self.clock = clock
+        self.step = None
+        self.records = {}
+        self.spans = []
+        self._active = False
+
+    def helper(self, frame):
+        # functions between run() and the call, outermost first
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name == 'run' and (
+                    self.protocol_file is None or
+                    os.path.abspath(code.co_filename) == self.protocol_file):
+                break
+            if not code.co_name.startswith('<') and not \
+                    os.path.abspath(code.co_filename).startswith(_TOOLS):
+                names.append(code.co_name)
+            frame = frame.f_back
+        return(' > '.join(reversed(names)) or '(run)')
+
+    def _record(self, key):
+        return(self.records.setdefault(key, {'calls': 0, 'wall': 0.0,
+                                             'robot': 0.0}))
+
+    def wrap(self, name, method, events=None):
+        """`method`, counted and timed while no other call is running."""
+        def profiled(*args, **kwargs):
+            if self._active:
+                return(method(*args, **kwargs))
+            key = (self.step, self.helper(sys._getframe(1)), name)
+            first = len(events) if events is not None else None
+            self._active = True
+            start = self.clock()
+            try:
+                return(method(*args, **kwargs))
+            finally:
+                elapsed = self.clock() - start
+                self._active = False
+                record = self._record(key)
+                record['calls'] += 1
+                record['wall'] += elapsed
+                if events is not None:
+                    self.spans.append((first, len(events), key))
+        return(profiled)
+
+    def charge(self, events):
+        """Add the estimated robot time of the captured `events`."""
+        from .estimate import costs
+
+        owner = {}
+        for first, last, key in self.spans:
+            for i in range(first, last):
+                owner[i] = key
+        for i, cost in costs(events):
+            key = owner.get(i)
+            if key is None:
+                # commands issued without going through a wrapped call
+                key = (events[i].get('step'), '(run)', events[i]['name'])
+                self._record(key)
+            self.records[key]['robot'] += sum(cost.values())
+
+    def totals(self, by=('step', 'helper', 'call')):
+        """Sum the records over the fields in `by`."""
+        fields = ('step', 'helper', 'call')
+        totals = {}
+        for key, record in self.records.items():
+            group = tuple(k for f, k in zip(fields, key) if f in by)
+            total = totals.setdefault(group, {'calls': 0, 'wall': 0.0,
+                                              'robot': 0.0})
+            for metric, value in record.items():
+                total[metric] += value
+        return(totals)
+
+
+class _Proxy():
+    def __init__(self, target, profile, calls, events):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_profile', profile)
+        object.__setattr__(self, '_calls', calls)
+        object.__setattr__(self, '_events', events)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self._calls and callable(attr):
+            return(self._profile.wrap(name, attr, self._events))
+        return(attr)
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __str__(self):
+        return(str(self._target))
+
+
+class ProfilingInstrument(_Proxy):
+    def __init__(self, instrument, profile, events=None):
+        super().__init__(instrument, profile, PIPETTE_CALLS, events)
+
+
+class ProfilingModule(_Proxy):
+    def __init__(self, module, profile, events=None):
+        super().__init__(module, profile, MODULE_CALLS, events)
+
+
+class ProfilingContext(_Proxy):
+    """A ProtocolContext whose pipettes and modules are profiled."""
+
+    def __init__(self, context, profile, events=None):
+        super().__init__(context, profile, CONTEXT_CALLS, events)
+
+    def load_instrument(self, *args, **kwargs):
+        return(ProfilingInstrument(
+            self._target.load_instrument(*args, **kwargs),
+            self._profile, self._events))
+
+    def load_module(self, *args, **kwargs):
+        return(ProfilingModule(self._target.load_module(*args, **kwargs),
+                               self._profile, self._events))
+
+    def comment(self, msg):
+        self._profile.step = msg
+        return(self._target.comment(msg))
+
+
+def profile_module(module, context, events=None):
+    """Run a loaded protocol module on `context` under the profiler.
+
+    `events` is the list the context's commands are being captured into,
+    if any; with it the profile includes estimated robot time.
+    """
+    profile = Profile(getattr(module, '__file__', None))
+    module.run(ProfilingContext(context, profile, events))
+    if events is not None:
+        profile.charge(events)
+    return(profile)
+
+
+def profile_protocol(path, labware_dir=LABWARE_DIR, mock=False):
+    """Profile a protocol in the simulator, or on the mock context."""
+    if mock:
+        from .mock import MockProtocolContext, load_mock_protocol
+        from .simulate import finish_events
+
+        module = load_mock_protocol(path)
+        context = MockProtocolContext(
+            module.metadata.get('apiLevel', '2.5'), labware_dir=labware_dir)
+        profile = Profile(protocol_path(path))
+        module.run(ProfilingContext(context, profile, context.events))
+        profile.charge(finish_events(context.events))
+        return(profile)
+
+    from opentrons.simulate import get_protocol_api
+    from .simulate import capture, custom_labware, load_protocol
+
+    module = load_protocol(path)
+    context = get_protocol_api(module.metadata['apiLevel'],
+                               extra_labware=custom_labware(labware_dir))
+    with capture(context) as events:
+        profile = Profile(protocol_path(path))
+        module.run(ProfilingContext(context, profile, events))
+    profile.charge(events)
+    return(profile)
+
+
+def format_profile(name, profile, by=('step', 'helper', 'call'), top=None):
+    """Render the profile as a table, slowest first by robot time."""
+    from .estimate import format_duration
+
+    rows = sorted(profile.totals(by).items(),
+                  key=lambda item: -item[1]['robot'])
+    if top:
+        rows = rows[:top]
+    total = sum(r['robot'] for r in profile.records.values())
+    lines = [name, '=' * len(name),
+             '{0:>9} {1:>6} {2:>7} {3:>10}  {4}'.format(
+                 'robot', 'share', 'calls', 'wall ms', ' / '.join(by))]
+    for group, record in rows:
+        lines.append('{0:>9} {1:>6.1%} {2:>7} {3:>10.1f}  {4}'.format(
+            format_duration(record['robot']),
+            record['robot']/total if total else 0, record['calls'],
+            record['wall']*1000,
+            ' / '.join(str(g if g is not None else '(setup)')
+                       for g in group)))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Profile protocols by step, helper and call.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--by', nargs='+', default=['step', 'helper', 'call'],
+                        choices=['step', 'helper', 'call'],
+                        help='fields to group the report by')
+    parser.add_argument('--top', type=int, default=None,
+                        help='only show the slowest TOP rows')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for protocol in args.protocols:
+        profile = profile_protocol(protocol, args.custom_labware, args.mock)
+        if args.json:
+            results[protocol] = [
+                dict(zip(args.by, group), **record)
+                for group, record in profile.totals(args.by).items()]
+        else:
+            print(format_profile(protocol, profile, args.by, args.top))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
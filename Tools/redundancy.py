@@ -0,0 +1,229 @@
+"""Find redundant operations in a protocol's command stream.
+
+The events of a run are scanned for work that changes nothing:
+
+- repeated transfers: a transfer, distribute or consolidate moving liquid
+  between exactly the same wells as an earlier one, when the source hasn't
+  been refilled and the destination hasn't been emptied since (nor has
+  there been a pause, when plates may be swapped). Calling
+  `transfer` on every column inside a `for col in cols` loop repeats the
+  whole plate's transfer once per column.
+- repeated destinations: the same, for some of a command's wells only
+- idle magnet: the magnet engaged and disengaged again with no pipetting in
+  between, or engaged or disengaged when it already is
+- back-to-back pauses: a second pause before the robot has done anything,
+  which only makes the operator come back twice
+
+Each finding carries the robot time it wastes, from `Tools.estimate`.
+Pauses wait for an operator, so they are charged `PAUSE_SECONDS` each.
+Repeated transfers are always mistakes and make the check fail; the test
+suite runs it on every protocol in the library.
+
+Usage:
+
+    python -m Tools.redundancy Library_Prep/Hackflex/hackflex.py
+"""
+import argparse
+import json
+import sys
+
+from . import LABWARE_DIR
+from .estimate import FIXED_COSTS, costs, format_duration
+
+LIQUID_COMMANDS = ('transfer', 'distribute', 'consolidate')
+
+# findings that fail a check; the others are worth a look but can be on
+# purpose, such as separate pauses for separate instructions
+ERRORS = ('repeated transfer', 'repeated destination')
+
+# time for an operator to notice a pause and resume the run, s
+PAUSE_SECONDS = 60
+
+
+def _spans(events):
+    # the index just past each event's children
+    ends = [len(events)]*len(events)
+    stack = []
+    for i, event in enumerate(events):
+        while stack and events[stack[-1]]['depth'] >= event['depth']:
+            ends[stack.pop()] = i
+        stack.append(i)
+    return(ends)
+
+
+def _liquid(events):
+    """Yield (index, kind, (slot, well)) for pauses and for the aspirates
+    and dispenses that move liquid, leaving out those inside a mix."""
+    stack = []
+    for i, event in enumerate(events):
+        del stack[event['depth']:]
+        stack.append(event['name'])
+        if event['name'] == 'pause':
+            yield i, 'pause', None
+        elif event['name'] in ('aspirate', 'dispense') and \
+                'mix' not in stack[:-1] and event.get('well'):
+            yield i, event['name'], (event.get('slot'), event['well'])
+
+
+def repeated_transfers(events, seconds):
+    """Liquid-handling commands that repeat earlier moves between wells."""
+    ends = _spans(events)
+    # leaves belong to the outermost liquid-handling command around them
+    owner = {}
+    for i, event in enumerate(events):
+        if event['name'] in LIQUID_COMMANDS and i not in owner:
+            for j in range(i + 1, ends[i]):
+                owner[j] = i
+
+    filled = {}
+    drained = {}
+    moved = {}
+    pairs = {}
+    repeats = {}
+    source = None
+    for i, kind, well in _liquid(events):
+        command = owner.get(i)
+        if kind == 'pause':
+            # the operator may swap plates, so start over
+            moved = {}
+            continue
+        if kind == 'aspirate':
+            source = well
+            drained[well] = drained.get(well, 0) + 1
+            continue
+        filled[well] = filled.get(well, 0) + 1
+        if source is None or command is None:
+            continue
+        pair = (source, well)
+        state = (filled.get(source, 0), drained.get(well, 0))
+        pairs.setdefault(command, set()).add(pair)
+        earlier = moved.get(pair)
+        if earlier is not None and earlier[0] != command and \
+                earlier[1] == state:
+            repeats.setdefault(command, {})[pair] = earlier[0]
+        moved[pair] = (command, state)
+
+    findings = []
+    for command, repeated in sorted(repeats.items()):
+        waste = sum(seconds.get(j, 0.0) for j in range(command + 1,
+                                                       ends[command]))
+        earlier = sorted(set(repeated.values()))
+        if len(repeated) == len(pairs[command]):
+            kind = 'repeated transfer'
+        else:
+            kind = 'repeated destination'
+            waste *= len(repeated)/len(pairs[command])
+        wells = sorted({dst[1] for src, dst in repeated})
+        findings.append(_finding(
+            events, command, kind, waste,
+            '{0} repeats event {1} into {2}'.format(
+                events[command]['name'], earlier[0], ', '.join(wells))))
+    return(findings)
+
+
+def idle_magnet(events):
+    """Magnet moves that no pipetting made use of."""
+    findings = []
+    last = None
+    pipetted = False
+    delayed = 0.0
+    for i, event in enumerate(events):
+        name = event['name']
+        if name in ('aspirate', 'dispense'):
+            pipetted = True
+        elif name == 'delay':
+            delayed += float(event.get('seconds', 0))
+        if name not in ('engage', 'disengage'):
+            continue
+        if last is not None and events[last]['name'] == name and \
+                events[last]['text'] == event['text']:
+            findings.append(_finding(
+                events, i, 'idle magnet', FIXED_COSTS[name],
+                '{0} when already done at event {1}'.format(name, last)))
+        elif last is not None and name == 'disengage' and not pipetted:
+            findings.append(_finding(
+                events, i, 'idle magnet',
+                FIXED_COSTS['engage'] + FIXED_COSTS['disengage'] + delayed,
+                'engaged at event {0} with no pipetting before '
+                'disengaging'.format(last)))
+        last = i
+        pipetted = False
+        delayed = 0.0
+    return(findings)
+
+
+def repeated_pauses(events):
+    """Pauses with nothing for the robot to do since the last one."""
+    findings = []
+    last = None
+    for i, event in enumerate(events):
+        if event['name'] == 'pause':
+            if last is not None:
+                findings.append(_finding(
+                    events, i, 'back-to-back pause', PAUSE_SECONDS,
+                    'follows the pause at event {0}'.format(last)))
+            last = i
+        elif event.get('leaf', True) and event['name'] != 'comment':
+            last = None
+    return(findings)
+
+
+def _finding(events, index, kind, seconds, text):
+    return({'kind': kind, 'event': index, 'step': events[index].get('step'),
+            'seconds': seconds, 'text': text})
+
+
+def redundancies(events):
+    """Every redundant operation in a run, in the order they happen."""
+    seconds = {}
+    for i, cost in costs(events):
+        seconds[i] = sum(cost.values())
+    findings = (repeated_transfers(events, seconds) + idle_magnet(events) +
+                repeated_pauses(events))
+    return(sorted(findings, key=lambda f: f['event']))
+
+
+def format_redundancies(name, findings):
+    lines = [name, '=' * len(name)]
+    for finding in findings:
+        lines.append('  {0:>8}  {1:<20}  event {2:>5}: {3} ({4})'.format(
+            format_duration(finding['seconds']), finding['kind'],
+            finding['event'], finding['text'], finding['step']))
+    lines.append('Wasted: {0} in {1} redundant operation(s)'.format(
+        format_duration(sum(f['seconds'] for f in findings)),
+        len(findings)))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    from .mock import dry_run
+    from .simulate import simulate
+
+    parser = argparse.ArgumentParser(
+        description='Find redundant operations in protocols.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    run = dry_run if args.mock else simulate
+
+    results = {}
+    for protocol in args.protocols:
+        findings = redundancies(run(protocol,
+                                    labware_dir=args.custom_labware))
+        results[protocol] = findings
+        if not args.json:
+            print(format_redundancies(protocol, findings))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if any(f['kind'] in ERRORS for findings in results.values()
+           for f in findings):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Simulate many protocols in parallel, skipping the ones that have not changed.
+
+Each job is a protocol plus an optional set of parameters. A job's result is
+cached under a hash of everything that can change it: the protocol source,
+the custom labware definitions, the installed opentrons version, the
+installed opentrons_functions version and source (it is installed from git,
+so its version rarely changes), the helpers in `moeller_functions`, the
+capture code in `Tools`, and the parameters. Unchanged jobs are answered from the cache, so a run
+only pays for what changed.
+
+Parameters override the protocol's top-level assignments, e.g.
+`{"cols": 4}` or `{"cols": ["A1", "A2"]}`, and are checked and applied by
+`Tools.config` before the protocol is imported, so values derived from them
+at import follow too.
+
+Usage:
+
+    python -m Tools.runner                    # every protocol in PROTOCOLS
+    python -m Tools.runner -j 4 --params sets.json hackflex.py
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from . import LABWARE_DIR, PROTOCOLS, REPO_ROOT, protocol_path
+
+CACHE_DIR = os.path.join(REPO_ROOT, '.simulation_cache')
+
+_CAPTURE_CODE = ['simulate.py', 'mock.py', 'estimate.py', 'benchmark.py',
+                 'config.py', 'sweep.py', 'vector.py']
+
+
+def _version(package):
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Python 3.7
+        import pkg_resources
+        try:
+            return(pkg_resources.get_distribution(package).version)
+        except pkg_resources.DistributionNotFound:
+            return(None)
+    try:
+        return(metadata.version(package))
+    except metadata.PackageNotFoundError:
+        return(None)
+
+
+def _source_files(package):
+    """The installed `.py` files of `package`, without importing it."""
+    spec = importlib.util.find_spec(package)
+    if spec is None:
+        return([])
+    if not spec.submodule_search_locations:
+        return([spec.origin] if spec.origin.endswith('.py') else [])
+    files = []
+    for location in spec.submodule_search_locations:
+        for root, _, names in os.walk(location):
+            files += [os.path.join(root, name) for name in names
+                      if name.endswith('.py')]
+    return(sorted(files))
+
+
+def environment_hash(labware_dir=LABWARE_DIR):
+    """Hash of the inputs shared by every job."""
+    digest = hashlib.sha256()
+    for package in ('opentrons', 'opentrons_functions'):
+        digest.update('{0}={1}\n'.format(package,
+                                         _version(package)).encode())
+    files = sorted(glob.glob(os.path.join(labware_dir or '', '*.json')))
+    files += [os.path.join(os.path.dirname(__file__), f)
+              for f in _CAPTURE_CODE]
+    files += sorted(glob.glob(os.path.join(REPO_ROOT, 'moeller_functions',
+                                           '*.py')))
+    files += _source_files('opentrons_functions')
+    for fp in files:
+        digest.update(os.path.basename(fp).encode())
+        with open(fp, 'rb') as f:
+            digest.update(f.read())
+    return(digest.hexdigest())
+
+
+def job_hash(job, environment):
+    digest = hashlib.sha256(environment.encode())
+    with open(protocol_path(job['protocol']), 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps({'params': job.get('params') or {},
+                              'mock': job.get('mock', False),
+                              'measure': job.get('measure')},
+                             sort_keys=True).encode())
+    return(digest.hexdigest())
+
+
+def run_job(job):
+    """Simulate one job; runs in a worker process."""
+    from .benchmark import summarise
+    from .config import load_configured
+    from .mock import dry_run
+    from .simulate import custom_labware, simulate
+
+    labware_dir = job.get('labware_dir', LABWARE_DIR)
+    try:
+        module = load_configured(job['protocol'], job.get('params'),
+                                 mock=job.get('mock'))
+        if job.get('mock'):
+            events = dry_run(job['protocol'], labware_dir, module=module)
+        else:
+            events = simulate(job['protocol'], module=module,
+                              labware=custom_labware(labware_dir))
+    except Exception:
+        return({'ok': False, 'error': traceback.format_exc()})
+    return({'ok': True, 'metrics': summarise(events)})
+
+
+def _cache_path(cache_dir, key):
+    return(os.path.join(cache_dir, key + '.json'))
+
+
+def load_cached(cache_dir, key):
+    path = _cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return(None)
+    with open(path) as f:
+        return(json.load(f))
+
+
+def store(cache_dir, key, result):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = _cache_path(cache_dir, key) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(result, f, sort_keys=True)
+    os.replace(tmp, _cache_path(cache_dir, key))
+
+
+def run_jobs(jobs, workers=None, cache_dir=CACHE_DIR, use_cache=True,
+             labware_dir=LABWARE_DIR, worker=run_job):
+    """Run `jobs`, reusing cached results; returns one result per job.
+
+    Each result is the job plus `ok`, `metrics` or `error`, and `cached`.
+    Only successful runs are cached, so failures are always retried.
+    `worker` runs one job in a worker process; jobs for a worker other
+    than `run_job` should name what it measures in their `measure` key,
+    to keep their results apart in the cache.
+    """
+    environment = environment_hash(labware_dir)
+    results = [None]*len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        job = dict(job, labware_dir=labware_dir)
+        key = job_hash(job, environment)
+        cached = load_cached(cache_dir, key) if use_cache else None
+        if cached is not None:
+            results[i] = dict(job, cached=True, **cached)
+        else:
+            pending.append((i, key, job))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = pool.map(worker, [job for _, _, job in pending])
+            for (i, key, job), outcome in zip(pending, outcomes):
+                if outcome['ok'] and use_cache:
+                    store(cache_dir, key, outcome)
+                results[i] = dict(job, cached=False, **outcome)
+    return(results)
+
+
+def make_jobs(protocols, param_sets=None, mock=False):
+    """One job per protocol and parameter set."""
+    return([{'protocol': protocol, 'params': params, 'mock': mock}
+            for protocol in protocols
+            for params in (param_sets or [None])])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulate protocols in parallel with a result cache.')
+    parser.add_argument('protocols', nargs='*', default=PROTOCOLS)
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--params',
+                        help='JSON file holding a list of parameter sets')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args(argv)
+
+    param_sets = None
+    if args.params:
+        with open(args.params) as f:
+            param_sets = json.load(f)
+
+    results = run_jobs(make_jobs(args.protocols, param_sets, args.mock),
+                       workers=args.jobs, cache_dir=args.cache_dir,
+                       use_cache=not args.no_cache,
+                       labware_dir=args.custom_labware)
+    failed = 0
+    for result in results:
+        label = result['protocol']
+        if result['params']:
+            label += ' ' + json.dumps(result['params'], sort_keys=True)
+        if result['ok']:
+            print('{0:<6} {1}\n       {2}'.format(
+                'cached' if result['cached'] else 'ok', label,
+                json.dumps(result['metrics'], sort_keys=True)))
+        else:
+            failed += 1
+            print('FAILED {0}\n{1}'.format(label, result['error']))
+    print('{0} jobs, {1} from cache, {2} failed'.format(
+        len(results), sum(r['cached'] for r in results), failed))
+    return(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""A long-lived simulation server that keeps opentrons warm.
+
+Every `opentrons_simulate` run pays for interpreter start-up, the opentrons
+import and loading the custom labware before the protocol runs. The server
+pays that once and then simulates protocols on request over a Unix socket,
+re-reading each protocol file (and any changed labware definitions) so edits
+are picked up. Helper packages imported by the protocols, such as
+`opentrons_functions` and `moeller_functions`, stay loaded: restart the
+server after editing them.
+
+Requests and responses are single lines of JSON:
+
+    {"protocol": "/abs/path/hackflex.py", "labware_dir": "...", "mock": false}
+    {"ok": true, "events": [...], "metrics": {...}, "text": "..."}
+
+Usage:
+
+    python -m Tools.server serve &
+    python -m Tools.server simulate -L Labware/custom_labware \\
+        Library_Prep/Hackflex/hackflex.py
+    python -m Tools.server stop
+
+`simulate` takes the same arguments as `opentrons_simulate` for the bats
+tests, and simulates in-process when no server is running.
+"""
+import argparse
+import glob
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import time
+import traceback
+
+from . import LABWARE_DIR
+from .benchmark import summarise
+from .mock import dry_run, format_events
+from .simulate import custom_labware, simulate
+
+SOCKET = os.environ.get('OT_SIM_SOCKET', os.path.join(
+    tempfile.gettempdir(), 'ot-simulate-{0}.sock'.format(os.getuid())))
+
+
+class LabwareCache():
+    """Custom labware definitions, reloaded when the JSON files change."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def _stamp(self, labware_dir):
+        files = glob.glob(os.path.join(labware_dir, '*.json'))
+        return(tuple(sorted((f, os.path.getmtime(f)) for f in files)))
+
+    def get(self, labware_dir):
+        if labware_dir is None:
+            return({})
+        stamp = self._stamp(labware_dir)
+        cached = self._cache.get(labware_dir)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, custom_labware(labware_dir))
+            self._cache[labware_dir] = cached
+        return(cached[1])
+
+
+def run_request(request, labware):
+    """Simulate one request; the response dict sent back to the client."""
+    start = time.perf_counter()
+    try:
+        if request.get('mock'):
+            events = dry_run(request['protocol'], request.get('labware_dir'))
+        else:
+            events = simulate(request['protocol'],
+                              labware=labware.get(request.get('labware_dir')))
+    except Exception:
+        return({'ok': False, 'error': traceback.format_exc()})
+    metrics = summarise(events)
+    metrics['wall_time'] = round(time.perf_counter() - start, 3)
+    return({'ok': True,
+            'events': events,
+            'metrics': metrics,
+            'text': format_events(events)})
+
+
+class SimulationHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line.decode())
+        command = request.get('command', 'simulate')
+        if command == 'ping':
+            response = {'ok': True, 'pid': os.getpid()}
+        elif command == 'shutdown':
+            response = {'ok': True}
+            self.server.stopping = True
+        else:
+            response = run_request(request, self.server.labware)
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+class SimulationServer(socketserver.UnixStreamServer):
+    # one request at a time: opentrons keeps global state
+    def __init__(self, path=SOCKET):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, SimulationHandler)
+        self.labware = LabwareCache()
+        self.stopping = False
+
+    def serve(self):
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            os.unlink(self.server_address)
+
+
+def warm_up(labware_dir=LABWARE_DIR):
+    """Import opentrons and load labware ahead of the first request."""
+    import opentrons.simulate  # noqa: F401
+    from opentrons import commands  # noqa: F401
+    return(custom_labware(labware_dir))
+
+
+def send(request, path=SOCKET, timeout=None):
+    """Send one request to a running server and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(request) + '\n').encode())
+        with sock.makefile('rb') as f:
+            return(json.loads(f.readline().decode()))
+
+
+def running(path=SOCKET):
+    try:
+        return(send({'command': 'ping'}, path, timeout=1)['ok'])
+    except (OSError, ValueError):
+        return(False)
+
+
+def request_simulation(protocol, labware_dir=LABWARE_DIR, mock=False,
+                       path=SOCKET):
+    """Simulate through the server if one is running, else in-process."""
+    request = {'protocol': os.path.abspath(protocol),
+               'labware_dir': labware_dir and os.path.abspath(labware_dir),
+               'mock': mock}
+    if running(path):
+        return(send(request, path))
+    cache = LabwareCache()
+    return(run_request(request, cache))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Keep a warm opentrons simulator running.')
+    parser.add_argument('--socket', default=SOCKET)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve = commands.add_parser('serve', help='run the server')
+    serve.add_argument('-L', '--custom-labware', default=LABWARE_DIR)
+    commands.add_parser('stop', help='stop a running server')
+    commands.add_parser('status', help='report whether a server is up')
+
+    sim = commands.add_parser('simulate', help='simulate a protocol')
+    sim.add_argument('protocol')
+    sim.add_argument('-L', '--custom-labware', default=LABWARE_DIR)
+    sim.add_argument('--mock', action='store_true',
+                     help='use the mock ProtocolContext')
+    sim.add_argument('--json', action='store_true',
+                     help='print events and metrics as JSON')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        warm_up(args.custom_labware)
+        print('Serving simulations on {0}'.format(args.socket))
+        SimulationServer(args.socket).serve()
+        return(0)
+    if args.command == 'stop':
+        if running(args.socket):
+            send({'command': 'shutdown'}, args.socket)
+        return(0)
+    if args.command == 'status':
+        up = running(args.socket)
+        print('running' if up else 'not running')
+        return(0 if up else 1)
+
+    response = request_simulation(args.protocol, args.custom_labware,
+                                  args.mock, args.socket)
+    if not response['ok']:
+        sys.stderr.write(response['error'])
+        return(1)
+    if args.json:
+        json.dump({'metrics': response['metrics'],
+                   'events': response['events']}, sys.stdout)
+        print()
+    else:
+        print(response['text'])
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
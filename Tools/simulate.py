@@ -0,0 +1,236 @@
+"""Run a protocol under the Opentrons simulator and capture its commands.
+
+Each protocol is imported and its ``run(protocol)`` function called with a
+simulating ``ProtocolContext``, exactly as ``opentrons_simulate`` does. Every
+command published on the context's broker is recorded as a plain dict (an
+"event"), so the other tools never have to touch opentrons objects:
+
+    {'name': 'aspirate', 'depth': 1, 'leaf': True, 'step': 'Doing wash #1.',
+     'text': 'Aspirating 190.0 uL from A1 of ... at 23.5 uL/sec',
+     'pipette': 'p300_multi', 'mount': 'left', 'channels': 8,
+     'volume': 190.0, 'rate': 0.25, 'flow_rate': 23.5,
+     'point': [14.38, 74.24, 4.0], 'labware': 'vwr_96_wellplate_1000ul',
+     'well': 'A1', 'slot': '10'}
+
+``depth`` is the nesting level (a ``mix`` contains its aspirates and
+dispenses), ``leaf`` marks commands that did not publish any children and
+``step`` is the text of the most recent ``protocol.comment()``.
+"""
+import contextlib
+import functools
+import glob
+import importlib.util
+import json
+import os
+import re
+
+from . import LABWARE_DIR, protocol_path
+
+# Opentrons command names that differ from the events we record
+_RENAMES = {'magdeck_engage': 'engage',
+            'magdeck_disengage': 'disengage'}
+
+
+def load_protocol(path):
+    """Import a protocol file as a module without running it."""
+    path = protocol_path(path)
+    name = 'protocol_' + re.sub(r'\W', '_',
+                                os.path.splitext(os.path.basename(path))[0])
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return(module)
+
+
+def custom_labware(labware_dir=LABWARE_DIR):
+    """Load custom labware definitions keyed by URI, like `-L`."""
+    labware = {}
+    if labware_dir is None:
+        return(labware)
+    for fp in sorted(glob.glob(os.path.join(labware_dir, '*.json'))):
+        with open(fp) as f:
+            definition = json.load(f)
+        uri = '{0}/{1}/{2}'.format(definition['namespace'],
+                                   definition['parameters']['loadName'],
+                                   definition['version'])
+        labware[uri] = definition
+    return(labware)
+
+
+def _slot(obj):
+    # labware and wells resolve to a deck slot through their parents;
+    # labware on a module has the module geometry in between
+    for _ in range(4):
+        obj = getattr(obj, 'parent', None)
+        if obj is None:
+            return(None)
+        if isinstance(obj, (str, int)):
+            return(str(obj))
+    return(None)
+
+
+def describe_location(location):
+    """Summarise a Location or Well as point, labware, well and slot."""
+    if location is None:
+        return({})
+    point = getattr(location, 'point', None)
+    where = getattr(location, 'labware', location)
+    if point is None and hasattr(location, 'top'):
+        point = location.top().point
+
+    info = {}
+    if point is not None:
+        info['point'] = [round(point.x, 2),
+                         round(point.y, 2),
+                         round(point.z, 2)]
+    if where is None or isinstance(where, str):
+        return(info)
+
+    if hasattr(where, 'wells'):
+        labware = where
+    else:
+        labware = getattr(where, 'parent', None)
+        well = getattr(where, 'well_name', None)
+        if well is None:
+            well = str(where).split(' of ')[0]
+        info['well'] = well
+    if labware is not None:
+        info['labware'] = (getattr(labware, 'load_name', None) or
+                           getattr(labware, 'name', None))
+        info['slot'] = _slot(labware)
+    return(info)
+
+
+def _instrument(instrument):
+    if instrument is None:
+        return({})
+    return({'pipette': instrument.name,
+            'mount': instrument.mount,
+            'channels': getattr(instrument, 'channels', 1)})
+
+
+def make_event(name, payload):
+    """Convert a published opentrons command into an event dict."""
+    name = name.split('.', 1)[-1].lower()
+    name = _RENAMES.get(name, name)
+    event = {'name': name, 'text': payload.get('text', '')}
+
+    instrument = payload.get('instrument')
+    event.update(_instrument(instrument))
+    event.update(describe_location(payload.get('location')))
+
+    if 'volume' in payload and payload['volume'] is not None:
+        event['volume'] = float(payload['volume'])
+    if name in ('aspirate', 'dispense'):
+        rate = payload.get('rate') or 1.0
+        event['rate'] = rate
+        if instrument is not None:
+            event['flow_rate'] = getattr(instrument.flow_rate, name) * rate
+    elif name == 'mix':
+        event['repetitions'] = payload.get('repetitions')
+    elif name == 'delay':
+        event['seconds'] = (60 * (payload.get('minutes') or 0) +
+                            (payload.get('seconds') or 0))
+    elif name == 'pause':
+        event['message'] = payload.get('userMessage')
+    return(event)
+
+
+def engage_heights(height=None, offset=None, height_from_base=None):
+    """The arguments of a magnet engage that were given, as event fields.
+
+    Opentrons doesn't publish them with the command, so they are taken
+    from the call to `engage()` itself.
+    """
+    return({key: value for key, value in (('height', height),
+                                          ('offset', offset),
+                                          ('height_from_base',
+                                           height_from_base))
+            if value is not None})
+
+
+def finish_events(events):
+    """Fill in `leaf` and `step` once the whole run has been captured."""
+    step = None
+    for i, event in enumerate(events):
+        if event['name'] == 'comment':
+            step = event['text']
+        event['step'] = step
+        following = events[i + 1]['depth'] if i + 1 < len(events) else 0
+        event['leaf'] = following <= event['depth']
+    return(events)
+
+
+@contextlib.contextmanager
+def capture(context):
+    """Record the commands `context` publishes inside the block.
+
+    Yields the list of events, which is finished when the block exits.
+    Magnetic Module engages are recorded with the heights they were called
+    with, for the length of the block.
+    """
+    from opentrons import commands
+    from opentrons.protocol_api.module_contexts import MagneticModuleContext
+
+    events = []
+    depth = [0]
+    engaging = {}
+    engage = MagneticModuleContext.engage
+
+    @functools.wraps(engage)
+    def recorded_engage(module, height=None, offset=None,
+                        height_from_base=None):
+        engaging.update(engage_heights(height, offset, height_from_base))
+        try:
+            return(engage(module, height=height, offset=offset,
+                          height_from_base=height_from_base))
+        finally:
+            engaging.clear()
+
+    def record(message):
+        if message['$'] == 'before':
+            event = make_event(message['name'], message['payload'])
+            if event['name'] == 'engage':
+                event.update(engaging)
+            event['depth'] = depth[0]
+            events.append(event)
+            depth[0] += 1
+        else:
+            depth[0] -= 1
+
+    unsubscribe = context.broker.subscribe(commands.command_types.COMMAND,
+                                           record)
+    MagneticModuleContext.engage = recorded_engage
+    try:
+        yield events
+    finally:
+        MagneticModuleContext.engage = engage
+        unsubscribe()
+        finish_events(events)
+
+
+def simulate(path, labware_dir=LABWARE_DIR, labware=None, module=None):
+    """Simulate the protocol at `path` and return its events.
+
+    `labware` is an already loaded `custom_labware()` dict; when given,
+    `labware_dir` is not read. `module` is the protocol already imported
+    with `load_protocol()`. A compiled plan (see `Tools.plan`) gives its
+    commands without being run.
+    """
+    from .plan import is_plan, load_plan, plan_events
+
+    if module is None and is_plan(path):
+        return(plan_events(load_plan(path)))
+
+    from opentrons.simulate import get_protocol_api
+
+    if labware is None:
+        labware = custom_labware(labware_dir)
+    if module is None:
+        module = load_protocol(path)
+    context = get_protocol_api(module.metadata['apiLevel'],
+                               extra_labware=labware)
+
+    with capture(context) as events:
+        module.run(context)
+    return(events)
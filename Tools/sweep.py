@@ -0,0 +1,224 @@
+"""Sweep protocol parameters and find the variants worth running.
+
+Every combination of the given parameter values is run over a process pool
+(through `Tools.runner`, so unchanged variants come from its cache) and
+measured for
+
+- `robot_time`: estimated run time, s (`Tools.estimate`)
+- `tips`: tips picked up
+- `reagent`: liquid drawn from reagent sources, uL (`Tools.vector`): every
+  labware drawn from except sample plates, whose wells are each drawn
+  from once, and plates that take liquid from other labware
+
+A variant is on the Pareto frontier when no other variant is at least as
+good on all three and better on one. With `--group cols` the frontier is
+found separately for each number of columns, since a bigger run costs
+more of everything.
+
+Any of the protocol's top-level settings can be varied, such as `cols`,
+`wash_mix`, `bead_flow`, `mag_engage_height` or the supernatant volumes
+(`twb_super_vol`, ...); they are applied as by `Tools.config`, on top of
+any `--set` values.
+
+Usage:
+
+    python -m Tools.sweep Library_Prep/Hackflex/hackflex.py --mock \\
+        --set test_run=false --vary cols=4,12 wash_mix=3,5,10 \\
+        bead_flow=0.25,0.5 --group cols
+"""
+import argparse
+import itertools
+import json
+import sys
+import traceback
+
+from . import LABWARE_DIR
+from .config import add_arguments, load_overrides, parse_value, read_config
+
+OBJECTIVES = ['robot_time', 'tips', 'reagent']
+
+
+def parse_vary(settings):
+    """{name: [values]} from 'NAME=V1,V2,...' strings.
+
+    A value list may also be given as JSON, e.g. 'cols=[2, 4, 12]'.
+    """
+    grid = {}
+    for setting in settings:
+        name, sep, text = setting.partition('=')
+        if not sep:
+            raise ValueError('expected NAME=V1,V2,..., got {0!r}'.format(
+                setting))
+        values = parse_value(text.strip())
+        if not isinstance(values, list):
+            values = [parse_value(v.strip()) for v in text.split(',')]
+        grid[name.strip()] = values
+    return(grid)
+
+
+def variants(grid, base=None):
+    """Every combination of the values in `grid`, on top of `base`."""
+    names = list(grid)
+    return([dict(base or {}, **dict(zip(names, values)))
+            for values in itertools.product(*(grid[n] for n in names))])
+
+
+def _not_reagents(rows):
+    """Plates drawn from that don't hold reagents.
+
+    These are destination plates, which take liquid aspirated from other
+    labware, and sample plates, none of whose wells is drawn from twice.
+    """
+    from .vector import received
+
+    draws = {}
+    for plate, well, volume in zip(rows['plate'], rows['well'],
+                                   rows['volume']):
+        if volume < 0:
+            key = (int(plate), int(well))
+            draws[key] = draws.get(key, 0) + 1
+    most = {}
+    for (plate, well), n in draws.items():
+        most[plate] = max(most.get(plate, 0), n)
+    return(received(rows) | {plate for plate, n in most.items() if n == 1})
+
+
+def measure(events, labware_dir=LABWARE_DIR):
+    """Run time, tips and reagent use of a captured run."""
+    from .estimate import estimate
+    from .vector import Deck, compile_events, volumes
+
+    deck = Deck(labware_dir)
+    rows = compile_events(events, deck)
+    result = volumes(rows, deck)
+    skip = _not_reagents(rows)
+    reagent = sum(source['needed'] for source in result['sources']
+                  if deck.plate(source['slot'], source['labware'])
+                  not in skip)
+    return({'robot_time': round(estimate(events)['total'], 1),
+            'tips': sum(1 for e in events if e['name'] == 'pick_up_tip' and
+                        e.get('leaf', True)),
+            'reagent': round(float(reagent), 1)})
+
+
+def run_variant(job):
+    """Run and measure one variant; runs in a worker process."""
+    from .config import load_configured
+    from .mock import dry_run
+    from .simulate import simulate
+
+    labware_dir = job.get('labware_dir', LABWARE_DIR)
+    try:
+        module = load_configured(job['protocol'], job.get('params'),
+                                 mock=job.get('mock'))
+        run = dry_run if job.get('mock') else simulate
+        events = run(job['protocol'], labware_dir=labware_dir,
+                     module=module)
+        return({'ok': True, 'metrics': measure(events, labware_dir)})
+    except Exception:
+        return({'ok': False, 'error': traceback.format_exc()})
+
+
+def _dominates(a, b):
+    return(all(a[o] <= b[o] for o in OBJECTIVES) and
+           any(a[o] < b[o] for o in OBJECTIVES))
+
+
+def pareto(results, group=None):
+    """Indices of the successful results on the Pareto frontier, within
+    each value of the parameter `group` if given."""
+    frontier = []
+    ok = [i for i, r in enumerate(results) if r['ok']]
+    for i in ok:
+        key = results[i]['params'].get(group) if group else None
+        if not any(_dominates(results[j]['metrics'],
+                              results[i]['metrics'])
+                   for j in ok if j != i and
+                   (results[j]['params'].get(group) if group else None)
+                   == key):
+            frontier.append(i)
+    return(frontier)
+
+
+def format_sweep(name, results, frontier, grid):
+    from .estimate import format_duration
+
+    cells = [[json.dumps(r['params'].get(n)) for n in grid] for r in results]
+    widths = [max([len(n)] + [len(c[k]) for c in cells])
+              for k, n in enumerate(grid)]
+
+    def row(values):
+        return('  '.join(v.ljust(w)
+                         for v, w in zip(values, widths)).rstrip())
+
+    lines = [name, '=' * len(name),
+             '  {0:>8} {1:>5} {2:>10}  {3}'.format('time', 'tips', 'reagent',
+                                                   row(list(grid)))]
+    ranked = sorted(range(len(results)), key=lambda i: (
+        not results[i]['ok'], results[i].get('metrics', {}).get(
+            'robot_time', 0)))
+    for i in ranked:
+        result = results[i]
+        if not result['ok']:
+            lines.append('  {0:<25}  {1}  ({2})'.format(
+                'FAILED', row(cells[i]),
+                result['error'].strip().splitlines()[-1]))
+            continue
+        metrics = result['metrics']
+        lines.append('{0} {1:>8} {2:>5} {3:>10.0f}  {4}'.format(
+            '*' if i in frontier else ' ',
+            format_duration(metrics['robot_time']), metrics['tips'],
+            metrics['reagent'], row(cells[i])))
+    lines.append('{0} variants, {1} on the Pareto frontier (*)'.format(
+        len(results), len(frontier)))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    from .runner import CACHE_DIR, run_jobs
+
+    parser = argparse.ArgumentParser(
+        description='Sweep protocol parameters over a process pool.')
+    parser.add_argument('protocol')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--vary', nargs='*', default=[],
+                        metavar='NAME=V1,V2',
+                        help='values to try for a parameter')
+    parser.add_argument('--grid', metavar='FILE',
+                        help='JSON or YAML file of {name: [values]}')
+    parser.add_argument('--group', metavar='NAME',
+                        help='find the frontier for each value of NAME')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--json', action='store_true')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        grid = read_config(args.grid) if args.grid else {}
+        grid.update(parse_vary(args.vary))
+        base = load_overrides(args.protocol, args.config, args.settings)
+    except ValueError as e:
+        sys.exit(str(e))
+    jobs = [{'protocol': args.protocol, 'params': params,
+             'mock': args.mock, 'measure': 'sweep'}
+            for params in variants(grid, base)]
+    results = run_jobs(jobs, workers=args.jobs, cache_dir=CACHE_DIR,
+                       use_cache=not args.no_cache,
+                       labware_dir=args.custom_labware, worker=run_variant)
+    frontier = pareto(results, args.group)
+
+    if args.json:
+        json.dump([dict(r, pareto=i in frontier)
+                   for i, r in enumerate(results)], sys.stdout, indent=2)
+        print()
+    else:
+        print(format_sweep(args.protocol, results, frontier, grid))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Plan tip racks so runs need fewer manual rack swaps.
+
+The planner reads every tip pick-up from a run, split into rack loads: each
+slot starts with one rack, and an operator pause that mentions tips and the
+slot number (such as Hackflex's "Replace empty tiprack in position 4 ...")
+means a fresh rack goes into that slot. The pause says what tips go in
+("... with new rack of 200 µL filter tips"); the protocol keeps picking
+from the labware it loaded, so this is the only place the new tip type
+shows. A rack load that only exists because of such a swap, with the same
+type of tips as before, is moved, if it fits, into
+
+1. columns left unused on a rack of the same type, starting with the rack
+   in its own slot, or
+2. a new rack of the same type in an empty deck slot.
+
+Racks are only ever shared between loads of the same tip type, so filter
+and plain tips never mix, and a swap to a different type of tips keeps its
+pause. Rack loads the pipettes pick from automatically (their `tip_racks`)
+stay where they are. A returned tip is only ever picked up again in place of the
+same tip, so reuse within a protocol is unchanged by the plan.
+
+The plan is written as JSON, for a protocol to pick those tips from
+instead of pausing:
+
+    {"wells": {"4/1/1": "4/3", ...}, "racks": {"9": "..."}}
+
+where "4/1/1" is column 1 of the second rack (rack 1) to sit in slot 4,
+and "4/3" is column 3 of whatever the plan put in slot 4. None of the
+protocols in the library has a swap the plan can take over: Hackflex's
+only one brings filter tips for elution.
+
+Usage:
+
+    python -m Tools.tips Library_Prep/Hackflex/hackflex.py --write plan.json
+"""
+import argparse
+import json
+import re
+import sys
+
+from . import LABWARE_DIR
+
+COLUMNS = 12
+
+USABLE_SLOTS = [str(s) for s in range(1, 12)]
+
+
+def swapped_tips(message, load_name):
+    """Load name of the tips a swap pause asks for, e.g. '200 µL filter
+    tips'; `load_name` (the rack it replaces) where it doesn't say."""
+    volume = re.search(r'(\d+)\s*(?:µ|u)l', message, re.IGNORECASE)
+    filtered = 'filter' in message.lower()
+    if volume is None and not filtered:
+        return(load_name)
+    if volume is None:
+        volume = re.search(r'(\d+)ul$', load_name or '')
+    if volume is None:
+        return(load_name)
+    return('opentrons_96_{0}tiprack_{1}ul'.format(
+        'filter' if filtered else '', volume.group(1)))
+
+
+def tip_usage(events, auto_slots=()):
+    """Group tip pick-ups into rack loads.
+
+    Returns ({(slot, rack): load}, [(pause message, [slots])]), where each
+    load records its `load_name` (for a swapped-in rack, the tips its
+    pause asks for), the `columns` picked from in order of first use,
+    `picks` and `reuses` (picks of a tip that was returned).
+    """
+    racks = {}
+    swapped = {}
+    loads = {}
+    pauses = []
+    for event in events:
+        if event['name'] == 'pause':
+            message = event.get('message') or ''
+            if 'tip' in message.lower():
+                slots = [s for s in re.findall(r'\b(\d{1,2})\b', message)
+                         if s in {key[0] for key in loads}]
+                for slot in slots:
+                    racks[slot] = racks.get(slot, 0) + 1
+                    swapped[slot] = swapped_tips(message, swapped.get(
+                        slot, loads[(slot, 0)]['load_name']))
+                pauses.append((message, slots))
+            continue
+        if event['name'] != 'pick_up_tip' or not event.get('well'):
+            continue
+        slot = event.get('slot')
+        key = (slot, racks.get(slot, 0))
+        load = loads.setdefault(key, {'load_name': swapped.get(
+                                          slot, event.get('labware')),
+                                      'columns': [],
+                                      'picks': 0,
+                                      'reuses': 0,
+                                      'auto': slot in auto_slots,
+                                      'wells': set()})
+        column = int(event['well'][1:])
+        if column not in load['columns']:
+            load['columns'].append(column)
+        if event['well'] in load['wells']:
+            load['reuses'] += 1
+        load['wells'].add(event['well'])
+        load['picks'] += 1
+    return(loads, pauses)
+
+
+def plan_tips(loads, pauses, free_slots=()):
+    """Place the rack loads that come from swaps.
+
+    Returns the plan ({'wells': ..., 'racks': ...}) and the pause messages
+    the plan makes unnecessary.
+    """
+    used = {slot: set(load['columns']) for (slot, rack), load in
+            loads.items() if rack == 0}
+    types = {slot: load['load_name'] for (slot, rack), load in
+             loads.items() if rack == 0}
+    movable = [slot for (slot, rack), load in sorted(loads.items())
+               if rack == 0 and not load['auto']]
+    free_slots = list(free_slots)
+    wells = {}
+    racks = {}
+    placed = set()
+
+    for (slot, rack), load in sorted(loads.items()):
+        if rack == 0 or load['auto']:
+            continue
+        if load['load_name'] != types.get(slot):
+            # a different type of tips, which the operator has to bring
+            continue
+        # its own slot first, then other racks of the same type
+        candidates = sorted((s for s in movable + list(racks)
+                             if types[s] == load['load_name']),
+                            key=lambda s: (s != slot, int(s)))
+        target = None
+        for candidate in candidates:
+            if COLUMNS - len(used[candidate]) >= len(load['columns']):
+                target = candidate
+                break
+        if target is None and free_slots:
+            target = free_slots.pop(0)
+            racks[target] = load['load_name']
+            types[target] = load['load_name']
+            used[target] = set()
+        if target is None:
+            continue
+
+        spare = [c for c in range(1, COLUMNS + 1) if c not in used[target]]
+        for column, new in zip(load['columns'], spare):
+            wells['{0}/{1}/{2}'.format(slot, rack, column)] = \
+                '{0}/{1}'.format(target, new)
+            used[target].add(new)
+        placed.add((slot, rack))
+
+    # a pause is only needed while one of its swaps is still unplaced
+    avoided = []
+    seen = {}
+    for message, slots in pauses:
+        swapped = []
+        for slot in slots:
+            seen[slot] = seen.get(slot, 0) + 1
+            swapped.append((slot, seen[slot]))
+        if swapped and all(s in placed or s not in loads for s in swapped):
+            avoided.append(message)
+    return({'wells': wells, 'racks': racks}, avoided)
+
+
+def consolidations(loads):
+    """Pairs of same-type racks whose tips would fit in one rack."""
+    first = {slot: load for (slot, rack), load in loads.items()
+             if rack == 0 and not load['auto']}
+    pairs = []
+    slots = sorted(first, key=int)
+    for i, a in enumerate(slots):
+        for b in slots[i + 1:]:
+            if first[a]['load_name'] == first[b]['load_name'] and \
+                    len(first[a]['columns']) + \
+                    len(first[b]['columns']) <= COLUMNS:
+                pairs.append((a, b))
+    return(pairs)
+
+
+def format_plan(name, loads, plan, avoided, pauses, pairs):
+    lines = [name, '=' * len(name), 'Rack loads:']
+    for (slot, rack), load in sorted(loads.items(),
+                                     key=lambda i: (int(i[0][0]), i[0][1])):
+        lines.append('  slot {0:>2} rack {1}  {2:<36} {3:>2} columns, '
+                     '{4:>3} picks, {5:>3} reused{6}'.format(
+                         slot, rack, load['load_name'],
+                         len(load['columns']), load['picks'],
+                         load['reuses'], '  (auto)' if load['auto'] else ''))
+    lines.append('Tip swap pauses: {0} -> {1}'.format(
+        len(pauses), len(pauses) - len(avoided)))
+    for message in avoided:
+        lines.append('  no longer needed: ' + message)
+    for slot, load_name in plan['racks'].items():
+        lines.append('  load {0} in slot {1}'.format(load_name, slot))
+    for a, b in pairs:
+        lines.append('Racks in slots {0} and {1} could share one rack, '
+                     'freeing a slot.'.format(a, b))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    from .layout import capture
+
+    parser = argparse.ArgumentParser(
+        description='Plan tip rack use to avoid manual rack swaps.')
+    parser.add_argument('protocol')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--write', metavar='PATH',
+                        help='write the plan as JSON')
+    args = parser.parse_args(argv)
+
+    events, deck = capture(args.protocol, args.custom_labware, args.mock)
+    auto = [slot for slot, entry in deck.items() if entry.get('auto_tips')]
+    free = [slot for slot in USABLE_SLOTS if slot not in deck]
+    loads, pauses = tip_usage(events, auto)
+    plan, avoided = plan_tips(loads, pauses, free)
+    print(format_plan(args.protocol, loads, plan, avoided, pauses,
+                      consolidations(loads)))
+    if args.write:
+        with open(args.write, 'w') as f:
+            json.dump(plan, f, indent=2, sort_keys=True)
+            f.write('\n')
+    else:
+        json.dump(plan, sys.stdout, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
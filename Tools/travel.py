@@ -0,0 +1,146 @@
+"""Gantry travel distance per protocol and step, with a deck heatmap.
+
+Distances follow the same path model as `Tools.estimate`: up to a safe
+height, across in XY, and back down. Every move is also counted against the
+pair of deck slots it connects, so the report shows which labware the
+gantry shuttles between most, e.g. the mag plate on slot 10 and the waste
+reservoir on slot 7 during supernatant removal.
+
+Usage:
+
+    python -m Tools.travel Library_Prep/Hackflex/hackflex.py
+"""
+import argparse
+import json
+import math
+import sys
+
+from . import LABWARE_DIR
+from .estimate import moves
+
+# slot numbers as they sit on the deck, back row first
+DECK = [['10', '11', '12'],
+        ['7', '8', '9'],
+        ['4', '5', '6'],
+        ['1', '2', '3']]
+
+
+def move_distance(start, end, safe_z=None):
+    """Length of the path from `start` to `end`, mm."""
+    if start is None or end is None or start == end:
+        return(0.0)
+    top = safe_z if safe_z is not None else max(start[2], end[2])
+    rise = max(top - start[2], 0)
+    fall = max(top - end[2], 0)
+    return(rise + fall + math.hypot(end[0] - start[0], end[1] - start[1]))
+
+
+def travel(events):
+    """Total, per-step and per-slot-pair gantry travel, mm.
+
+    Returns a dict with `total`, `steps` ({step: mm}), `pairs`
+    ({(from_slot, to_slot): {'moves': n, 'distance': mm}}) and `slots`
+    ({slot: visits}).
+    """
+    total = 0.0
+    steps = {}
+    pairs = {}
+    slots = {}
+    previous = None
+    for i, start, end, safe_z in moves(events):
+        event = events[i]
+        slot = event.get('slot')
+        slots[slot] = slots.get(slot, 0) + 1
+        distance = move_distance(start, end, safe_z)
+        if start is None:
+            previous = slot
+            continue
+        total += distance
+        steps[event.get('step')] = steps.get(event.get('step'),
+                                             0.0) + distance
+        pair = pairs.setdefault((previous, slot),
+                                {'moves': 0, 'distance': 0.0})
+        pair['moves'] += 1
+        pair['distance'] += distance
+        previous = slot
+    return({'total': total, 'steps': steps, 'pairs': pairs, 'slots': slots})
+
+
+def _shade(fraction):
+    return(' .:-=+*#%@'[min(int(fraction*10), 9)] if fraction else ' ')
+
+
+def format_heatmap(slots):
+    """Draw slot visits on the deck layout."""
+    busiest = max(slots.values()) if slots else 0
+    lines = []
+    for row in DECK:
+        cells = []
+        for slot in row:
+            visits = slots.get(slot, 0)
+            shade = _shade(visits/busiest if busiest else 0)*3
+            cells.append('[{0:>2} {1} {2:>5}]'.format(slot, shade, visits))
+        lines.append(' '.join(cells))
+    return('\n'.join(lines))
+
+
+def format_travel(name, result, top=10):
+    """Render travel by step, the busiest slot pairs and the heatmap."""
+    lines = [name, '=' * len(name),
+             'Total gantry travel: {0:.1f} m'.format(result['total']/1000),
+             '', 'By step:']
+    for step, distance in result['steps'].items():
+        lines.append('  {0:>8.1f} m  {1}'.format(distance/1000,
+                                                step or '(setup)'))
+
+    # fold A->B and B->A together
+    undirected = {}
+    for (a, b), pair in result['pairs'].items():
+        key = tuple(sorted((str(a), str(b))))
+        both = undirected.setdefault(key, {'moves': 0, 'distance': 0.0})
+        both['moves'] += pair['moves']
+        both['distance'] += pair['distance']
+    lines += ['', 'Busiest slot pairs:']
+    ranked = sorted(undirected.items(), key=lambda p: -p[1]['distance'])
+    for (a, b), pair in ranked[:top]:
+        label = 'within {0}'.format(a) if a == b else '{0} <-> {1}'.format(
+            a, b)
+        lines.append('  {0:>8.1f} m  {1:>5} moves  {2}'.format(
+            pair['distance']/1000, pair['moves'], label))
+    lines += ['', 'Slot visits:', format_heatmap(result['slots'])]
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    from .mock import dry_run
+    from .simulate import simulate
+
+    parser = argparse.ArgumentParser(
+        description='Measure gantry travel of protocols.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slot pairs to list')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    run = dry_run if args.mock else simulate
+
+    results = {}
+    for protocol in args.protocols:
+        result = travel(run(protocol, labware_dir=args.custom_labware))
+        if args.json:
+            result['pairs'] = [dict(pair, start=a, end=b)
+                               for (a, b), pair in result['pairs'].items()]
+            results[protocol] = result
+        else:
+            print(format_travel(protocol, result, args.top))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
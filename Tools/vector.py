@@ -0,0 +1,463 @@
+"""Whole-deck liquid volumes as NumPy arrays.
+
+Every well a protocol touches is a cell of a (plate, well) array. The run's
+events are compiled once into index arrays, one row per aspirate or
+dispense, and each row reaches the wells its channels sit in: a
+multichannel command on `A1` reaches the 8 wells of column 1, every other
+row of a 384-well plate, or the same reservoir well 8 times. The volume of
+every well over the whole run then comes from one sorted cumulative sum,
+which flags
+
+- overflow: a well holding more than its max volume, such as a 1000 µL
+  deep-well plate topped up past the rim
+- underflow: aspirating more from a well than it was given with `--fill`
+  plus what was put into it
+- exhaustion: a source, a well aspirated from before anything is put in
+  it, running out of its starting volume
+
+A well given no volume with `--fill` may start with anything up to its max
+volume: sources start full, and a plate of samples holds at least what the
+run takes out of it beyond what it puts in. An operator pause may swap
+plates (as in `Tools.redundancy`), so the wells of plates that take liquid
+from other labware start over after each pause; reservoirs and reagent
+plates carry on. `components()` replays the same rows in order, one vector
+update per command, to track how much of each source every well holds.
+
+Usage:
+
+    python -m Tools.vector Library_Prep/Hackflex/hackflex.py
+    python -m Tools.vector --mock hackflex.py --fill 2=15000 --components 10
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from . import LABWARE_DIR
+
+# liquid dispensed or blown out here leaves the deck
+TRASH_SLOTS = {'12'}
+
+CHANNELS = 8
+
+# µL of slack before a volume counts as over or under
+TOLERANCE = 1e-6
+
+_TIP_EVENTS = {'pick_up_tip', 'drop_tip', 'return_tip'}
+
+
+def channel_table(ordering):
+    """For each well, the wells channels 0-7 reach when channel 0 is in it.
+
+    `ordering` is the definition's list of columns, top row first. Rows
+    that would fall off the labware are -1.
+    """
+    names = [name for column in ordering for name in column]
+    index = {name: i for i, name in enumerate(names)}
+    table = np.full((len(names), CHANNELS), -1, dtype=int)
+    for column in ordering:
+        rows = len(column)
+        for r, name in enumerate(column):
+            for k in range(CHANNELS):
+                if rows >= CHANNELS:
+                    # 9 mm apart: every row of a 96, every other of a 384
+                    row = r + k*(rows // CHANNELS)
+                else:
+                    # wells wide enough to take several channels
+                    row = r + k*rows // CHANNELS
+                if row < rows:
+                    table[index[name], k] = index[column[row]]
+    return(names, table)
+
+
+class Deck():
+    """The labware the events touch, as arrays indexed (plate, well)."""
+
+    def __init__(self, labware_dir=LABWARE_DIR):
+        self.labware_dir = labware_dir
+        self.plates = []
+        self.names = []
+        self._index = {}
+        self._wells = []
+        self._capacity = []
+        self._tables = []
+
+    def plate(self, slot, load_name):
+        """Index of the labware, loading its definition the first time."""
+        from .mock import labware_definition
+
+        key = (slot, load_name)
+        if key not in self._index:
+            definition = labware_definition(load_name, self.labware_dir)
+            names, table = channel_table(definition['ordering'])
+            self._index[key] = len(self.plates)
+            self.plates.append(key)
+            self.names.append(names)
+            self._wells.append({name: i for i, name in enumerate(names)})
+            self._capacity.append([definition['wells'][name]
+                                   ['totalLiquidVolume'] for name in names])
+            self._tables.append(table)
+        return(self._index[key])
+
+    def well(self, plate, name):
+        return(self._wells[plate][name])
+
+    def arrays(self):
+        """(capacity, tables): (plates, wells) max volumes and (plates,
+        wells, 8) channel tables, padded to the largest labware."""
+        width = max([len(n) for n in self.names] or [1])
+        capacity = np.zeros((len(self.plates), width))
+        tables = np.full((len(self.plates), width, CHANNELS), -1, dtype=int)
+        for p, (cap, table) in enumerate(zip(self._capacity, self._tables)):
+            capacity[p, :len(cap)] = cap
+            tables[p, :len(table)] = table
+        return(capacity, tables)
+
+
+def compile_events(events, deck):
+    """Rows of liquid moved, as arrays.
+
+    Each row is one aspirate (negative `volume`), dispense or blow-out
+    (positive), per channel, with the `event` it came from, the `mount`
+    index, the `plate` and first-channel `well`, how many `channels`, and
+    the `pauses` before it. Liquid leaving the deck (trash, discarded tips)
+    has plate -1, and `reset` rows empty the tip. Air gaps move no liquid.
+    """
+    rows = []
+    mounts = {}
+    liquid = {}
+    parents = []
+    pauses = 0
+    for i, event in enumerate(events):
+        depth = event.get('depth', 0)
+        del parents[depth:]
+        parents.append(event['name'])
+        if not event.get('leaf', True):
+            continue
+        name = event['name']
+        if name == 'pause':
+            pauses += 1
+            continue
+        if name not in ('aspirate', 'dispense', 'blow_out') and \
+                name not in _TIP_EVENTS:
+            continue
+        mount = mounts.setdefault(event.get('mount'), len(mounts))
+        channels = event.get('channels') or 1
+        held = liquid.get(mount, 0.0)
+        if name in _TIP_EVENTS:
+            rows.append((i, mount, -1, -1, channels, held, True, pauses))
+            liquid[mount] = 0.0
+            continue
+
+        plate = well = -1
+        if event.get('labware') and event.get('well') and \
+                event.get('slot') not in TRASH_SLOTS:
+            plate = deck.plate(event.get('slot'), event['labware'])
+            well = deck.well(plate, event['well'])
+
+        if name == 'aspirate':
+            if depth and parents[depth - 1] == 'air_gap':
+                continue
+            volume = -(event.get('volume') or 0)
+        elif name == 'dispense':
+            volume = min(event.get('volume') or 0, held)
+        else:
+            volume = held
+        liquid[mount] = held - volume
+        if volume:
+            rows.append((i, mount, plate, well, channels, volume, False,
+                         pauses))
+
+    columns = ('event', 'mount', 'plate', 'well', 'channels', 'volume',
+               'reset', 'pauses')
+    types = (int, int, int, int, int, float, bool, int)
+    return({column: np.array([row[c] for row in rows], dtype=kind)
+            for c, (column, kind) in enumerate(zip(columns, types))})
+
+
+def _cells(rows, tables):
+    # one entry per (row, channel) that lands on a well
+    on = np.nonzero(rows['plate'] >= 0)[0]
+    wells = tables[rows['plate'][on], rows['well'][on]]
+    channels = rows['channels'][on][:, None]
+    reach = (np.arange(CHANNELS)[None, :] < channels) & (wells >= 0)
+    row, channel = np.nonzero(reach)
+    return(on[row], wells[row, channel])
+
+
+def _fill_array(deck, capacity, fill):
+    # NaN where no starting volume was given
+    start = np.full(capacity.shape, np.nan)
+    for (slot, well), volume in (fill or {}).items():
+        for p, (plate_slot, _) in enumerate(deck.plates):
+            if plate_slot != slot:
+                continue
+            if well is None:
+                start[p, :len(deck.names[p])] = volume
+            elif well in deck.names[p]:
+                start[p, deck.well(p, well)] = volume
+    return(start)
+
+
+def received(rows):
+    """Plates that take liquid aspirated from other labware."""
+    plates = set()
+    held = {}
+    for mount, plate, volume, reset in zip(rows['mount'], rows['plate'],
+                                           rows['volume'], rows['reset']):
+        mount, plate = int(mount), int(plate)
+        if reset:
+            held.pop(mount, None)
+        elif volume < 0:
+            held[mount] = plate
+        elif plate >= 0 and held.get(mount, plate) != plate:
+            plates.add(plate)
+    return(plates)
+
+
+def volumes(rows, deck, fill=None):
+    """Replay the rows' volumes for every well at once.
+
+    A well with no `fill` volume is checked both ways: it may hold no
+    more than its max volume, so a source is exhausted if the run needs
+    more than that, and it holds at least what the run takes from it
+    beyond what it puts in, which is what counts towards overflowing it
+    later. Only wells with a `fill` volume can underflow short of that.
+    The wells of plates (more than 12 wells) that take liquid from other
+    labware start over after each pause, as the operator may have swapped
+    them; `fill` volumes are for the start of the run.
+
+    Returns a dict with `flags` (the first overflow, underflow or
+    exhaustion of each well, and of each well again after a swap, in event
+    order), `sources` (the volume each source can start with and the most
+    the run draws from it), `start` and `final` ((plates, wells) arrays of
+    volumes).
+    """
+    capacity, tables = deck.arrays()
+    width = capacity.shape[1]
+    row, well = _cells(rows, tables)
+    cell = rows['plate'][row]*width + well
+    swapped = [p for p in received(rows) if len(deck.names[p]) > 12]
+    segment = np.where(np.isin(rows['plate'][row], swapped),
+                       rows['pauses'][row], 0)
+    key = segment*capacity.size + cell
+    delta = rows['volume'][row]
+
+    # volume change of each well since its first row, in event order
+    order = np.lexsort((row, key))
+    key, cell, delta, row = key[order], cell[order], delta[order], \
+        row[order]
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    starts = np.nonzero(first)[0]
+    group = np.cumsum(first) - 1
+    total = np.cumsum(delta)
+    change = total - (total - delta)[first][group]
+    lowest = np.minimum.reduceat(change, starts) if len(starts) else change
+
+    cells = cell[first]
+    given = _fill_array(deck, capacity, fill).ravel()[cells]
+    # after a swap, neither the fill nor the source is what it was
+    later = key[first] >= capacity.size
+    given[later] = np.nan
+    source = (delta[first] < 0) & ~later
+    known = ~np.isnan(given)
+    most = np.where(known, given, capacity.ravel()[cells])
+    least = np.where(known, given, np.maximum(-lowest, 0.0))
+
+    flags = []
+    under = change + most[group] < -TOLERANCE
+    for kind, mask in (('overflow', change + least[group] >
+                        capacity.ravel()[cell] + TOLERANCE),
+                       ('exhausted', under & source[group]),
+                       ('underflow', under & ~source[group])):
+        hits = np.nonzero(mask)[0]
+        _, firsts_hit = np.unique(key[hits], return_index=True)
+        for i in hits[firsts_hit]:
+            flags.append(_flag(kind, deck, cell[i], width,
+                               change[i] + (least if kind == 'overflow'
+                                            else most)[group[i]],
+                               rows['event'][row[i]]))
+    flags.sort(key=lambda f: (f['event'], f['slot'], f['well']))
+
+    sources = []
+    for g in np.nonzero(source)[0]:
+        plate, w = divmod(int(cells[g]), width)
+        slot, load_name = deck.plates[plate]
+        sources.append({'slot': slot, 'labware': load_name,
+                        'well': deck.names[plate][w],
+                        'start': float(most[g]),
+                        'needed': float(-lowest[g])})
+
+    shape = capacity.shape
+    start = np.nan_to_num(_fill_array(deck, capacity, fill)).ravel()
+    # groups are in key order, so a well's first group is its earliest
+    _, earliest = np.unique(cells, return_index=True)
+    start[cells[earliest]] = least[earliest]
+    last = np.ones(len(key), dtype=bool)
+    last[:-1] = key[1:] != key[:-1]
+    last = np.nonzero(last)[0]
+    _, latest = np.unique(cell[last][::-1], return_index=True)
+    latest = last[::-1][latest]
+    final = start.copy()
+    final[cell[latest]] = change[latest] + least[group[latest]]
+    taken = np.zeros(start.shape)
+    np.add.at(taken, cell, np.maximum(-delta, 0))
+    return({'flags': flags, 'sources': sources,
+            'start': start.reshape(shape), 'final': final.reshape(shape),
+            'taken': taken.reshape(shape)})
+
+
+def _flag(kind, deck, cell, width, volume, event):
+    plate, well = divmod(int(cell), width)
+    slot, load_name = deck.plates[plate]
+    return({'kind': kind, 'slot': slot, 'labware': load_name,
+            'well': deck.names[plate][well], 'volume': float(volume),
+            'event': int(event)})
+
+
+def components(rows, deck, start):
+    """How much of each source every well ends up with.
+
+    Returns (sources, amounts): the (plate, well) of each source, and a
+    (plates, wells, sources) array of µL.
+    """
+    capacity, tables = deck.arrays()
+    plate, well = np.nonzero(start > 0)
+    index = {(p, w): c for c, (p, w) in enumerate(zip(plate, well))}
+    amounts = np.zeros(capacity.shape + (len(index),))
+    amounts[plate, well, np.arange(len(index))] = start[plate, well]
+    mounts = int(rows['mount'].max()) + 1 if len(rows['mount']) else 1
+    tips = np.zeros((mounts, CHANNELS, len(index)))
+
+    for r in range(len(rows['event'])):
+        tip = tips[rows['mount'][r]]
+        n = rows['channels'][r]
+        volume = rows['volume'][r]
+        if rows['reset'][r]:
+            tip[:] = 0
+            continue
+        if rows['plate'][r] < 0:
+            if volume < 0:
+                continue
+            held = tip[:n].sum(axis=1, keepdims=True)
+            tip[:n] -= tip[:n]*np.minimum(abs(volume)/np.maximum(held, 1e-12),
+                                          1)
+            continue
+        wells = tables[rows['plate'][r], rows['well'][r], :n]
+        reach = wells >= 0
+        p = np.full(reach.sum(), rows['plate'][r])
+        w = wells[reach]
+        if volume < 0:
+            held = amounts[p, w].sum(axis=1, keepdims=True)
+            taken = amounts[p, w]*np.minimum(-volume/np.maximum(held, 1e-12),
+                                              1)
+            np.subtract.at(amounts, (p, w), taken)
+            tip[:n][reach] += taken
+        else:
+            held = tip[:n][reach].sum(axis=1, keepdims=True)
+            given = tip[:n][reach]*np.minimum(volume/np.maximum(held, 1e-12),
+                                              1)
+            np.add.at(amounts, (p, w), given)
+            tip[:n][reach] -= given
+    return(list(zip(plate, well)), amounts)
+
+
+def format_report(name, events, deck, result, slots=(), mixtures=None):
+    lines = [name, '=' * len(name)]
+    if not result['flags']:
+        lines.append('No overflows, underflows or exhausted sources.')
+    # a multichannel command flags each of its wells; list them together
+    grouped = {}
+    for flag in result['flags']:
+        grouped.setdefault((flag['event'], flag['kind'], flag['slot'],
+                            flag['labware']), []).append(flag)
+    for (event, kind, slot, load_name), flags in grouped.items():
+        lines.append('  {0:<9} {1} of {2} on {3}: {4:.1f} uL at event {5} '
+                     '({6})'.format(kind,
+                                    ' '.join(f['well'] for f in flags),
+                                    load_name, slot,
+                                    max(f['volume'] for f in flags)
+                                    if kind == 'overflow' else
+                                    min(f['volume'] for f in flags),
+                                    event, events[event].get('step')))
+    lines.append('Sources (uL used of the most each can hold):')
+    grouped = {}
+    for source in result['sources']:
+        grouped.setdefault((source['slot'], source['labware'],
+                            source['needed'], source['start']),
+                           []).append(source['well'])
+    for (slot, load_name, needed, start), wells in grouped.items():
+        lines.append('  {0:>9.1f} of {1:>8.1f}  {2} of {3} on {4}'.format(
+            needed, start, ' '.join(wells), load_name, slot))
+    if mixtures is not None:
+        sources, amounts = mixtures
+        labels = ['{0}/{1}'.format(deck.plates[p][0], deck.names[p][w])
+                  for p, w in sources]
+        for p, (slot, load_name) in enumerate(deck.plates):
+            if slot not in slots:
+                continue
+            lines.append('Contents of {0} on {1}:'.format(load_name, slot))
+            for w, well in enumerate(deck.names[p]):
+                total = amounts[p, w].sum()
+                if total <= TOLERANCE:
+                    continue
+                top = np.argsort(-amounts[p, w])[:3]
+                lines.append('  {0:<4} {1:>7.1f} uL  {2}'.format(
+                    well, total, ', '.join(
+                        '{0} {1:.0%}'.format(labels[c],
+                                             amounts[p, w, c]/total)
+                        for c in top if amounts[p, w, c] > TOLERANCE)))
+    return('\n'.join(lines))
+
+
+def parse_fill(text):
+    where, volume = text.split('=')
+    slot, _, well = where.partition('/')
+    return((slot, well or None), float(volume))
+
+
+def main(argv=None):
+    from .mock import dry_run
+    from .simulate import simulate
+
+    parser = argparse.ArgumentParser(
+        description='Check well volumes over a whole protocol run.')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('-L', '--custom-labware', default=LABWARE_DIR,
+                        help='directory of custom labware definitions')
+    parser.add_argument('--mock', action='store_true',
+                        help='use the mock ProtocolContext')
+    parser.add_argument('--fill', nargs='*', default=[], type=parse_fill,
+                        metavar='SLOT[/WELL]=UL',
+                        help='starting volumes; sources are full otherwise')
+    parser.add_argument('--components', nargs='*', default=[],
+                        metavar='SLOT',
+                        help='list what the wells in these slots hold')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    run = dry_run if args.mock else simulate
+
+    results = {}
+    for protocol in args.protocols:
+        events = run(protocol, labware_dir=args.custom_labware)
+        deck = Deck(args.custom_labware)
+        rows = compile_events(events, deck)
+        result = volumes(rows, deck, dict(args.fill))
+        if args.json:
+            results[protocol] = {'flags': result['flags'],
+                                 'sources': result['sources']}
+            continue
+        mixtures = None
+        if args.components:
+            mixtures = components(rows, deck, result['start'])
+        print(format_report(protocol, events, deck, result,
+                            args.components, mixtures))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""Helpers shared by the protocols in this library.
+
+These sit alongside `opentrons_functions` on the robot and follow its
+layout: `transfer` for moving buffer out of reservoirs, `magbeads` for
+magnetic bead handling, and `timing` for incubations and the steps run
+while they wait. Nothing here imports `opentrons`; the protocols hand in
+their ProtocolContext, pipettes and labware.
+"""
@@ -0,0 +1,285 @@
+"""Magnetic bead helpers.
+
+These started as copies of the functions in `opentrons_functions.magbeads`,
+tuned for the protocols in this library. Columns are visited in the order
+given by a `ColumnOrder`, where one is passed.
+"""
+from math import ceil
+from time import monotonic
+import logging
+
+from .transfer import LiquidLevel, add_buffer
+
+log = logging.getLogger(__name__)
+
+
+def _distance(a, b):
+    a, b = a.point, b.point
+    return((a.x - b.x)**2 + (a.y - b.y)**2)
+
+
+class ColumnOrder():
+    """The order in which helpers visit the columns of a plate.
+
+    Called with the columns for each pass over the plate, and optionally
+    the location the pipette keeps returning to (e.g. the waste). A pass
+    whose timing has to match an earlier one, such as adding buffer after
+    removing supernatant, should reuse that pass's order rather than ask
+    for a new one, so every column waits the same time.
+    """
+
+    strategies = ('plate', 'serpentine', 'nearest')
+
+    def __init__(self, strategy='plate'):
+        if strategy not in self.strategies:
+            raise ValueError('Unknown column order {0}; use one of '
+                             '{1}'.format(strategy, self.strategies))
+        self.strategy = strategy
+        self.reverse = False
+
+    def __call__(self, cols, plate=None, target=None):
+        cols = list(cols)
+        if self.strategy == 'serpentine':
+            if self.reverse:
+                cols.reverse()
+            self.reverse = not self.reverse
+        elif self.strategy == 'nearest' and target is not None:
+            cols.sort(key=lambda col: _distance(plate[col].top(), target))
+        return(cols)
+
+
+class MagnetState():
+    """A Magnetic Module that skips moves to where it already is.
+
+    Engaging at the same height it is already engaged at, or disengaging
+    when it is already disengaged, is logged and skipped; each move takes
+    seconds and bead washes make dozens of them. The state starts unknown,
+    so the first move always goes to the module. Anything else is passed
+    straight through.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.state = None
+
+    def engage(self, height=None, offset=None, height_from_base=None):
+        state = ('engaged', height, offset, height_from_base)
+        if state == self.state:
+            log.info('Skipped engage: magnet already engaged there')
+            return
+        self.module.engage(height=height, offset=offset,
+                           height_from_base=height_from_base)
+        self.state = state
+
+    def disengage(self):
+        if self.state == ('disengaged',):
+            log.info('Skipped disengage: magnet already disengaged')
+            return
+        self.module.disengage()
+        self.state = ('disengaged',)
+
+    def __getattr__(self, name):
+        return(getattr(self.module, name))
+
+
+def mix_for(incubation,
+            pipette,
+            plate,
+            cols,
+            tiprack,
+            n=10,
+            mix_vol=40,
+            z=1,
+            blow_out_z=0,
+            order=None):
+    """Keep mixing `cols` round-robin for as long as `incubation` runs.
+
+    Each pass picks up every column's tip from `tiprack`, mixes, and
+    returns the tip. Passes continue while there is time left for a whole
+    pass; the incubation then waits out whatever remains. At least one
+    pass is always made, and exactly one in simulation.
+    """
+    protocol = incubation.protocol
+    while True:
+        t0 = monotonic()
+        for col in (order(cols, plate) if order else cols):
+            pipette.pick_up_tip(tiprack.wells_by_name()[col])
+            pipette.mix(n, mix_vol, plate[col].bottom(z=z))
+            pipette.blow_out(plate[col].top(z=blow_out_z))
+            pipette.touch_tip()
+            pipette.return_tip()
+        pass_time = monotonic() - t0
+
+        if protocol.is_simulating() or incubation.remaining() < pass_time:
+            break
+
+    incubation.wait()
+    return()
+
+
+def bead_mix(pipette,
+             plate,
+             cols,
+             tiprack,
+             n=5,
+             mix_vol=200,
+             drop_tip=False,
+             order=None):
+    if order is not None:
+        cols = order(cols, plate)
+    for col in cols:
+        pipette.pick_up_tip(tiprack.wells_by_name()[col])
+        pipette.mix(n,
+                    mix_vol,
+                    plate[col].bottom(z=2))
+        pipette.blow_out(plate[col].top())
+
+        if drop_tip:
+            pipette.drop_tip()
+        else:
+            pipette.return_tip()
+    return()
+
+
+def remove_supernatant(pipette,
+                       plate,
+                       cols,
+                       tiprack,
+                       waste,
+                       super_vol=600,
+                       rate=0.25,
+                       bottom_offset=2,
+                       drop_tip=False,
+                       air_gap=10,
+                       fast_rate=None,
+                       order=None):
+
+    # remove supernatant
+
+    # chunk size is whatever fits in the tip alongside the air gap,
+    # balanced so we don't end with a tiny chunk (e.g. 190 + 10 µL)
+    tip_vol = min(pipette.max_volume, tiprack.wells()[0].max_volume)
+    transfers = int(ceil(super_vol/(tip_vol - air_gap)))
+    transfer_vol = super_vol/transfers
+
+    # flow-rate profile: fast until the final chunk near the pellet
+    if fast_rate is None:
+        fast_rate = rate
+
+    if order is not None:
+        cols = order(cols, plate, waste.top())
+
+    for col in cols:
+        # the tip follows the surface down through the supernatant, then
+        # takes the last chunk from just above the pellet
+        level = LiquidLevel(plate[col], super_vol)
+        # transfers to remove supernatant:
+        pipette.pick_up_tip(tiprack.wells_by_name()[col])
+        for i in range(0, transfers):
+            location = level.aspirate(transfer_vol, floor=4)
+            if i == transfers - 1:
+                location = plate[col].bottom(z=bottom_offset)
+                chunk_rate = rate
+            else:
+                chunk_rate = fast_rate
+            pipette.aspirate(transfer_vol,
+                             location,
+                             rate=chunk_rate)
+            pipette.air_gap(air_gap)
+            pipette.dispense(transfer_vol + air_gap, waste.top())
+            pipette.blow_out()
+        # we're done with these tips at this point
+        if drop_tip:
+            pipette.drop_tip()
+        else:
+            pipette.return_tip()
+    return()
+
+
+def bead_wash(
+              # global arguments
+              protocol,
+              magblock,
+              pipette,
+              plate,
+              cols,
+              # super arguments
+              super_waste,
+              super_tiprack,
+              # wash buffer arguments
+              source_wells,
+              source_vol,
+              # mix arguments
+              mix_tiprack,
+              # optional arguments
+              super_vol=600,
+              rate=0.25,
+              fast_rate=None,
+              super_bottom_offset=2,
+              drop_super_tip=True,
+              wash_vol=300,
+              remaining=None,
+              wash_tip=None,
+              drop_wash_tip=True,
+              multi_dispense=False,
+              mix_vol=200,
+              mix_n=5,
+              drop_mix_tip=False,
+              mag_engage_height=None,
+              pause_s=180,
+              order=None):
+    """Remove the supernatant, add wash buffer, mix, and pellet the beads.
+
+    Returns what `add_buffer` does: the volume left in the current wash
+    buffer well and the wells still in use, to pass back in as
+    `remaining` and `source_wells` for the next wash with the same buffer.
+    """
+
+    # buffer goes in in the same column order the supernatant came out,
+    # so every column's beads sit dry for the same time
+    if order is not None:
+        cols = order(cols, plate, super_waste.top())
+
+    # remove supernatant
+    remove_supernatant(pipette,
+                       plate,
+                       cols,
+                       super_tiprack,
+                       super_waste,
+                       super_vol=super_vol,
+                       rate=rate,
+                       bottom_offset=super_bottom_offset,
+                       drop_tip=drop_super_tip,
+                       fast_rate=fast_rate)
+
+    # disengage magnet
+    magblock.disengage()
+
+    # add wash buffer
+    wash_remaining, wash_wells = add_buffer(pipette,
+                                            source_wells,
+                                            plate,
+                                            cols,
+                                            wash_vol,
+                                            source_vol,
+                                            tip=wash_tip,
+                                            remaining=remaining,
+                                            drop_tip=drop_wash_tip,
+                                            multi_dispense=multi_dispense)
+
+    # mix
+    bead_mix(pipette,
+             plate,
+             cols,
+             mix_tiprack,
+             n=mix_n,
+             mix_vol=mix_vol,
+             drop_tip=drop_mix_tip,
+             order=order)
+
+    # engage magnet. Every step between washes works on the mag plate, so
+    # unlike Hackflex size selection there is nothing to schedule here
+    magblock.engage(height_from_base=mag_engage_height)
+    protocol.delay(seconds=pause_s)
+
+    return(wash_remaining, wash_wells)
@@ -0,0 +1,110 @@
+"""Incubation timing.
+
+An `Incubation` times a wait from the first column it applies to, and a
+`Scheduler` runs pipetting steps that don't need the incubating plate
+while it waits, instead of a plain delay.
+"""
+from time import monotonic
+
+
+class Incubation():
+    """An incubation timed from the first column it applies to.
+
+    Columns are handled one at a time, so by the end of a per-column loop
+    the first column has already been incubating for the whole loop, and
+    the next step visits the columns in the same order. Call `start()` as
+    each column is handled (only the first call starts the clock), then
+    `wait()` to delay for whatever is left of `seconds`.
+    """
+
+    def __init__(self, protocol, seconds):
+        self.protocol = protocol
+        self.seconds = seconds
+        self.started = None
+        self.spent = 0
+
+    def start(self):
+        if self.started is None:
+            self.started = monotonic()
+
+    def spend(self, seconds):
+        # the simulator's clock doesn't advance, so work done during the
+        # incubation is credited by its estimated duration instead
+        if self.protocol.is_simulating():
+            self.spent += seconds
+
+    def remaining(self):
+        if self.started is None:
+            return(self.seconds)
+        if self.protocol.is_simulating():
+            elapsed = self.spent
+        else:
+            elapsed = monotonic() - self.started
+        return(max(0, self.seconds - elapsed))
+
+    def wait(self):
+        remaining = self.remaining()
+        if remaining > 0:
+            self.protocol.delay(seconds=remaining)
+        self.started = None
+        self.spent = 0
+
+
+class Scheduler():
+    """Fill incubations with independent pipetting work.
+
+    Steps are queued with `add()`, each with an estimated duration in
+    seconds, the labware it touches (`uses`) and the names of steps that
+    must run before it (`after`). `wait()` runs the queued steps that are
+    ready, touch none of the `busy` labware and fit in the time the
+    incubation has left, then waits out the rest. With `fit=False` every
+    ready step runs, which is what we want for work that has to be done
+    before the next step anyway. `flush()` runs whatever is still queued,
+    in dependency order.
+    """
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.queue = []
+        self.done = []
+
+    def add(self, name, step, seconds, uses=(), after=()):
+        self.queue.append({'name': name,
+                           'step': step,
+                           'seconds': seconds,
+                           'uses': list(uses),
+                           'after': list(after)})
+
+    def ready(self, entry, busy=()):
+        if any(name not in self.done for name in entry['after']):
+            return(False)
+        return(not any(u is b for u in entry['uses'] for b in busy))
+
+    def run_step(self, entry):
+        self.queue.remove(entry)
+        entry['step']()
+        self.done.append(entry['name'])
+
+    def wait(self, incubation, busy=(), fit=True):
+        # keep going while steps run, as each may unblock others
+        progress = True
+        while progress:
+            progress = False
+            for entry in list(self.queue):
+                if not self.ready(entry, busy):
+                    continue
+                if fit and entry['seconds'] > incubation.remaining():
+                    continue
+                self.run_step(entry)
+                incubation.spend(entry['seconds'])
+                progress = True
+        incubation.wait()
+
+    def flush(self):
+        while self.queue:
+            ready = [e for e in self.queue if self.ready(e)]
+            if not ready:
+                raise ValueError('Unsatisfiable step dependencies: '
+                                 '{0}'.format([e['name']
+                                               for e in self.queue]))
+            self.run_step(ready[0])
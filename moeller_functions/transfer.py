@@ -0,0 +1,204 @@
+from math import ceil, pi
+
+
+def well_geometry(well):
+    """The well's entry in its labware's definition.
+
+    Wells only expose their diameter, so the rest of the shape (depth,
+    xDimension and yDimension of rectangular wells, totalLiquidVolume) is
+    read from the definition the labware was loaded from.
+    """
+    definition = getattr(well.parent, '_definition', None)
+    if definition is None:
+        return({})
+    name = getattr(well, 'well_name', None)
+    if name is None:
+        name = str(well).split(' of ')[0]
+    return(definition['wells'].get(name, {}))
+
+
+class LiquidLevel():
+    """The liquid surface in a well, followed as volume goes in and out.
+
+    Heights come from the well's depth and its cross-section at the top
+    (diameter, or xDimension by yDimension), as given in its labware
+    definition. A well that holds less than that cross-section over its
+    full depth is taken to narrow to a cone at the bottom, the way PCR and
+    deep-well plate wells do. Volumes are per
+    channel, as in the protocols; `channels` is how many tips draw from
+    the well at once, e.g. all 8 of a multichannel in a reservoir column.
+    """
+
+    def __init__(self, well, volume, channels=1, clearance=2, min_height=1):
+        self.well = well
+        self.volume = volume
+        self.channels = channels
+        self.clearance = clearance
+        self.min_height = min_height
+
+        self.depth = well.top().point.z - well.bottom().point.z
+        geometry = well_geometry(well)
+        diameter = geometry.get('diameter')
+        length = geometry.get('xDimension')
+        width = geometry.get('yDimension')
+        if diameter:
+            area = pi*diameter**2/4
+        elif length and width:
+            area = length*width
+        else:
+            area = 0
+        # never less than the average cross-section, which is all we know
+        # of a well with no dimensions
+        self.area = max(area, well.max_volume/self.depth)
+        # a cone this tall makes up the volume a straight well would have
+        self.cone = min(1.5*(self.depth - well.max_volume/self.area),
+                        self.depth)
+
+    def height(self, volume=None):
+        """Height of the surface above the bottom of the well, mm."""
+        if volume is None:
+            volume = self.volume
+        total = max(volume*self.channels, 0)
+        cone_vol = self.area*self.cone/3
+        if total < cone_vol:
+            return(self.cone*(total/cone_vol)**(1/3))
+        return(min(self.cone + (total - cone_vol)/self.area, self.depth))
+
+    def reachable(self, volume):
+        """Whether `volume` can be taken with the tip still `clearance`
+        under the surface and `min_height` off the bottom."""
+        return(self.height(self.volume - volume) - self.clearance >=
+               self.min_height)
+
+    def aspirate(self, volume, floor=None):
+        """Take `volume` out of the well.
+
+        Returns the location to aspirate from: `clearance` below where the
+        surface ends up, but not below `floor` (`min_height` by default).
+        """
+        self.volume -= volume
+        if floor is None:
+            floor = self.min_height
+        return(self.well.bottom(z=max(self.height() - self.clearance,
+                                      floor)))
+
+    def dispense(self, volume):
+        self.volume += volume
+
+
+def _channels_in(well, pipette):
+    # every channel of a multichannel goes in the same well of a reservoir
+    if len(well.parent.columns()[0]) == 1:
+        return(pipette.channels)
+    return(1)
+
+
+def add_buffer(pipette,
+               source_wells,
+               plate,
+               cols,
+               wash_vol,
+               source_vol,
+               tip=None,
+               tip_vol=300,
+               remaining=None,
+               drop_tip=True,
+               pre_mix=0,
+               multi_dispense=False,
+               disposal_vol=10,
+               dead_vol=None):
+    """Add `wash_vol` of buffer from `source_wells` to each of `cols`.
+
+    Takes the same arguments as `opentrons_functions.transfer.add_buffer`
+    and returns the volume left in the current source well and the source
+    wells still in use. Rather than count down a fixed dead volume, it
+    follows the liquid level in the source and moves on to the next well
+    once the tip can't reach the next aspiration without leaving the
+    liquid, or the aspiration would leave less than `dead_vol` behind
+    (10% of `source_vol` by default, as in `opentrons_functions`).
+    `pre_mix` mixes the source that many times before each aspiration, for
+    buffers with beads in them.
+    """
+
+    if tip is not None:
+        pipette.pick_up_tip(tip)
+    else:
+        pipette.pick_up_tip()
+
+    source_well = source_wells[0]
+    if remaining is None:
+        remaining = source_vol
+    if dead_vol is None:
+        dead_vol = source_vol*0.1
+    channels = _channels_in(source_well, pipette)
+    level = LiquidLevel(source_well, remaining, channels)
+
+    def fits(volume):
+        return(level.reachable(volume) and level.volume - volume >= dead_vol)
+
+    def next_well():
+        nonlocal source_well, level
+        source_wells.pop(0)
+        source_well = source_wells[0]
+        level = LiquidLevel(source_well, source_vol, channels)
+
+    def take(volume):
+        # the last well is drawn down to `min_height`; a source that runs
+        # short is for `Tools.preflight` to report, not an IndexError
+        if not fits(volume) and len(source_wells) > 1:
+            next_well()
+        location = level.aspirate(volume)
+        if pre_mix:
+            pipette.mix(pre_mix, min(volume, tip_vol - disposal_vol),
+                        location)
+        pipette.aspirate(volume, location)
+
+    # multi-dispense: load several columns' worth of volume in one
+    # aspiration, plus a disposal volume that is blown back into the
+    # source afterwards. Only worth it if more than one column fits.
+    per_aspirate = int((tip_vol - disposal_vol) // wash_vol)
+
+    if multi_dispense and per_aspirate > 1:
+        # balance columns across aspirations, e.g. 6 + 6 rather than 9 + 3
+        aspirations = int(ceil(len(cols)/per_aspirate))
+        batch_size = int(ceil(len(cols)/aspirations))
+
+        cols = list(cols)
+        while cols:
+            # no more columns than the source well can still give, so each
+            # gets its full volume
+            n = min(batch_size, len(cols))
+            while n > 1 and not fits(wash_vol*n + disposal_vol):
+                n -= 1
+            if n == 1 and not fits(wash_vol + disposal_vol) and \
+                    len(source_wells) > 1:
+                next_well()
+                continue
+            batch, cols = cols[:n], cols[n:]
+            batch_vol = wash_vol*len(batch)
+
+            take(batch_vol + disposal_vol)
+            for col in batch:
+                pipette.dispense(wash_vol,
+                                 plate[col].top())
+            pipette.blow_out(source_well.top())
+            level.dispense(disposal_vol)
+    else:
+        transfers = int(ceil(wash_vol/(tip_vol-10)))
+        transfer_vol = wash_vol/transfers
+
+        for col in cols:
+            for i in range(0, transfers):
+                take(transfer_vol)
+                pipette.air_gap(10)
+                pipette.dispense(transfer_vol + 10,
+                                 plate[col].top())
+
+            pipette.blow_out()
+
+    if drop_tip:
+        pipette.drop_tip()
+    else:
+        pipette.return_tip()
+
+    return(level.volume, source_wells)